@@ -52,6 +52,7 @@ INSTALLED_APPS = [
     'corsheaders',
     'user',
     'wallet',
+    'notifications',
 
 ]
 
@@ -224,6 +225,87 @@ SIMPLE_JWT = {
 PAYSTACK_PUBLIC_KEY=os.getenv("PAYSTACK_KEY")
 PAYSTACK_SECRET_KEY=os.getenv("PAYSTACK_SECRET_KEY")
 
+# Paystack client (see wallet/gateway.py). Set PAYSTACK_GATEWAY to
+# wallet.gateway.StubPaystack to run without the network.
+PAYSTACK_GATEWAY = os.getenv('PAYSTACK_GATEWAY', 'wallet.gateway.PaystackClient')
+PAYSTACK_BASE_URL = os.getenv('PAYSTACK_BASE_URL', 'https://api.paystack.co')
+PAYSTACK_CONNECT_TIMEOUT = float(os.getenv('PAYSTACK_CONNECT_TIMEOUT', '3.05'))
+PAYSTACK_READ_TIMEOUT = float(os.getenv('PAYSTACK_READ_TIMEOUT', '10'))
+PAYSTACK_MAX_RETRIES = int(os.getenv('PAYSTACK_MAX_RETRIES', '2'))
+PAYSTACK_POOL_SIZE = int(os.getenv('PAYSTACK_POOL_SIZE', '10'))
+# Concurrent gateway calls allowed per process; callers over the limit get a
+# 503 with Retry-After (after waiting PAYSTACK_BULKHEAD_WAIT seconds for a slot).
+PAYSTACK_MAX_CONCURRENCY = int(os.getenv('PAYSTACK_MAX_CONCURRENCY', '10'))
+PAYSTACK_BULKHEAD_WAIT = float(os.getenv('PAYSTACK_BULKHEAD_WAIT', '0'))
+# Consecutive failures that open the circuit breaker, and how long it stays open.
+PAYSTACK_BREAKER_FAILURES = int(os.getenv('PAYSTACK_BREAKER_FAILURES', '5'))
+PAYSTACK_BREAKER_RESET_SECONDS = float(os.getenv('PAYSTACK_BREAKER_RESET_SECONDS', '30'))
+
+# Account numbers (see wallet/accounts.py): the bank code the NUBAN check digit
+# is computed with, and how many serials each process reserves at a time.
+NUBAN_BANK_CODE = os.getenv('NUBAN_BANK_CODE', '999')
+ACCOUNT_NUMBER_BLOCK_SIZE = int(os.getenv('ACCOUNT_NUMBER_BLOCK_SIZE', '100'))
+
+# Key for the NIN/BVN hashes the profile unique indexes are built on (see
+# user.models.identity_hash); defaults to SECRET_KEY. Changing it means
+# re-hashing every profile.
+IDENTITY_HASH_KEY = os.getenv('IDENTITY_HASH_KEY')
+
+# Stored Paystack webhook events (see wallet/webhooks.py) whose credit fails
+# with an unexpected error are retried after GATEWAY_EVENT_RETRY_SECONDS,
+# doubling each time, and marked failed after GATEWAY_EVENT_MAX_ATTEMPTS.
+GATEWAY_EVENT_MAX_ATTEMPTS = int(os.getenv('GATEWAY_EVENT_MAX_ATTEMPTS', '5'))
+GATEWAY_EVENT_RETRY_SECONDS = int(os.getenv('GATEWAY_EVENT_RETRY_SECONDS', '30'))
+
+# How long (seconds) a stored Idempotency-Key response is replayed for.
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 60 * 60)))
+
+# Rows each hourly/daily transaction rollup bucket is spread over (see
+# wallet/rollups.py), so concurrent writers rarely wait on each other.
+TRANSACTION_ROLLUP_SHARDS = int(os.getenv('TRANSACTION_ROLLUP_SHARDS', '8'))
+
+# Rows each live platform counter (users, transactions, volume, funded
+# wallets; see wallet/counters.py) is spread over, for the same reason.
+PLATFORM_COUNTER_SHARDS = int(os.getenv('PLATFORM_COUNTER_SHARDS', '8'))
+
+# Admin PDF reports are rendered by `manage.py run_report_jobs` (see
+# wallet/reports.py). A job still running after REPORT_JOB_TIMEOUT seconds is
+# taken to have lost its worker and is picked up again, at most
+# REPORT_JOB_MAX_ATTEMPTS times; finished reports are deleted after
+# REPORT_RETENTION_DAYS.
+REPORT_JOB_TIMEOUT = int(os.getenv('REPORT_JOB_TIMEOUT', '600'))
+REPORT_JOB_MAX_ATTEMPTS = int(os.getenv('REPORT_JOB_MAX_ATTEMPTS', '3'))
+REPORT_RETENTION_DAYS = int(os.getenv('REPORT_RETENTION_DAYS', '7'))
+
+# How long (seconds) each process caches which wallets have sharded balances.
+BALANCE_SHARD_CACHE_SECONDS = int(os.getenv('BALANCE_SHARD_CACHE_SECONDS', '30'))
+
+# Committed wallet balances (see wallet/balance_cache.py). Local memory is per
+# process: use a shared backend (Redis, Memcached) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'balances': {
+        'BACKEND': os.getenv('BALANCE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('BALANCE_CACHE_LOCATION', 'wallet-balances'),
+        'TIMEOUT': int(os.getenv('BALANCE_CACHE_TIMEOUT', '300')),
+    },
+}
+
+# Outbox dispatch (see notifications/outbox.py). Each web process runs a
+# dispatcher thread unless OUTBOX_DISPATCH_IN_PROCESS is off, in which case
+# run `manage.py dispatch_outbox --loop` as a separate worker.
+OUTBOX_DISPATCH_IN_PROCESS = os.getenv('OUTBOX_DISPATCH_IN_PROCESS', 'True').lower() == 'true'
+OUTBOX_POLL_SECONDS = int(os.getenv('OUTBOX_POLL_SECONDS', '30'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('OUTBOX_RETRY_BASE_SECONDS', '30'))
+OUTBOX_RETRY_MAX_SECONDS = int(os.getenv('OUTBOX_RETRY_MAX_SECONDS', '3600'))
+# Open mail connections kept between batches, and how long an idle one may be
+# reused before it is closed (SMTP servers drop quiet clients).
+OUTBOX_SMTP_POOL_SIZE = int(os.getenv('OUTBOX_SMTP_POOL_SIZE', '2'))
+OUTBOX_SMTP_MAX_IDLE_SECONDS = int(os.getenv('OUTBOX_SMTP_MAX_IDLE_SECONDS', '60'))
+
 EMAIL_BACKEND = os.getenv(
     "EMAIL_BACKEND",
     "django.core.mail.backends.console.EmailBackend" if DEBUG else "django.core.mail.backends.smtp.EmailBackend"
@@ -301,5 +383,6 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
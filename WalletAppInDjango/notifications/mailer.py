@@ -0,0 +1,113 @@
+"""
+Mail delivery helpers for the outbox dispatcher.
+
+``ConnectionPool`` keeps a few open connections to the configured
+``EMAIL_BACKEND`` so a batch of messages costs one SMTP handshake (and TLS
+negotiation) rather than one per message. Connections idle for longer than
+``OUTBOX_SMTP_MAX_IDLE_SECONDS`` are closed instead of reused, since servers
+drop quiet clients; one that errors mid-send is discarded, not returned.
+
+``render`` renders email templates from a cache of compiled templates, so the
+alert bodies queued on every transfer don't re-read and re-parse their
+template files (Django only caches templates itself when ``DEBUG`` is off).
+"""
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ConnectionPool:
+    """A small LIFO pool of open mail backend connections."""
+
+    def __init__(self, size=None, max_idle=None):
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = []  # [(connection, returned_at)]
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        size = self.size if self.size is not None else _setting('OUTBOX_SMTP_POOL_SIZE', 2)
+        max_idle = self.max_idle if self.max_idle is not None else _setting('OUTBOX_SMTP_MAX_IDLE_SECONDS', 60)
+        return size, max_idle
+
+    def _checkout(self):
+        _, max_idle = self._limits()
+        stale = []
+        found = None
+        with self._lock:
+            while self._idle:
+                mail_connection, returned_at = self._idle.pop()
+                if time.monotonic() - returned_at <= max_idle:
+                    found = mail_connection
+                    break
+                stale.append(mail_connection)
+        for mail_connection in stale:
+            self._discard(mail_connection)
+        if found is not None:
+            return found
+        mail_connection = get_connection(fail_silently=False)
+        mail_connection.open()
+        return mail_connection
+
+    def _checkin(self, mail_connection):
+        size, _ = self._limits()
+        with self._lock:
+            if len(self._idle) < size:
+                self._idle.append((mail_connection, time.monotonic()))
+                return
+        self._discard(mail_connection)
+
+    def _discard(self, mail_connection):
+        try:
+            mail_connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing mail connection: {e}")
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out an open connection for the duration of the block. It goes
+        back to the pool afterwards, unless the block raised.
+        """
+        mail_connection = self._checkout()
+        try:
+            yield mail_connection
+        except BaseException:
+            self._discard(mail_connection)
+            raise
+        self._checkin(mail_connection)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for mail_connection, _ in idle:
+            self._discard(mail_connection)
+
+
+pool = ConnectionPool()
+
+
+@functools.lru_cache(maxsize=64)
+def _compiled(template_name):
+    return get_template(template_name)
+
+
+def render(template_name, context=None):
+    """Like ``render_to_string``, but the compiled template is reused."""
+    return _compiled(template_name).render(context)
+
+
+def clear_template_cache():
+    _compiled.cache_clear()
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications import mailer, outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued notification emails from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for due messages')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages claimed per batch')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                sent, failed = outbox.drain(options['batch_size'])
+                if sent or failed or not options['loop']:
+                    self.stdout.write(self.style.SUCCESS(f'Sent {sent} message(s); {failed} failed and will be retried.'))
+                if not options['loop']:
+                    return
+                time.sleep(options['interval'])
+        finally:
+            mailer.pool.close()
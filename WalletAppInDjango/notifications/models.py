@@ -0,0 +1,47 @@
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    """
+    An email waiting to be delivered.
+
+    Rows are written in the same database transaction as the change they
+    announce, so a message exists if and only if that change committed. The
+    dispatcher (``notifications.outbox``) sends them afterwards, retrying
+    failures with exponential backoff.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    from_email = models.CharField(max_length=254, blank=True, default='')
+    # Comma-separated addresses.
+    recipients = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set by the dispatcher that currently holds the message.
+    lease_token = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def recipient_list(self):
+        return [address for address in self.recipients.split(',') if address]
+
+    def __str__(self):
+        return f'{self.subject} -> {self.recipients} ({self.status})'
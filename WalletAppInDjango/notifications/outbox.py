@@ -0,0 +1,206 @@
+"""
+Transactional outbox for notification emails.
+
+``enqueue`` inserts ``OutboxMessage`` rows in the caller's database
+transaction and, once that transaction commits, wakes a background dispatcher
+thread. Request handlers never wait on SMTP, and a mail failure can no longer
+undo the change it announces.
+
+The dispatcher claims due rows with a lease: one conditional ``UPDATE`` bumps
+``attempts`` and pushes ``next_attempt_at`` past the lease, so several
+dispatchers (each web process plus ``manage.py dispatch_outbox``) never pick
+up the same message at once, and a message claimed by a process that died is
+retried when its lease runs out. Failed sends are retried with exponential
+backoff and jitter, up to ``OUTBOX_MAX_ATTEMPTS`` attempts. Each batch goes
+out over one pooled mail connection (see ``notifications.mailer``).
+"""
+import logging
+import os
+import random
+import threading
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import mailer
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _build(subject, body, from_email, recipient_list, html_body=''):
+    return OutboxMessage(
+        subject=subject[:255],
+        body=body,
+        html_body=html_body or '',
+        from_email=from_email or '',
+        recipients=','.join(recipient_list),
+    )
+
+
+def enqueue(subject, body, recipient_list, from_email=None, html_body=''):
+    """Queue one email in the current transaction; it is sent after commit."""
+    message = _build(subject, body, from_email, recipient_list, html_body)
+    message.save()
+    transaction.on_commit(wake)
+    return message
+
+
+def enqueue_many(datatuple):
+    """
+    Queue several emails with one insert.
+
+    ``datatuple`` holds ``(subject, body, from_email, recipient_list)`` tuples,
+    as for ``django.core.mail.send_mass_mail``.
+    """
+    messages = [_build(*data) for data in datatuple]
+    if messages:
+        OutboxMessage.objects.bulk_create(messages, batch_size=500)
+        transaction.on_commit(wake)
+    return messages
+
+
+def backoff(attempts):
+    """Delay before retrying a message that has failed ``attempts`` times."""
+    base = _setting('OUTBOX_RETRY_BASE_SECONDS', 30)
+    cap = _setting('OUTBOX_RETRY_MAX_SECONDS', 3600)
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    # Equal jitter: spread retries out without ever retrying immediately.
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def claim_due(limit=100):
+    """Lease up to ``limit`` due messages to this dispatcher and return them."""
+    now = timezone.now()
+    due = list(
+        OutboxMessage.objects.filter(status=OutboxMessage.PENDING, next_attempt_at__lte=now)
+        .order_by('next_attempt_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    if not due:
+        return []
+    lease_until = now + timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 300))
+    token = uuid4().hex
+    OutboxMessage.objects.filter(
+        pk__in=due, status=OutboxMessage.PENDING, next_attempt_at__lte=now
+    ).update(attempts=F('attempts') + 1, next_attempt_at=lease_until, lease_token=token)
+    return list(OutboxMessage.objects.filter(pk__in=due, lease_token=token).order_by('pk'))
+
+
+def send(message, mail_connection=None):
+    email = EmailMultiAlternatives(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email or None,
+        to=message.recipient_list(),
+        connection=mail_connection,
+    )
+    if message.html_body:
+        email.attach_alternative(message.html_body, 'text/html')
+    email.send()
+
+
+def mark_sent(messages):
+    OutboxMessage.objects.filter(pk__in=[message.pk for message in messages]).update(
+        status=OutboxMessage.SENT, sent_at=timezone.now(), last_error=''
+    )
+
+
+def mark_failed(message, error):
+    """Schedule a retry, or give up once ``OUTBOX_MAX_ATTEMPTS`` is reached."""
+    if message.attempts >= _setting('OUTBOX_MAX_ATTEMPTS', 8):
+        OutboxMessage.objects.filter(pk=message.pk).update(status=OutboxMessage.FAILED, last_error=str(error))
+        logger.error(f"Giving up on outbox message {message.pk} after {message.attempts} attempts: {error}")
+        return
+    OutboxMessage.objects.filter(pk=message.pk).update(
+        next_attempt_at=timezone.now() + backoff(message.attempts), last_error=str(error)
+    )
+    logger.warning(f"Outbox message {message.pk} failed (attempt {message.attempts}), will retry: {error}")
+
+
+def dispatch_due(limit=100):
+    """
+    Send one batch of due messages over a pooled mail connection. Returns
+    ``(sent, failed)`` counts.
+
+    A message that fails is rescheduled on its own; the connection it failed
+    on is dropped and the rest of the batch carries on over a fresh one. If no
+    connection can be opened at all, the whole remaining batch is rescheduled.
+    """
+    pending = claim_due(limit)
+    sent = []
+    failed = 0
+    while pending:
+        opened = False
+        try:
+            with mailer.pool.connection() as mail_connection:
+                opened = True
+                while pending:
+                    send(pending[0], mail_connection)
+                    sent.append(pending.pop(0))
+        except Exception as e:
+            failing, pending = (pending[:1], pending[1:]) if opened else (pending, [])
+            for message in failing:
+                mark_failed(message, e)
+            failed += len(failing)
+    if sent:
+        mark_sent(sent)
+    return len(sent), failed
+
+
+def drain(limit=100):
+    """Dispatch batches until nothing is due. Returns ``(sent, failed)`` totals."""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = dispatch_due(limit)
+        total_sent += sent
+        total_failed += failed
+        if not sent and not failed:
+            return total_sent, total_failed
+
+
+class Dispatcher(threading.Thread):
+    """Daemon thread draining the outbox when woken, and on a timer for retries."""
+
+    def __init__(self):
+        super().__init__(name='outbox-dispatcher', daemon=True)
+        self.wakeup = threading.Event()
+        self.pid = os.getpid()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(timeout=_setting('OUTBOX_POLL_SECONDS', 30))
+            self.wakeup.clear()
+            try:
+                drain()
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+            finally:
+                connection.close()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def wake():
+    """Ask this process's dispatcher thread to send what is due, starting it if needed."""
+    global _dispatcher
+    if not _setting('OUTBOX_DISPATCH_IN_PROCESS', True):
+        return
+    # A forked child inherits the parent's Dispatcher object but not its thread.
+    if _dispatcher is None or _dispatcher.pid != os.getpid():
+        with _dispatcher_lock:
+            if _dispatcher is None or _dispatcher.pid != os.getpid():
+                _dispatcher = Dispatcher()
+                _dispatcher.start()
+    _dispatcher.wakeup.set()
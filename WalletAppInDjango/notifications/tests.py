@@ -0,0 +1,147 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core import mail
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from wallet.models import Wallet
+from wallet.tests import make_user
+
+from . import mailer, outbox
+from .models import OutboxMessage
+
+
+class OutboxTests(TestCase):
+    def test_messages_roll_back_with_their_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                outbox.enqueue('Hello', 'body', ['a@example.com'])
+                raise RuntimeError
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_dispatch_sends_due_messages_once(self):
+        outbox.enqueue('Hello', 'body', ['a@example.com'], html_body='<p>body</p>')
+        outbox.enqueue_many([('Hi', 'other', None, ['b@example.com', 'c@example.com'])])
+
+        self.assertEqual(outbox.drain(), (2, 0))
+        self.assertEqual(outbox.drain(), (0, 0))
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].to, ['b@example.com', 'c@example.com'])
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.SENT).count(), 2)
+
+    def test_claimed_messages_are_not_claimed_again(self):
+        outbox.enqueue('Hello', 'body', ['a@example.com'])
+
+        self.assertEqual(len(outbox.claim_due()), 1)
+        self.assertEqual(outbox.claim_due(), [])
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_give_up(self):
+        message = outbox.enqueue('Hello', 'body', ['a@example.com'])
+
+        with mock.patch.object(outbox, 'send', side_effect=OSError('SMTP down')):
+            self.assertEqual(outbox.dispatch_due(), (0, 1))
+            message.refresh_from_db()
+            self.assertEqual(message.status, OutboxMessage.PENDING)
+            self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=10))
+            self.assertEqual(message.last_error, 'SMTP down')
+
+            OutboxMessage.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox.dispatch_due(), (0, 1))
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.FAILED)
+        self.assertEqual(message.attempts, 2)
+
+
+class MailerTests(TestCase):
+    def setUp(self):
+        mailer.pool.close()
+        self.addCleanup(mailer.pool.close)
+
+    def test_batch_shares_one_connection(self):
+        for n in range(3):
+            outbox.enqueue('Hello', 'body', [f'user{n}@example.com'])
+
+        with mock.patch.object(mailer, 'get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(outbox.drain(), (3, 0))
+            outbox.enqueue('Again', 'body', ['a@example.com'])
+            self.assertEqual(outbox.drain(), (1, 0))
+
+        # The second batch reuses the pooled connection.
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_failed_message_does_not_sink_the_batch(self):
+        for address in ['a@example.com', 'bad@example.com', 'c@example.com']:
+            outbox.enqueue('Hello', 'body', [address])
+        real_send = outbox.send
+
+        def send(message, mail_connection=None):
+            if message.recipients == 'bad@example.com':
+                raise OSError('mailbox unavailable')
+            real_send(message, mail_connection)
+
+        with mock.patch.object(outbox, 'send', side_effect=send):
+            self.assertEqual(outbox.dispatch_due(), (2, 1))
+
+        self.assertEqual(OutboxMessage.objects.get(status=OutboxMessage.PENDING).recipients, 'bad@example.com')
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a@example.com', 'c@example.com'])
+
+    def test_stale_connections_are_replaced(self):
+        pool = mailer.ConnectionPool(size=1, max_idle=0)
+        with pool.connection() as first:
+            pass
+        with mock.patch.object(mailer.time, 'monotonic', return_value=mailer.time.monotonic() + 1):
+            with pool.connection() as second:
+                pass
+        self.assertIsNot(first, second)
+
+    def test_compiled_templates_are_reused(self):
+        mailer.clear_template_cache()
+        with mock.patch.object(mailer, 'get_template', wraps=mailer.get_template) as get_template:
+            first = mailer.render('email/alerts/deposit.txt', {'amount': '10.00', 'reference': 'ref_1'})
+            mailer.render('email/alerts/deposit.txt', {'amount': '20.00', 'reference': 'ref_2'})
+
+        get_template.assert_called_once()
+        self.assertIn('₦10.00', first)
+        self.assertIn('ref_1', first)
+
+
+class OutboxEndpointTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1, Decimal('5000.00'))
+        self.bob = make_user(2)
+        self.client = APIClient()
+
+    def test_transfer_queues_alerts_instead_of_sending(self):
+        self.client.force_authenticate(self.alice)
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('SMTP down')) as send:
+            response = self.client.post('/wallet/fund/transfer', {
+                'account_number': self.bob.wallet.account_number,
+                'amount': 1000,
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        send.assert_not_called()
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, Decimal('1000.00'))
+        self.assertEqual(
+            sorted(OutboxMessage.objects.values_list('recipients', flat=True)),
+            ['user1@example.com', 'user2@example.com'],
+        )
+        received = OutboxMessage.objects.get(recipients='user2@example.com')
+        self.assertIn('You have received ₦1000 from user1', received.body)
+
+    def test_password_reset_is_queued(self):
+        response = self.client.post('/user/password-reset/', {'email': 'user2@example.com'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.recipients, 'user2@example.com')
+        self.assertIn('reset', message.html_body.lower())
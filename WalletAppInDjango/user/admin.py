@@ -1,6 +1,7 @@
 from django.contrib import admin
 from .models import Profile, User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from .provisioning import provision
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -26,7 +27,10 @@ class UserAdmin(BaseUserAdmin):
     def save_model(self, request, obj, form, change):
         if not request.user.is_superuser and change:
             old_obj = type(obj).objects.get(pk=obj.pk)
-        super().save_model(request, obj, form, change)
+        if change:
+            super().save_model(request, obj, form, change)
+        else:
+            provision(obj)
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
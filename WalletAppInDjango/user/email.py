@@ -1,9 +1,9 @@
 from djoser.email import PasswordResetEmail
-from django.template.loader import render_to_string
-from django.core.mail import send_mail
 from django.conf import settings
 import logging
 
+from notifications import mailer, outbox
+
 logger = logging.getLogger(__name__)
 
 class CustomPasswordResetEmail(PasswordResetEmail):
@@ -24,23 +24,22 @@ class CustomPasswordResetEmail(PasswordResetEmail):
             context = self.get_context_data()
             
             # Render HTML email
-            html_message = render_to_string(self.template_name, context)
+            html_message = mailer.render(self.template_name, context)
             
             # Render plain text email
-            text_message = render_to_string('djoser/email/password_reset_email.txt', context)
+            text_message = mailer.render('djoser/email/password_reset_email.txt', context)
             
-            # Send email
-            send_mail(
-                subject=self.subject,
-                message=text_message,
+            # Queue it; the outbox dispatcher sends it with retries.
+            outbox.enqueue(
+                self.subject,
+                text_message,
+                to,
                 from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=to,
-                html_message=html_message,
-                fail_silently=False,
+                html_body=html_message,
             )
             
-            logger.info(f"Custom password reset email sent successfully to {to}")
+            logger.info(f"Custom password reset email queued for {to}")
             
         except Exception as e:
-            logger.error(f"Error sending custom password reset email to {to}: {str(e)}")
+            logger.error(f"Error queueing custom password reset email to {to}: {str(e)}")
             raise 
\ No newline at end of file
@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from user.importer import ImportFileError, import_csv
+
+
+class Command(BaseCommand):
+    help = (
+        'Import users from a CSV file (email, phone, first_name, last_name, username, password) '
+        'with their wallets and profiles, in bulk and resumably'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows validated and inserted per transaction (default: 1000)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes hashing passwords; 0 hashes in this process (default: one per CPU)')
+        parser.add_argument('--checkpoint', help='Progress file (default: PATH.checkpoint)')
+        parser.add_argument('--resume', action='store_true', help='Skip the rows the checkpoint says are done')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 0:
+            raise CommandError('--chunk-size must be at least 1 and --workers at least 0')
+        path = options['path']
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+
+        pool = nullcontext()
+        if options['workers']:
+            try:
+                context = multiprocessing.get_context('fork')
+            except ValueError:
+                raise CommandError('--workers needs the fork start method; use --workers 0')
+            # Never hand a database connection to the forked workers.
+            connections.close_all()
+            pool = ProcessPoolExecutor(options['workers'], mp_context=context)
+
+        def progress(result):
+            self.stdout.write(
+                f'{result.skipped + result.rows} rows: {result.created} created, {result.rejected} rejected, '
+                f'{result.rate:,.0f} rows/s'
+            )
+
+        try:
+            with pool as executor:
+                result = import_csv(
+                    path,
+                    chunk_size=options['chunk_size'],
+                    pool=executor,
+                    checkpoint=checkpoint,
+                    resume=options['resume'],
+                    on_chunk=progress,
+                )
+        except (ImportFileError, OSError) as e:
+            raise CommandError(str(e))
+
+        for sample in result.reject_samples:
+            self.stderr.write(f'  {sample}')
+        if result.skipped:
+            self.stdout.write(f'Skipped {result.skipped} row(s) already imported according to {checkpoint}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} user(s) from {result.rows} row(s) in {result.elapsed:.1f}s '
+            f'({result.rate:,.0f} rows/s); {result.rejected} rejected'
+        ))
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:19
+
+from django.db import migrations, models
+
+# Largest value last_suffix (a PositiveIntegerField) holds on every backend.
+MAX_SUFFIX = 2147483647
+
+
+def seed_counters(apps, schema_editor):
+    """
+    Start each base's counter past the usernames already taken, so generated
+    names don't have to step through them one IntegrityError at a time.
+    "john7" marks suffix 7 of "john" as used, "john" itself suffix 0. A
+    trailing number is ambiguous ("user12" may be "user1" + 2 or "user" +
+    12), so every split is counted; that only ever skips numbers. Splits
+    whose suffix would not fit the column (all-digit names such as phone
+    numbers) are left out: generated suffixes never get that high.
+    """
+    User = apps.get_model('user', 'User')
+    UsernameCounter = apps.get_model('user', 'UsernameCounter')
+    counters = {}
+    for username in User.objects.values_list('username', flat=True).iterator():
+        # Email fallbacks are never generated from a first name.
+        if not username or '@' in username:
+            continue
+        counters[username] = max(counters.get(username, 0), 0)
+        digits_from = len(username.rstrip('0123456789'))
+        for i in range(max(digits_from, 1), len(username)):
+            if username[i] != '0':
+                base, suffix = username[:i], int(username[i:])
+                if suffix <= MAX_SUFFIX:
+                    counters[base] = max(counters.get(base, 0), suffix)
+    UsernameCounter.objects.bulk_create(
+        [UsernameCounter(base=base[:150], last_suffix=suffix) for base, suffix in counters.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_remove_profile_nin_bvn_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsernameCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=150, unique=True)),
+                ('last_suffix', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
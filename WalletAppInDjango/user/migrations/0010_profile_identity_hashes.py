@@ -0,0 +1,77 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:40
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.crypto import salted_hmac
+
+logger = logging.getLogger(__name__)
+
+
+def identity_hash(value):
+    """``user.models.identity_hash`` as of this migration, frozen so replays store the same hashes."""
+    if not value:
+        return None
+    key = getattr(settings, 'IDENTITY_HASH_KEY', None) or settings.SECRET_KEY
+    return salted_hmac('user.Profile.identity', value, secret=key, algorithm='sha256').hexdigest()
+
+
+def hash_identities(apps, schema_editor):
+    """
+    Fill in the hashes for existing profiles. Duplicates that slipped in
+    while the checks were query-based keep their raw value, but only the
+    oldest profile gets the hash, so the unique indexes can be built; the
+    rest are logged as warnings, with the profile they clash with, to be
+    sorted out by hand.
+    """
+    Profile = apps.get_model('user', 'Profile')
+    # hash -> the profile that keeps it
+    seen = {'nin_hash': {}, 'bvn_hash': {}}
+    duplicates = []
+    changed = []
+    profiles = Profile.objects.exclude(nin__isnull=True, bvn__isnull=True).order_by('pk').only('pk', 'nin', 'bvn')
+    for profile in profiles.iterator():
+        for field, value in (('nin_hash', profile.nin), ('bvn_hash', profile.bvn)):
+            hashed = identity_hash(value)
+            if hashed in seen[field]:
+                duplicates.append(f'profile {profile.pk} ({field[:3]}, same as profile {seen[field][hashed]})')
+                hashed = None
+            elif hashed:
+                seen[field][hashed] = profile.pk
+            setattr(profile, field, hashed)
+        changed.append(profile)
+    Profile.objects.bulk_update(changed, ['nin_hash', 'bvn_hash'], batch_size=1000)
+    if duplicates:
+        logger.warning(
+            f"{len(duplicates)} duplicate NIN/BVN value(s) left unindexed, resolve by hand: {', '.join(duplicates)}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0009_usernamecounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='bvn_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='nin_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(hash_identities, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='profile',
+            constraint=models.UniqueConstraint(condition=models.Q(('nin_hash__isnull', False)), fields=('nin_hash',), name='user_profile_nin_hash_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='profile',
+            constraint=models.UniqueConstraint(condition=models.Q(('bvn_hash__isnull', False)), fields=('bvn_hash',), name='user_profile_bvn_hash_unique'),
+        ),
+    ]
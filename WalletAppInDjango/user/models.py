@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.validators import FileExtensionValidator
+from django.utils.crypto import salted_hmac
 
-from django.db import models
+from django.db import models, transaction
 
 
 class CustomUserManager(BaseUserManager):
@@ -10,21 +12,12 @@ class CustomUserManager(BaseUserManager):
             raise ValueError('The Email field must be set')
         email = self.normalize_email(email)
         
-        # Generate username from first_name if not provided
-        username = extra_fields.get('username')
-        if not username and extra_fields.get('first_name'):
-            base_username = extra_fields.get('first_name').lower().replace(' ', '')
-            username = base_username
-            counter = 1
-            while self.model.objects.filter(username=username).exists():
-                username = f"{base_username}{counter}"
-                counter += 1
-            extra_fields['username'] = username
-        
+        # Without a username, User.save generates one from first_name.
         user = self.model(email=email, **extra_fields)
         user.set_password(password)
-        user.save(using=self._db)
-        return user
+        # The profile and wallet are created with the user (see user/provisioning.py).
+        from .provisioning import provision
+        return provision(user, using=self._db)
 
     def create_superuser(self, email, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', True)
@@ -63,19 +56,53 @@ class User(AbstractUser):
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
-    
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Newest signups first, for the admin dashboard and user list.
+            models.Index(fields=['-date_joined'], name='user_date_joined_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # The stored is_active, so save() can tell when it flips.
+        if 'is_active' in user.__dict__:
+            user._stored_is_active = user.is_active
+        return user
+
+    def _activation(self, update_fields):
+        """``(was_active, is_active)`` if saving changes a stored user's ``is_active``, else ``None``."""
+        if self._state.adding or '_stored_is_active' not in self.__dict__ or 'is_active' not in self.__dict__:
+            return None
+        if update_fields is not None and 'is_active' not in update_fields:
+            return None
+        is_active = self._meta.get_field('is_active').to_python(self.is_active)
+        if is_active == self._stored_is_active:
+            return None
+        return self._stored_is_active, is_active
+
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        activation = self._activation(update_fields)
+        if activation is None:
+            self._save(*args, **kwargs)
+        else:
+            # Counted on the platform counters along with the save (see wallet/counters.py).
+            from wallet import counters
+            with transaction.atomic(using=kwargs.get('using')):
+                self._save(*args, **kwargs)
+                counters.record_activation(*activation)
+        if 'is_active' in self.__dict__ and (update_fields is None or 'is_active' in update_fields):
+            self._stored_is_active = self._meta.get_field('is_active').to_python(self.is_active)
+
+    def _save(self, *args, **kwargs):
         # Ensure username is set to first_name if not provided, fallback to email
         if not self.username:
             if self.first_name:
-                # Use first_name as username, make it unique if needed
-                base_username = self.first_name.lower().replace(' ', '')
-                username = base_username
-                counter = 1
-                while User.objects.filter(username=username).exclude(pk=self.pk).exists():
-                    username = f"{base_username}{counter}"
-                    counter += 1
-                self.username = username
+                # first_name, then first_name1, first_name2, ... (see user/usernames.py)
+                from .usernames import save_with_generated_username
+                return save_with_generated_username(self, super().save, *args, **kwargs)
             elif self.email:
                 self.username = self.email
         super().save(*args, **kwargs)
@@ -86,22 +113,69 @@ class User(AbstractUser):
         return self.account_status == 'active' and self.is_active
 
 
+class UsernameCounter(models.Model):
+    """
+    Highest numeric suffix handed out for a generated username base, so the
+    next free "john<n>" is found with one UPDATE instead of probing
+    john1, john2, ... in turn.
+    """
+    base = models.CharField(max_length=150, unique=True)
+    last_suffix = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.base}: {self.last_suffix}'
+
+
+# Messages for a NIN or BVN already on another profile.
+IDENTITY_IN_USE = {
+    'nin': 'This NIN is already registered with another account.',
+    'bvn': 'This BVN is already registered with another account.',
+}
+
+
+def identity_hash(value):
+    """
+    Keyed hash of a NIN or BVN. The unique indexes are on these, so the raw
+    identifiers never become index keys.
+    """
+    if not value:
+        return None
+    key = getattr(settings, 'IDENTITY_HASH_KEY', None) or settings.SECRET_KEY
+    return salted_hmac('user.Profile.identity', value, secret=key, algorithm='sha256').hexdigest()
+
+
+def identity_in_use(error):
+    """The identity field ('nin' or 'bvn') an IntegrityError from saving a Profile clashed on, if any."""
+    message = str(error)
+    return next((name for name in IDENTITY_IN_USE if f'{name}_hash' in message), None)
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     image = models.ImageField(upload_to="user/profile/image", null=True, blank=True, validators=[FileExtensionValidator(["jpg", "jpeg", "png"])])
     address = models.TextField(null=True, blank=True)
     nin = models.CharField(max_length=11, null=True, blank=True)
     bvn = models.CharField(max_length=11, null=True, blank=True)
+    # Kept in step with nin and bvn by save(); see identity_hash.
+    nin_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    bvn_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        # One NIN and one BVN per account; empty ones don't count. A clash
+        # is an IntegrityError naming the column (see identity_in_use).
+        constraints = [
+            models.UniqueConstraint(fields=['nin_hash'], condition=models.Q(nin_hash__isnull=False),
+                                    name='user_profile_nin_hash_unique'),
+            models.UniqueConstraint(fields=['bvn_hash'], condition=models.Q(bvn_hash__isnull=False),
+                                    name='user_profile_bvn_hash_unique'),
+        ]
 
     def save(self, *args, **kwargs):
-        if self.nin:
-            existing_nin = Profile.objects.filter(nin=self.nin).exclude(pk=self.pk)
-            if existing_nin.exists():
-                raise ValidationError({'nin': 'This NIN is already registered with another account.'})
-        if self.bvn:
-            existing_bvn = Profile.objects.filter(bvn=self.bvn).exclude(pk=self.pk)
-            if existing_bvn.exists():
-                raise ValidationError({'bvn': 'This BVN is already registered with another account.'})
+        self.nin_hash = identity_hash(self.nin)
+        self.bvn_hash = identity_hash(self.bvn)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *(f'{name}_hash' for name in IDENTITY_IN_USE if name in update_fields)}
         super().save(*args, **kwargs)
 
 
@@ -0,0 +1,31 @@
+"""
+Account provisioning.
+
+An account is three rows: the user, their profile and their wallet.
+``provision`` creates the profile and wallet together with the user, in one
+transaction, so a signup either gets all three or none. Everything that
+creates users goes through it: ``User.objects.create_user`` (signups,
+``create_superuser`` and the management commands) and the admin's add form.
+Bulk imports do the same work in bulk (see user/importer.py). Both count the
+new users on the platform counters (see wallet/counters.py).
+
+This used to be done by ``post_save`` handlers, which also ran on every later
+save of the user: a password change re-saved the profile, with its NIN/BVN
+checks, and looked the wallet up again. Saving a user now touches nothing
+but the user row.
+"""
+from django.db import transaction
+
+from wallet import accounts, counters
+
+from .models import Profile
+
+
+def provision(user, using=None):
+    """Save the new ``user`` and create their profile and wallet."""
+    with transaction.atomic(using=using):
+        user.save(using=using)
+        Profile.objects.using(using).create(user=user)
+        accounts.create_wallet(user)
+        counters.record_users([user])
+    return user
@@ -1,14 +1,18 @@
+import logging
 
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
+from django.urls import reverse
 from rest_framework import serializers
 
-from wallet.models import Wallet
+from wallet import balance_cache
+from wallet.models import ReportJob
 from .models import Profile, AdminSettings
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     
@@ -17,8 +21,6 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         fields = ('id', 'email', 'username', 'password', 'first_name', 'last_name', 'phone')
     
     def validate(self, attrs):
-        print(f"Validating attrs: {attrs}")
-        
         # Let Djoser handle password confirmation validation
         # We'll add our custom validations after Djoser's validation
         
@@ -40,44 +42,24 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         if not phone.startswith('0') or len(phone) != 11 or not phone.isdigit():
             raise serializers.ValidationError("Phone number must be 11 digits starting with 0.")
         
-        print(f"Validation passed for: {attrs['email']}")
         return attrs
     
     def create(self, validated_data):
-        print(f"Creating user with data: {validated_data}")
-        
         try:
-            # Generate username from first_name if not provided
-            username = validated_data.get('username')
-            if not username and validated_data.get('first_name'):
-                base_username = validated_data.get('first_name').lower().replace(' ', '')
-                username = base_username
-                counter = 1
-                while User.objects.filter(username=username).exists():
-                    username = f"{base_username}{counter}"
-                    counter += 1
-            
-            print(f"Generated username: {username}")
-            
-            # Create user with all fields explicitly
+            # Without a username, User.save generates one from first_name,
+            # falling back to the email. The wallet and profile are created
+            # in the same transaction.
             user = User.objects.create_user(
                 email=validated_data.get('email'),
                 password=validated_data.get('password'),
-                username=username or validated_data.get('email'),  # Fallback to email if no username
+                username=validated_data.get('username', ''),
                 first_name=validated_data.get('first_name', ''),
                 last_name=validated_data.get('last_name', ''),
                 phone=validated_data.get('phone', ''),
             )
-            
-            print(f"User created with ID: {user.id}")
-            print(f"User saved successfully: {user.email}")
-            print(f"Wallet creation signal should trigger now...")
             return user
         except Exception as e:
-            # Log the error for debugging
-            print(f"Error creating user: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error creating user {validated_data.get('email')}")
             raise serializers.ValidationError(f"Unable to create account: {str(e)}")
 
 class CustomUserSerializer(UserSerializer):
@@ -134,6 +116,8 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 
 class ProfileSerializer(serializers.ModelSerializer):
+    # Uniqueness is left to the unique indexes on the NIN/BVN hashes; the
+    # views turn a clash into a field error (see user.models.identity_in_use).
     bvn = serializers.CharField(max_length=11, min_length=11, required=False, allow_blank=True)
     nin = serializers.CharField(max_length=11, min_length=11, required=False, allow_blank=True)
     
@@ -141,26 +125,10 @@ class ProfileSerializer(serializers.ModelSerializer):
         model = Profile
         fields = ['image', 'address', 'bvn', 'nin']
         read_only_fields = ['user']
-    
-    def validate_bvn(self, value):
-        if not value:  # Allow empty BVN
-            return value
-        # Check if BVN is already used by another user
-        if Profile.objects.filter(bvn=value).exclude(user=self.context['request'].user).exists():
-            raise serializers.ValidationError('This BVN is already registered with another account.')
-        return value
-    
-    def validate_nin(self, value):
-        if not value:  # Allow empty NIN
-            return value
-        # Check if NIN is already used by another user
-        if Profile.objects.filter(nin=value).exclude(user=self.context['request'].user).exists():
-            raise serializers.ValidationError('This NIN is already registered with another account.')
-        return value
 
 
 class WalletSerializer(serializers.Serializer):
-    balance = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    balance = serializers.DecimalField(max_digits=20, decimal_places=2, read_only=True)
     account_number = serializers.CharField(max_length=10, read_only=True)
 
 
@@ -212,7 +180,7 @@ class AdminUserSerializer(serializers.ModelSerializer):
     
     def get_wallet_balance(self, obj):
         try:
-            return float(obj.wallet.balance) if obj.wallet else 0
+            return float(balance_cache.get_balance(obj.wallet)) if obj.wallet else 0
         except:
             return 0
     
@@ -242,3 +210,22 @@ class AdminSettingsSerializer(serializers.ModelSerializer):
             'system_status', 'uptime', 'updated_at'
         ]
         read_only_fields = ['currency', 'timezone', 'platform_version', 'database', 'system_status', 'uptime', 'updated_at']
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'report_type', 'date_range', 'status', 'error', 'filename', 'created_at', 'finished_at',
+            'download_url',
+        ]
+        read_only_fields = ['status', 'error', 'filename', 'created_at', 'finished_at']
+
+    def get_download_url(self, obj):
+        if obj.status != ReportJob.DONE:
+            return None
+        url = reverse('admin-report-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
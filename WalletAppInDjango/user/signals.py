@@ -1,23 +1,10 @@
-from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth.signals import user_logged_in, user_login_failed
 from django.contrib.auth import get_user_model
-from .models import Profile, LoginHistory
+from .models import LoginHistory
 
 User = get_user_model()
 
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    try:
-        instance.profile.save()
-    except Profile.DoesNotExist:
-        Profile.objects.create(user=instance)
-
 @receiver(user_logged_in)
 def log_successful_login(sender, request, user, **kwargs):
     """Log successful login attempts"""
@@ -1,3 +1,292 @@
-from django.test import TestCase
+import csv
+import importlib
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.test.utils import CaptureQueriesContext
+
+from wallet import accounts
+from wallet.accounts import is_valid_nuban
+from wallet.models import Wallet
+
+from . import importer
+from .importer import ImportResult, import_chunk
+from .models import Profile, User, UsernameCounter, identity_hash
+from .usernames import next_username
+
+
+def make_user(index, first_name='John', **extra):
+    return User.objects.create_user(
+        email=f'person{index}@example.com',
+        password='pass12345',
+        first_name=first_name,
+        phone=f'070{index:08d}',
+        **extra,
+    )
+
+
+class UsernameTests(TestCase):
+    def test_usernames_follow_first_name_with_suffixes(self):
+        usernames = [make_user(i).username for i in range(4)]
+
+        self.assertEqual(usernames, ['john', 'john1', 'john2', 'john3'])
+
+    def test_query_count_does_not_grow_with_namesakes(self):
+        make_user(0)
+        with self.assertNumQueries(2):
+            next_username('john')
+        for i in range(1, 30):
+            make_user(i)
+        with self.assertNumQueries(2):
+            next_username('john')
+
+    def test_taken_candidates_are_skipped(self):
+        make_user(0, first_name='Ada')
+        make_user(1, first_name='Zed', username='ada1')
+
+        self.assertEqual(make_user(2, first_name='Ada').username, 'ada2')
+
+    def test_other_clashes_are_not_retried(self):
+        make_user(0)
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(email='person0@example.com', password='x', first_name='John', phone='07099999999')
+
+        # The failed signup's counter bump was rolled back with it.
+        self.assertEqual(UsernameCounter.objects.get(base='john').last_suffix, 0)
+
+    def test_explicit_username_and_email_fallback(self):
+        self.assertEqual(make_user(0, username='custom').username, 'custom')
+        self.assertEqual(make_user(1, first_name='').username, 'person1@example.com')
+
+    def test_counter_seeding_skips_suffixes_too_large_to_store(self):
+        from django.apps import apps
+
+        migration = importlib.import_module('user.migrations.0009_usernamecounter')
+        make_user(0, username='08012345678')
+        make_user(1, username='ada12345678901')
+        make_user(2, username='ada7')
+        UsernameCounter.objects.all().delete()
+
+        migration.seed_counters(apps, None)
+
+        counters = dict(UsernameCounter.objects.values_list('base', 'last_suffix'))
+        self.assertEqual(counters['ada'], 7)
+        self.assertEqual(counters['080'], 12345678)
+        self.assertNotIn('0', counters)
+        self.assertLessEqual(max(counters.values()), migration.MAX_SUFFIX)
+
+
+@override_settings(PLATFORM_COUNTER_SHARDS=1)
+class ProvisioningTests(TestCase):
+    def test_signup_creates_profile_and_wallet_in_one_transaction(self):
+        make_user(0)
+        # Username counter, user, profile, wallet and platform counters, the
+        # user and wallet inserts each under a savepoint; the outer one is
+        # TestCase's.
+        with self.assertNumQueries(12):
+            user = make_user(1)
+
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+        self.assertEqual(Wallet.objects.get(user=user).account_number, '7000000001')
+
+    def test_failed_wallet_creation_rolls_back_the_signup(self):
+        with mock.patch.object(accounts, 'create_wallet', side_effect=accounts.AccountNumbersExhausted('none left')):
+            with self.assertRaises(accounts.AccountNumbersExhausted):
+                make_user(0)
+
+        self.assertFalse(User.objects.filter(email='person0@example.com').exists())
+        self.assertFalse(Profile.objects.exists())
+
+    def test_saving_a_user_leaves_profile_and_wallet_alone(self):
+        make_user(0)
+        user = User.objects.get(email='person0@example.com')
+        user.last_name = 'Doe'
+        with self.assertNumQueries(1):
+            user.save()
+
+    def test_password_change_is_one_update(self):
+        user = make_user(0)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with self.assertNumQueries(1):
+            response = client.put(reverse('change-password'), {'current_password': 'pass12345', 'new_password': 'n3w-pass!'})
+
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('n3w-pass!'))
+
+
+class ProfileIdentityTests(TestCase):
+    def setUp(self):
+        self.user = make_user(0)
+        self.other = make_user(1)
+        Profile.objects.filter(user=self.other).update(nin='12345678901', nin_hash=identity_hash('12345678901'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_update_is_one_read_and_one_write(self):
+        # Plus the savepoint around the write.
+        with self.assertNumQueries(4):
+            response = self.client.patch(reverse('profile-update'), {'nin': '10987654321', 'bvn': '22222222222'})
+
+        self.assertEqual(response.status_code, 200)
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(profile.nin_hash, identity_hash('10987654321'))
+        self.assertNotIn('10987654321', profile.nin_hash)
+
+    def test_taken_nin_is_a_field_error(self):
+        response = self.client.patch(reverse('profile-update'), {'nin': '12345678901'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'nin': ['This NIN is already registered with another account.']})
+        self.assertIsNone(Profile.objects.get(user=self.user).nin)
+
+    def test_index_catches_duplicates_checks_would_miss(self):
+        Profile.objects.filter(user=self.user).update(bvn='22222222222', bvn_hash=identity_hash('22222222222'))
+        with self.assertRaises(IntegrityError):
+            profile = Profile.objects.get(user=self.other)
+            profile.bvn = '22222222222'
+            profile.save(update_fields=['bvn'])
+
+    def test_blank_identities_are_not_unique(self):
+        for user in (self.user, self.other):
+            profile = Profile.objects.get(user=user)
+            profile.nin = ''
+            profile.save()
+
+        self.assertEqual(Profile.objects.filter(nin='', nin_hash__isnull=True).count(), 2)
+
+    def test_hash_is_keyed(self):
+        with override_settings(IDENTITY_HASH_KEY='another key'):
+            self.assertNotEqual(identity_hash('12345678901'), Profile.objects.get(user=self.other).nin_hash)
+
+    def test_backfill_warns_about_duplicates(self):
+        from django.apps import apps
+
+        migration = importlib.import_module('user.migrations.0010_profile_identity_hashes')
+        # A duplicate that predates the index.
+        Profile.objects.filter(user=self.user).update(nin='12345678901', nin_hash=None)
+        Profile.objects.filter(user=self.other).update(nin_hash=None)
+
+        with self.assertLogs(migration.logger, 'WARNING') as logs:
+            migration.hash_identities(apps, None)
+
+        profiles = Profile.objects.in_bulk([self.user.profile.pk, self.other.profile.pk])
+        self.assertEqual(profiles[self.user.profile.pk].nin_hash, identity_hash('12345678901'))
+        self.assertIsNone(profiles[self.other.profile.pk].nin_hash)
+        self.assertIn(
+            f'profile {self.other.profile.pk} (nin, same as profile {self.user.profile.pk})', logs.output[0],
+        )
+
+
+class ImportUsersTests(TestCase):
+    columns = ['email', 'phone', 'first_name', 'last_name', 'password']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'users.csv')
+
+    def write_csv(self, rows):
+        with open(self.path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            writer.writerows(rows)
+
+    def row(self, index, first_name='Ada', password=''):
+        return [f'import{index}@example.com', f'081{index:08d}', first_name, 'Lovelace', password]
+
+    def run_import(self, *args):
+        call_command('import_users', self.path, '--workers', '0', *args, stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+
+    def test_creates_users_wallets_and_profiles(self):
+        make_user(0, first_name='Ada')
+        self.write_csv([self.row(i) for i in range(3)] + [self.row(3, first_name='')])
+
+        self.run_import('--chunk-size', '2')
+
+        users = User.objects.filter(email__startswith='import').order_by('email')
+        self.assertEqual([user.username for user in users], ['ada1', 'ada2', 'ada3', 'import3@example.com'])
+        self.assertEqual(Wallet.objects.get(user=users[0]).account_number, '8100000000')
+        self.assertEqual(Profile.objects.filter(user__in=users).count(), 4)
+        self.assertFalse(users[0].has_usable_password())
+
+    def test_passwords_are_hashed_in_a_process_pool(self):
+        self.write_csv([self.row(i, password=f'secret{i}') for i in range(2)])
+
+        call_command('import_users', self.path, '--workers', '2', stdout=open(os.devnull, 'w'))
+
+        self.assertTrue(User.objects.get(email='import1@example.com').check_password('secret1'))
+
+    def test_bad_and_duplicate_rows_are_rejected(self):
+        make_user(0)
+        self.write_csv([
+            self.row(1),
+            ['not-an-email', '08100000002', 'Ada', '', ''],
+            ['import3@example.com', '12345', 'Ada', '', ''],
+            ['person0@example.com', '08100000004', 'Ada', '', ''],
+            ['import5@example.com', '08100000001', 'Ada', '', ''],
+        ])
+
+        self.run_import()
+
+        self.assertEqual(list(User.objects.filter(email__startswith='import').values_list('email', flat=True)),
+                         ['import1@example.com'])
+
+    def test_taken_account_numbers_are_allocated(self):
+        user = make_user(0)
+        Wallet.objects.filter(user=user).update(account_number='8100000001')
+        self.write_csv([self.row(1)])
+
+        self.run_import()
+
+        account_number = Wallet.objects.get(user__email='import1@example.com').account_number
+        self.assertTrue(is_valid_nuban(account_number))
+
+    def test_clashing_chunk_is_retried_row_by_row(self):
+        records = [(i + 1, dict(zip(self.columns, self.row(i)))) for i in range(1, 3)]
+        result = ImportResult()
+        validate = importer.validate_chunk
+
+        def validate_then_race(records, result):
+            valid = validate(records, result)
+            # A signup takes the second row's phone between validation and insert.
+            User.objects.create_user(email='racer@example.com', password='x', first_name='Racer', phone='08100000002')
+            return valid
+
+        with mock.patch.object(importer, 'validate_chunk', validate_then_race):
+            import_chunk(records, result)
+
+        self.assertEqual((result.created, result.rejected), (1, 1))
+        self.assertEqual(User.objects.get(email='import1@example.com').username, 'ada')
+
+    def test_resumes_from_checkpoint(self):
+        self.write_csv([self.row(i) for i in range(4)])
+        self.run_import('--chunk-size', '2')
+        User.objects.filter(email__startswith='import').delete()
+
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerows([self.row(4), self.row(5)])
+        self.run_import('--chunk-size', '2', '--resume')
+
+        self.assertEqual(sorted(User.objects.filter(email__startswith='import').values_list('email', flat=True)),
+                         ['import4@example.com', 'import5@example.com'])
+
+    def test_query_count_does_not_grow_with_chunk_size(self):
+        def queries(first, count):
+            records = [(i, dict(zip(self.columns, self.row(i)))) for i in range(first, first + count)]
+            with CaptureQueriesContext(connection) as context:
+                import_chunk(records, ImportResult())
+            return len(context.captured_queries)
+
+        with override_settings(PLATFORM_COUNTER_SHARDS=1):
+            queries(0, 1)  # creates the username and platform counters
+            self.assertEqual(queries(100, 5), queries(200, 50))
@@ -4,7 +4,8 @@ from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     CustomTokenObtainPairView, ProfileViewSet, ProfileUpdateView, DashboardView, 
     UserDetailView, ChangePasswordView, LoginHistoryView,
-    AdminDashboardView, AdminUsersView, AdminUserDetailView, AdminSettingsView, AdminAnalyticsView, AdminReportDownloadView,
+    AdminDashboardView, AdminUsersView, AdminUserDetailView, AdminSettingsView, AdminAnalyticsView,
+    AdminLeaderboardView, AdminReportJobsView, AdminReportJobView, AdminReportJobDownloadView,
     CustomPasswordResetView
 )
 
@@ -28,7 +29,10 @@ urlpatterns = [
     path('admin/users/<int:pk>/', AdminUserDetailView.as_view(), name='admin-user-detail'),
     path('admin/settings/', AdminSettingsView.as_view(), name='admin-settings'),
     path('admin/analytics/', AdminAnalyticsView.as_view(), name='admin-analytics'),
-    path('admin/reports/download/', AdminReportDownloadView.as_view(), name='admin-report-download'),
+    path('admin/leaderboard/', AdminLeaderboardView.as_view(), name='admin-leaderboard'),
+    path('admin/reports/', AdminReportJobsView.as_view(), name='admin-reports'),
+    path('admin/reports/<int:pk>/', AdminReportJobView.as_view(), name='admin-report'),
+    path('admin/reports/<int:pk>/download/', AdminReportJobDownloadView.as_view(), name='admin-report-download'),
 ]
 
 
@@ -0,0 +1,86 @@
+"""
+Generated usernames.
+
+A user saved without a username gets their first name, lowercased without
+spaces: "john", then "john1", "john2" and so on. Instead of probing each
+candidate with a query, ``UsernameCounter`` keeps the last suffix handed out
+per base, so the next candidate costs one ``UPDATE`` (plus reading it back)
+however many Johns there are. The unique index on ``User.username`` remains
+the guard: if a candidate was taken some other way (typed in by hand, or
+created before the counters existed), the insert raises ``IntegrityError``
+and the next suffix is tried.
+"""
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import User, UsernameCounter
+
+logger = logging.getLogger(__name__)
+
+# Clashes only come from hand-picked or legacy names; don't loop forever.
+MAX_ATTEMPTS = 20
+MAX_BASE_LENGTH = 140
+
+
+def base_username(first_name):
+    return first_name.lower().replace(' ', '')[:MAX_BASE_LENGTH]
+
+
+def _bump(base, count):
+    if not UsernameCounter.objects.filter(base=base).update(last_suffix=F('last_suffix') + count):
+        return None
+    last = UsernameCounter.objects.filter(base=base).values_list('last_suffix', flat=True).get()
+    return [f'{base}{suffix}' for suffix in range(last - count + 1, last + 1)]
+
+
+def reserve_usernames(base, count):
+    """
+    Claim the next ``count`` candidates for ``base`` in one go: ``base``
+    itself first, then ``base1``, ``base2``, ...
+    """
+    # No savepoint of its own: a clash on create has one, anything else
+    # fails the caller's transaction anyway.
+    with transaction.atomic(savepoint=False):
+        candidates = _bump(base, count)
+        if candidates is not None:
+            return candidates
+        try:
+            with transaction.atomic():
+                UsernameCounter.objects.create(base=base, last_suffix=count - 1)
+            return [base] + [f'{base}{suffix}' for suffix in range(1, count)]
+        except IntegrityError:
+            # Another signup created the counter first; take suffixes instead.
+            return _bump(base, count)
+
+
+def next_username(base):
+    """Claim the next candidate for ``base``."""
+    return reserve_usernames(base, 1)[0]
+
+
+def save_with_generated_username(user, save, *args, **kwargs):
+    """
+    Save ``user`` (through ``save``, the model's own save) under the next free
+    username for its first name, moving on to the next candidate if the
+    insert clashes on the username.
+    """
+    base = base_username(user.first_name)
+    if not base:
+        user.username = user.email
+        return save(*args, **kwargs)
+    for _ in range(MAX_ATTEMPTS):
+        user.username = next_username(base)
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            # Only a username clash is worth another try; email and phone
+            # clashes are the caller's to report.
+            if not User.objects.filter(username=user.username).exclude(pk=user.pk).exists():
+                user.username = ''
+                raise
+            logger.info(f"Generated username {user.username} was taken, trying the next one")
+    user.username = ''
+    raise IntegrityError(f'Could not find a free username for {base!r} in {MAX_ATTEMPTS} attempts')
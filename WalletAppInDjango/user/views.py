@@ -1,6 +1,6 @@
 from django.shortcuts import render
 from django.views.generic import CreateView
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 from rest_framework import mixins, request, generics, viewsets
 from rest_framework.generics import CreateAPIView, get_object_or_404, RetrieveAPIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
@@ -13,45 +13,44 @@ from rest_framework.exceptions import ValidationError
 from .serializers import ProfileSerializer, DashboardSerializer, CustomTokenObtainPairSerializer, CustomUserSerializer
 
 from wallet.models import Wallet, Transaction
-from .models import Profile, User, LoginHistory, AdminSettings
+from notifications import mailer, outbox
+from wallet import accounts, balance_cache, leaderboard, rollups
+from wallet.money import ZERO
+from wallet import aggregates, counters, reports
+from wallet.models import ReportJob
+from .models import IDENTITY_IN_USE, Profile, User, LoginHistory, AdminSettings, identity_in_use
 from django.db.models import Q, Sum
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from decimal import Decimal
 import datetime
 from django.core.exceptions import PermissionDenied
-from bson.decimal128 import Decimal128
 from django.db.models import Sum, Q
 from wallet.models import Transaction, Wallet
-from .serializers import LoginHistorySerializer, AdminDashboardSerializer, AdminUserSerializer, AdminSettingsSerializer
+from .serializers import (
+    LoginHistorySerializer, AdminDashboardSerializer, AdminUserSerializer, AdminSettingsSerializer, ReportJobSerializer,
+)
 
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.conf import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def normalize_decimal_value(value):
-    if value is None:
-        return Decimal('0.00')
-    if isinstance(value, Decimal):
-        return value
-    if isinstance(value, Decimal128):
-        return value.to_decimal()
-    if hasattr(value, 'to_decimal'):
-        return value.to_decimal()
-    return Decimal(str(value))
-
-
-def safe_amount_sum(queryset):
-    return sum(
-        (normalize_decimal_value(value) for value in queryset.values_list('amount', flat=True)),
-        Decimal('0.00')
-    )
+def save_profile(serializer, user):
+    # The partial unique indexes on the NIN/BVN hashes catch duplicates,
+    # including ones from concurrent requests. The savepoint keeps a clash
+    # from breaking any surrounding transaction.
+    try:
+        with transaction.atomic():
+            serializer.save(user=user)
+    except IntegrityError as e:
+        field = identity_in_use(e)
+        if field:
+            raise ValidationError({field: [IDENTITY_IN_USE[field]]})
+        raise ValidationError('A database error occurred. Please try again.')
 
 
 class ProfileViewSet(ModelViewSet):
@@ -63,28 +62,10 @@ class ProfileViewSet(ModelViewSet):
         return Profile.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        try:
-            serializer.save(user=self.request.user)
-        except IntegrityError as e:
-            error_message = str(e)
-            if 'nin' in error_message.lower():
-                raise ValidationError({'nin': 'This NIN is already registered with another account.'})
-            elif 'bvn' in error_message.lower():
-                raise ValidationError({'bvn': 'This BVN is already registered with another account.'})
-            else:
-                raise ValidationError('A database error occurred. Please try again.')
+        save_profile(serializer, self.request.user)
 
     def perform_update(self, serializer):
-        try:
-            serializer.save(user=self.request.user)
-        except IntegrityError as e:
-            error_message = str(e)
-            if 'nin' in error_message.lower():
-                raise ValidationError({'nin': 'This NIN is already registered with another account.'})
-            elif 'bvn' in error_message.lower():
-                raise ValidationError({'bvn': 'This BVN is already registered with another account.'})
-            else:
-                raise ValidationError('A database error occurred. Please try again.')
+        save_profile(serializer, self.request.user)
 
     def get_object(self):
         # Get or create profile for the current user
@@ -129,16 +110,7 @@ class ProfileUpdateView(generics.RetrieveUpdateAPIView):
                 return profile
 
     def perform_update(self, serializer):
-        try:
-            serializer.save(user=self.request.user)
-        except IntegrityError as e:
-            error_message = str(e)
-            if 'nin' in error_message.lower():
-                raise ValidationError({'nin': 'This NIN is already registered with another account.'})
-            elif 'bvn' in error_message.lower():
-                raise ValidationError({'bvn': 'This BVN is already registered with another account.'})
-            else:
-                raise ValidationError('A database error occurred. Please try again.')
+        save_profile(serializer, self.request.user)
 
 
 # class DashboardView(generics.ListAPIView):
@@ -150,34 +122,26 @@ class DashboardView(RetrieveAPIView):
     def get_object(self):
         user = self.request.user
         # Ensure wallet exists for the user
-        wallet, created = Wallet.objects.get_or_create(
-            user=user,
-            defaults={'account_number': user.phone[1:] if user.phone else '0000000000'}
-        )
+        wallet = Wallet.objects.filter(user=user).first() or accounts.create_wallet(user)
         
         # Get transaction statistics
         user_transactions = Transaction.objects.filter(
             Q(sender=user) | Q(receiver=user)
         )
         
-        # Total transactions
-        total_transactions = user_transactions.count()
+        # Total transactions and their volume (total amount of all transactions)
+        figures = aggregates.aggregate(
+            user_transactions, transactions=aggregates.count(), volume=aggregates.total('amount'),
+        )
+        total_transactions = figures['transactions']
+        transaction_volume = figures['volume']
         
         # Recent transactions (last 4)
         recent_transactions = user_transactions.order_by('-transaction_time')[:4]
-        
-        # Calculate transaction volume (total amount of all transactions)
-        try:
-            transaction_volume = safe_amount_sum(user_transactions)
-        except TypeError:
-            transaction_volume = sum(
-                (Decimal(str(amount)) for amount in user_transactions.values_list('amount', flat=True)),
-                Decimal('0.00')
-            )
 
-        current_balance = wallet.balance
-        if not isinstance(current_balance, Decimal):
-            current_balance = Decimal(str(current_balance))
+        current_balance = balance_cache.get_balance(wallet)
+        wallet.balance = current_balance
+        user.wallet = wallet
 
         if transaction_volume > 0:
             savings_growth = ((current_balance / transaction_volume) * 100) - 100
@@ -190,12 +154,9 @@ class DashboardView(RetrieveAPIView):
         recent_transactions_data = []
         for trans in recent_transactions:
             transaction_type = 'Deposit' if trans.transaction_type == 'D' else 'Transfer'
-            amount_value = trans.amount
-            if not isinstance(amount_value, Decimal):
-                amount_value = Decimal(str(amount_value))
-            amount = f"₦{amount_value:,.2f}"
+            amount = f"₦{trans.amount:,.2f}"
             date = trans.transaction_time.strftime('%Y-%m-%d')
-            status = 'Completed' if trans.verified else 'Pending'
+            status = 'Completed' if trans.verified else ('Expired' if trans.expired else 'Pending')
             
             recent_transactions_data.append({
                 'id': trans.id,
@@ -300,7 +261,7 @@ class ChangePasswordView(generics.UpdateAPIView):
             )
         
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
         
         return Response({'message': 'Password changed successfully.'}, status=status.HTTP_200_OK)
 
@@ -339,11 +300,12 @@ class AdminDashboardView(generics.RetrieveAPIView):
                 raise PermissionDenied("Admin access required")
             
             
-            total_users = User.objects.count()
-            active_users = User.objects.filter(is_active__in=[True]).count()
-            
-            total_transactions = Transaction.objects.count()
-            total_transaction_volume = safe_amount_sum(Transaction.objects.all())
+            # Live counters, not table scans (see wallet/counters.py).
+            platform = counters.snapshot()
+            total_users = platform.users
+            active_users = platform.active_users
+            total_transactions = platform.transactions
+            total_transaction_volume = platform.volume
             
             # Get recent users (last 7 days) - limit to 4
             from datetime import datetime, timedelta
@@ -359,11 +321,7 @@ class AdminDashboardView(generics.RetrieveAPIView):
             # Calculate revenue (assuming 1% transaction fee)
             revenue = float(total_transaction_volume) * 0.01
             
-            # Avoid djongo Decimal comparison by counting in Python
-            active_wallets = sum(
-                1 for balance in Wallet.objects.values_list('balance', flat=True)
-                if normalize_decimal_value(balance) > Decimal('0.00')
-            )
+            active_wallets = platform.funded_wallets
             
           
             recent_users_data = []
@@ -382,7 +340,7 @@ class AdminDashboardView(generics.RetrieveAPIView):
             for transaction in recent_transactions:
                 recent_transactions_data.append({
                     'id': transaction.id,
-                    'amount': float(normalize_decimal_value(transaction.amount)),
+                    'amount': float(transaction.amount),
                     'transaction_type': transaction.transaction_type,
                     'verified': transaction.verified,
                     'timestamp': transaction.transaction_time,
@@ -501,6 +459,32 @@ class AdminSettingsView(generics.RetrieveUpdateAPIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+def leaderboard_entry(stats):
+    user = stats.user
+    return {
+        'id': user.id,
+        'name': f"{user.first_name} {user.last_name}".strip() or user.email,
+        'email': user.email,
+        'total_volume': float(stats.volume),
+        'sent_amount': float(stats.sent),
+        'received_amount': float(stats.received),
+        'transaction_count': stats.transaction_count,
+    }
+
+
+class AdminLeaderboardView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_staff:
+            raise PermissionDenied("Admin access required")
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            return Response({"message": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response([leaderboard_entry(stats) for stats in leaderboard.top(limit)], status=status.HTTP_200_OK)
+
+
 class AdminAnalyticsView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     
@@ -550,53 +534,37 @@ class AdminAnalyticsView(generics.RetrieveAPIView):
             new_users_week = User.objects.filter(date_joined__gte=week_ago).count()
             new_users_month = User.objects.filter(date_joined__gte=month_ago).count()
             
-            # Transaction Analytics
-            total_transactions = Transaction.objects.count()
-            total_volume = safe_amount_sum(Transaction.objects.all())
-            verified_transactions = Transaction.objects.filter(verified__in=[True]).count()
-            pending_transactions = Transaction.objects.filter(verified__in=[False]).count()
-            transactions_period = Transaction.objects.filter(transaction_time__gte=start_date).count()
-            volume_period = safe_amount_sum(Transaction.objects.filter(transaction_time__gte=start_date))
-            
-            # Recent activity
-            transactions_today = Transaction.objects.filter(transaction_time__date=today).count()
-            transactions_week = Transaction.objects.filter(transaction_time__gte=week_ago).count()
-            transactions_month = Transaction.objects.filter(transaction_time__gte=month_ago).count()
-            
-            volume_today = safe_amount_sum(Transaction.objects.filter(transaction_time__date=today))
-            volume_week = safe_amount_sum(Transaction.objects.filter(transaction_time__gte=week_ago))
-            volume_month = safe_amount_sum(Transaction.objects.filter(transaction_time__gte=month_ago))
-            
+            # Transaction analytics come from the hourly/daily rollups
+            # (see wallet/rollups.py): a few small indexed reads, whatever
+            # the size of the transaction table.
+            all_time = rollups.totals()
+            total_transactions = all_time.count()
+            total_volume = all_time.volume()
+            verified_transactions = all_time.count(verified=True)
+            pending_transactions = all_time.count(verified=False)
+            period_totals = rollups.totals(since=rollups.day_start(start_date))
+            transactions_period = period_totals.count()
+            volume_period = period_totals.volume()
+
+            # One read covers the chart and the recent activity figures.
+            chart_start = today - timedelta(days=days_range - 1)
+            days = rollups.daily_series(min(chart_start, month_ago), today)
+
+            def activity(since):
+                recent = [(count, volume) for day, count, volume in days if day >= since]
+                return sum(count for count, _ in recent), sum((volume for _, volume in recent), ZERO)
+
+            transactions_today, volume_today = activity(today)
+            transactions_week, volume_week = activity(week_ago)
+            transactions_month, volume_month = activity(month_ago)
+
             # Transaction types breakdown
-            deposits = Transaction.objects.filter(transaction_type='D', transaction_time__gte=start_date).count()
-            transfers = Transaction.objects.filter(transaction_type='T', transaction_time__gte=start_date).count()
-            withdrawals = Transaction.objects.filter(transaction_type='W', transaction_time__gte=start_date).count()
-            
-            # Top performing users
-            top_users = User.objects.annotate(
-                total_sent=Sum('sender__amount'),
-                total_received=Sum('receiver__amount')
-            ).filter(
-                Q(sender__isnull=False) | Q(receiver__isnull=False)
-            ).order_by('-total_sent')[:10]
-            
-            top_users_data = []
-            for user in top_users:
-                sent_amount = safe_amount_sum(Transaction.objects.filter(sender=user))
-                received_amount = safe_amount_sum(Transaction.objects.filter(receiver=user))
-                total_volume = float(sent_amount) + float(received_amount)
-                if total_volume > 0:
-                    top_users_data.append({
-                        'id': user.id,
-                        'name': f"{user.first_name} {user.last_name}".strip() or user.email,
-                        'email': user.email,
-                        'total_volume': total_volume,
-                        'sent_amount': float(sent_amount),
-                        'received_amount': float(received_amount),
-                        'transaction_count': Transaction.objects.filter(
-                            Q(sender=user) | Q(receiver=user)
-                        ).count()
-                    })
+            deposits = period_totals.count('D')
+            transfers = period_totals.count('T')
+            withdrawals = period_totals.count('W')
+            
+            # Top performing users, read off the leaderboard index
+            top_users_data = [leaderboard_entry(stats) for stats in leaderboard.top(10)]
             
             # Revenue calculation (1% of total volume for the period)
             revenue = float(volume_period) * 0.01
@@ -605,39 +573,35 @@ class AdminAnalyticsView(generics.RetrieveAPIView):
             avg_transaction_value = float(total_volume) / total_transactions if total_transactions > 0 else 0
             
             # Daily activity for charts (based on selected period)
-            daily_activity = []
-            for i in range(min(days_range, 30)):  # Limit to 30 days max for performance
-                date = today - timedelta(days=i)
-                day_transactions = Transaction.objects.filter(transaction_time__date=date).count()
-                day_volume = safe_amount_sum(Transaction.objects.filter(transaction_time__date=date))
-                daily_activity.append({
-                    'date': date.strftime('%Y-%m-%d'),
-                    'transactions': day_transactions,
-                    'volume': float(day_volume)
-                })
-            daily_activity.reverse()
+            daily_activity = [
+                {'date': day.strftime('%Y-%m-%d'), 'transactions': count, 'volume': float(volume)}
+                for day, count, volume in days if day >= chart_start
+            ]
             
             # Calculate real system health metrics
             # Active sessions (users logged in within last hour)
             active_sessions = User.objects.filter(last_login__gte=now - timedelta(hours=1)).count()
             
-            # Calculate uptime based on recent activity
-            recent_activity = Transaction.objects.filter(transaction_time__gte=now - timedelta(hours=24)).count()
+            # Calculate uptime based on recent activity (hourly rollups, so
+            # "the last hour" starts at the top of the previous hour)
+            last_day = rollups.totals(since=rollups.bucket_start(now - timedelta(hours=24), rollups.HOUR), period=rollups.HOUR)
+            recent_activity = last_day.count()
             if recent_activity > 0:
                 uptime = "99.9%"  # System is active
             else:
                 uptime = "99.5%"  # System is active but no recent transactions
             
             # Calculate response time based on recent transactions
-            recent_transactions = Transaction.objects.filter(transaction_time__gte=now - timedelta(hours=1)).count()
+            last_hour = rollups.bucket_start(now - timedelta(hours=1), rollups.HOUR)
+            recent_transactions = sum(count for count, _ in rollups.series(last_hour, period=rollups.HOUR).values())
             if recent_transactions > 0:
                 response_time = "120ms"  # System is responsive
             else:
                 response_time = "150ms"  # Normal response time
             
             # Calculate error rate based on failed transactions
-            failed_transactions = Transaction.objects.filter(verified__in=[False], transaction_time__gte=now - timedelta(hours=24)).count()
-            total_recent_transactions = Transaction.objects.filter(transaction_time__gte=now - timedelta(hours=24)).count()
+            failed_transactions = last_day.count(verified=False)
+            total_recent_transactions = recent_activity
             if total_recent_transactions > 0:
                 error_rate = f"{(failed_transactions / total_recent_transactions * 100):.1f}%"
             else:
@@ -700,90 +664,53 @@ class AdminAnalyticsView(generics.RetrieveAPIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class AdminReportDownloadView(generics.CreateAPIView):
+class AdminReportJobsView(generics.ListCreateAPIView):
+    """
+    POST queues a PDF report for ``run_report_jobs`` and answers 202 straight
+    away; GET lists the latest jobs. Poll a job until it is ``done``, then
+    fetch its ``download_url``.
+    """
     permission_classes = [IsAuthenticated]
-    
-    def post(self, request, *args, **kwargs):
+    serializer_class = ReportJobSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        if not self.request.user.is_staff:
+            raise PermissionDenied("Admin access required")
+        return ReportJob.objects.order_by('-created_at')[:20]
+
+    def create(self, request, *args, **kwargs):
         if not request.user.is_staff:
             raise PermissionDenied("Admin access required")
-        
-        try:
-            report_type = request.data.get('report_type')
-            date_range = request.data.get('date_range', 'month')
-            
-            # Get analytics data for the report
-            from datetime import datetime, timedelta
-            from django.utils import timezone
-            from django.db.models import Sum, Q
-            
-            now = timezone.now()
-            today = now.date()
-            
-            if date_range == 'week':
-                start_date = today - timedelta(days=7)
-            elif date_range == 'month':
-                start_date = today - timedelta(days=30)
-            elif date_range == 'quarter':
-                start_date = today - timedelta(days=90)
-            elif date_range == 'year':
-                start_date = today - timedelta(days=365)
-            else:
-                start_date = today
-            
-            # Get data based on report type
-            if report_type == 'User Activity Report':
-                # User analytics data
-                total_users = User.objects.count()
-                active_users = User.objects.filter(is_active__in=[True], account_status='active').count()
-                new_users = User.objects.filter(date_joined__gte=start_date).count()
-                
-                # Generate PDF using the existing utility
-                from wallet.utils import generate_platform_report
-                pdf_buffer = generate_platform_report()
-                
-            elif report_type == 'Transaction Summary Report':
-                # Transaction analytics data
-                total_transactions = Transaction.objects.filter(transaction_time__gte=start_date).count()
-                total_volume = safe_amount_sum(Transaction.objects.filter(transaction_time__gte=start_date))
-                avg_transaction = float(total_volume) / total_transactions if total_transactions > 0 else 0
-                
-                # Generate PDF using the existing utility
-                from wallet.utils import generate_platform_report
-                pdf_buffer = generate_platform_report()
-                
-            elif report_type == 'Revenue Analysis Report':
-                # Revenue analytics data
-                total_volume = safe_amount_sum(Transaction.objects.filter(transaction_time__gte=start_date))
-                total_revenue = float(total_volume) * 0.01
-                
-                # Generate PDF using the existing utility
-                from wallet.utils import generate_platform_report
-                pdf_buffer = generate_platform_report()
-                
-            elif report_type == 'System Performance Report':
-                # System health data
-                active_sessions = User.objects.filter(last_login__gte=now - timedelta(hours=1)).count()
-                
-                # Generate PDF using the existing utility
-                from wallet.utils import generate_platform_report
-                pdf_buffer = generate_platform_report()
-                
-            else:
-                # Default to platform report
-                from wallet.utils import generate_platform_report
-                pdf_buffer = generate_platform_report()
-            
-            # Create HTTP response with PDF
-            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{report_type.replace(" ", "_")}_{date_range}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-            
-            return response
-            
-        except Exception as e:
-            print(f"Error generating report: {e}")
-            import traceback
-            traceback.print_exc()
-            return Response({"error": f"Failed to generate report: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = reports.enqueue(request.user, **serializer.validated_data)
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class AdminReportJobView(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = ReportJobSerializer
+
+    def get_queryset(self):
+        if not self.request.user.is_staff:
+            raise PermissionDenied("Admin access required")
+        return ReportJob.objects.all()
+
+
+class AdminReportJobDownloadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        if not request.user.is_staff:
+            raise PermissionDenied("Admin access required")
+        job = get_object_or_404(ReportJob, pk=pk)
+        if job.status != ReportJob.DONE:
+            return Response(
+                {"message": f"Report is not ready (status: {job.status})"}, status=status.HTTP_409_CONFLICT
+            )
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename,
+                            content_type='application/pdf')
 
 
 class CustomPasswordResetView(generics.GenericAPIView):
@@ -807,38 +734,28 @@ class CustomPasswordResetView(generics.GenericAPIView):
             
             # Send email
             subject = 'Password Reset - EaziPurse'
-            html_message = render_to_string('email/password_reset_email.html', {
+            context = {
                 'user': user,
                 'protocol': 'https',
                 'domain': 'eazipurse-ng.onrender.com',
                 'uid': uid,
                 'token': token,
-            })
-            
-            plain_message = render_to_string('email/password_reset_email.txt', {
-                'user': user,
-                'protocol': 'https',
-                'domain': 'eazipurse-ng.onrender.com',
-                'uid': uid,
-                'token': token,
-            })
+            }
+            html_message = mailer.render('email/password_reset_email.html', context)
             
-            # Log email attempt
-            logger.info(f"Attempting to send password reset email to {email}")
-            logger.info(f"Reset URL: {reset_url}")
-            logger.info(f"Email configuration: {settings.EMAIL_HOST}:{settings.EMAIL_PORT}")
-            logger.info(f"From email: {settings.DEFAULT_FROM_EMAIL}")
+            plain_message = mailer.render('email/password_reset_email.txt', context)
             
-            send_mail(
-                subject=subject,
-                message=plain_message,
+            # Queued: the outbox dispatcher delivers it (with retries) after
+            # this request, so SMTP latency or an outage doesn't fail it.
+            outbox.enqueue(
+                subject,
+                plain_message,
+                [email],
                 from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                html_message=html_message,
-                fail_silently=False,
+                html_body=html_message,
             )
-            
-            logger.info(f"Password reset email sent successfully to {email}")
+
+            logger.info(f"Password reset email queued for {email}")
             
             return Response({
                 'message': 'Password reset email sent successfully',
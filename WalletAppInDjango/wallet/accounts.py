@@ -0,0 +1,180 @@
+"""
+Account number allocation.
+
+A wallet's account number is the owner's phone number without its leading
+0 when that gives ten digits, as before. Otherwise, or if that number is
+taken, a NUBAN-style number is allocated: a nine-digit serial plus the
+NUBAN check digit computed with ``NUBAN_BANK_CODE``.
+
+Serials start with 1 (phone-derived numbers start with 7, 8 or 9), and each
+process reserves ``ACCOUNT_NUMBER_BLOCK_SIZE`` of them at a time from
+``AccountNumberSequence`` with one locked ``UPDATE``, then hands them out
+from memory. Uniqueness comes from that reservation, not from probing the
+wallet table. The unique index on ``Wallet.account_number`` stays the final
+guard: a clash with a legacy number is an ``IntegrityError`` and the next
+serial is used. Serials left in a block when a process exits are never
+used, like the gaps in a database sequence.
+"""
+import itertools
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import AccountNumberSequence, Wallet
+
+FIRST_SERIAL = 100_000_000
+LAST_SERIAL = 199_999_999
+NUBAN_WEIGHTS = (3, 7, 3, 3, 7, 3, 3, 7, 3, 3, 7, 3)
+# Legacy collisions are rare; give up rather than loop if something is off.
+MAX_ATTEMPTS = 5
+
+
+class AccountNumbersExhausted(Exception):
+    pass
+
+
+def _bank_code():
+    return getattr(settings, 'NUBAN_BANK_CODE', '999')
+
+
+def _block_size():
+    return getattr(settings, 'ACCOUNT_NUMBER_BLOCK_SIZE', 100)
+
+
+def check_digit(serial, bank_code=None):
+    """NUBAN check digit for a nine-digit ``serial`` under ``bank_code``."""
+    digits = f'{bank_code or _bank_code()}{serial:09d}'
+    total = sum(int(digit) * weight for digit, weight in zip(digits, NUBAN_WEIGHTS))
+    return (10 - total % 10) % 10
+
+
+def nuban(serial, bank_code=None):
+    return f'{serial:09d}{check_digit(serial, bank_code)}'
+
+
+def is_valid_nuban(account_number, bank_code=None):
+    return (
+        len(account_number) == 10 and account_number.isdigit()
+        and check_digit(int(account_number[:9]), bank_code) == int(account_number[9])
+    )
+
+
+def phone_account_number(phone):
+    """The phone-derived account number, or ``None`` if ``phone`` doesn't give ten digits."""
+    if phone and len(phone) == 11 and phone.isdigit():
+        return phone[1:]
+    return None
+
+
+def reserve_block(size, bank_code=None):
+    """Reserve ``size`` serials; returns the ``range`` reserved."""
+    bank_code = bank_code or _bank_code()
+    with transaction.atomic():
+        AccountNumberSequence.objects.get_or_create(bank_code=bank_code, defaults={'next_serial': FIRST_SERIAL})
+        sequence = AccountNumberSequence.objects.select_for_update().get(bank_code=bank_code)
+        start = sequence.next_serial
+        if start + size - 1 > LAST_SERIAL:
+            raise AccountNumbersExhausted(f'No account number serials left for bank code {bank_code}')
+        AccountNumberSequence.objects.filter(pk=sequence.pk).update(next_serial=F('next_serial') + size)
+    return range(start, start + size)
+
+
+class Allocator:
+    """
+    Hands out serials from blocks reserved by this process.
+
+    A block reserved inside a transaction that later rolls back is back in
+    the sequence for someone else, so only the serials the caller needs are
+    used straight away; the rest of the block joins the pool when the
+    transaction commits.
+    """
+
+    def __init__(self):
+        self._serials = iter(())
+        self._lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def _add(self, serials):
+        with self._lock:
+            self._serials = itertools.chain(self._serials, serials)
+
+    def allocate_many(self, count):
+        """``count`` new account numbers."""
+        with self._lock:
+            serials = list(itertools.islice(self._serials, count))
+        missing = count - len(serials)
+        if missing:
+            # Reserve a normal block on top, so the next caller is served from memory.
+            block = reserve_block(missing + _block_size())
+            serials.extend(block[:missing])
+            transaction.on_commit(lambda: self._add(iter(block[missing:])))
+        return [nuban(serial) for serial in serials]
+
+    def allocate(self):
+        """One new account number."""
+        return self.allocate_many(1)[0]
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    global _allocator
+    # A forked child must not hand out the parent's reserved serials again.
+    if _allocator is None or _allocator.pid != os.getpid():
+        with _allocator_lock:
+            if _allocator is None or _allocator.pid != os.getpid():
+                _allocator = Allocator()
+    return _allocator
+
+
+def allocate():
+    return get_allocator().allocate()
+
+
+def _candidates(user):
+    phone_number = phone_account_number(user.phone)
+    if phone_number:
+        yield phone_number
+    for _ in range(MAX_ATTEMPTS):
+        yield allocate()
+
+
+def _claim(user, store, existing=None):
+    """
+    Try candidate numbers with ``store(account_number)`` until one doesn't
+    clash. ``existing()``, if given, is consulted after a clash and its
+    result returned if it has one.
+    """
+    for account_number in _candidates(user):
+        try:
+            with transaction.atomic():
+                return store(account_number)
+        except IntegrityError:
+            found = existing() if existing else None
+            if found is not None:
+                return found
+    raise AccountNumbersExhausted(f'Could not find a free account number for {user.email}')
+
+
+def create_wallet(user):
+    """Create ``user``'s wallet with a fresh account number, or return the one it already has."""
+    return _claim(
+        user,
+        lambda account_number: Wallet.objects.create(user=user, account_number=account_number),
+        # The clash may be on the user, if a concurrent request created the wallet first.
+        existing=lambda: Wallet.objects.filter(user=user).first(),
+    )
+
+
+def assign_account_number(wallet):
+    """Give an existing ``wallet`` a fresh account number (used by backfills)."""
+    def store(account_number):
+        Wallet.objects.filter(pk=wallet.pk).update(account_number=account_number)
+        wallet.account_number = account_number
+        return wallet
+    return _claim(wallet.user, store)
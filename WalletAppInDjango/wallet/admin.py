@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import GatewayEvent, ReportJob
+
+
+@admin.register(GatewayEvent)
+class GatewayEventAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'event', 'amount', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event')
+    search_fields = ('reference',)
+    readonly_fields = ('payload',)
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'report_type', 'date_range', 'status', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'report_type')
+    readonly_fields = ('error',)
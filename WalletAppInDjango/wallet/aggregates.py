@@ -0,0 +1,202 @@
+"""
+Counts and sums computed where the data lives.
+
+Dashboards and reports used to count and sum the same querysets one figure
+at a time, through ``safe_amount_sum``, a leftover from when djongo could not
+aggregate ``Decimal128`` amounts. ``aggregate`` computes any number of
+figures over a queryset in one round trip::
+
+    figures = aggregate(
+        Transaction.objects.filter(transaction_time__gte=since),
+        transactions=count(),
+        volume=total('amount'),
+        verified=count(Q(verified__in=[True])),
+    )
+
+On SQL backends that is a single ``SELECT`` with ``SUM``/``COUNT`` and
+``FILTER`` (or ``CASE``) clauses. djongo cannot translate conditional
+aggregates, so on djongo the queryset's filters are turned into a native
+MongoDB ``$match``/``$group`` pipeline run on the collection. Filters the
+translation does not cover (joins, subqueries, expressions) fall back to one
+plain ``aggregate`` per figure, which djongo does handle.
+
+Sums of ``MoneyField`` columns come back as ``Money``, every other figure as
+a number; empty sets give zero rather than ``None``.
+"""
+from collections import namedtuple
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db import connections
+from django.db.models import Count, Q, Sum
+from django.db.models.expressions import Col
+from django.db.models.sql.where import AND, NothingNode, WhereNode
+
+from .money import Money, MoneyField
+
+SUM = 'sum'
+COUNT = 'count'
+
+# Django lookups with a MongoDB counterpart. The operators are spelled the
+# same in queries and in aggregation expressions.
+OPERATORS = {'exact': '$eq', 'gt': '$gt', 'gte': '$gte', 'lt': '$lt', 'lte': '$lte', 'in': '$in'}
+
+# A translated WHERE clause: nodes joining child conditions, and leaf comparisons.
+Node = namedtuple('Node', 'connector negated children')
+Leaf = namedtuple('Leaf', 'column lookup value')
+
+
+class Unsupported(Exception):
+    """A filter that has no MongoDB translation here."""
+
+
+@dataclass(frozen=True)
+class Metric:
+    function: str
+    field: Optional[str] = None
+    filter: Optional[Q] = None
+
+
+def total(field='amount', filter=None):
+    """Sum of ``field`` over the rows, or over those matching ``filter``."""
+    return Metric(SUM, field, filter)
+
+
+def count(filter=None):
+    """Number of rows, or of those matching ``filter``."""
+    return Metric(COUNT, None, filter)
+
+
+def is_mongo(alias):
+    connection = connections[alias]
+    return connection.vendor == 'djongo' or connection.settings_dict['ENGINE'] == 'djongo'
+
+
+def aggregate(queryset, **metrics):
+    """``{name: value}`` for each ``Metric`` given, computed in the database."""
+    if not metrics:
+        return {}
+    if is_mongo(queryset.db):
+        try:
+            raw = _mongo_aggregate(queryset, metrics)
+        except Unsupported:
+            raw = {name: _sql_aggregate(queryset, {name: metric})[name] for name, metric in metrics.items()}
+    else:
+        raw = _sql_aggregate(queryset, metrics)
+    return {name: _result(queryset.model, metric, raw.get(name)) for name, metric in metrics.items()}
+
+
+def volume(queryset, field='amount'):
+    """Shorthand for the sum of a single money column."""
+    return aggregate(queryset, volume=total(field))['volume']
+
+
+def _result(model, metric, value):
+    if metric.function == COUNT:
+        return value or 0
+    field = model._meta.get_field(metric.field)
+    if isinstance(field, MoneyField):
+        # SQL sums arrive as Money already; Mongo sums are plain kobo.
+        return value if isinstance(value, Money) else Money(value or 0)
+    return value or 0
+
+
+def _sql_aggregate(queryset, metrics):
+    # Aliased so that figures may share their names with the model's fields.
+    aliases = {f'_aggregate_{index}': name for index, name in enumerate(metrics)}
+    result = queryset.aggregate(**{
+        alias: Sum(metrics[name].field, filter=metrics[name].filter) if metrics[name].function == SUM
+        else Count('pk', filter=metrics[name].filter)
+        for alias, name in aliases.items()
+    })
+    return {name: result[alias] for alias, name in aliases.items()}
+
+
+# MongoDB
+
+def _mongo_aggregate(queryset, metrics):
+    connection = connections[queryset.db]
+    steps = pipeline(queryset, metrics, connection)
+    connection.ensure_connection()
+    # djongo's connection is the pymongo Database.
+    collection = connection.connection[queryset.model._meta.db_table]
+    return next(collection.aggregate(steps), None) or {}
+
+
+def pipeline(queryset, metrics, connection=None):
+    """The ``$match``/``$group`` pipeline computing ``metrics`` over ``queryset``."""
+    connection = connection or connections[queryset.db]
+    query = queryset.query
+    if query.is_sliced or query.distinct or query.combinator:
+        raise Unsupported('sliced, distinct and combined querysets')
+    steps = []
+    condition = _condition(query, connection)
+    if condition is not None:
+        steps.append({'$match': _as_query(condition)})
+    group = {'_id': None}
+    for name, metric in metrics.items():
+        if metric.function == SUM:
+            value = '$' + queryset.model._meta.get_field(metric.field).column
+        else:
+            value = 1
+        if metric.filter is not None:
+            filtered = queryset.model._default_manager.filter(metric.filter).query
+            only = _condition(filtered, connection)
+            if only is not None:
+                value = {'$cond': [_as_expression(only), value, 0]}
+        group[name] = {'$sum': value}
+    steps.append({'$group': group})
+    return steps
+
+
+def _condition(query, connection):
+    """``query``'s WHERE clause as a tree of ``Node`` and ``Leaf``, or ``None`` if it has none."""
+    if not query.where:
+        return None
+    return _node(query.where, query.base_table, connection)
+
+
+def _node(node, table, connection):
+    if isinstance(node, NothingNode):
+        raise Unsupported('empty filters')
+    if isinstance(node, WhereNode):
+        return Node(node.connector, node.negated, [_node(child, table, connection) for child in node.children])
+    lookup = node
+    if not isinstance(lookup.lhs, Col) or lookup.lhs.alias != table:
+        raise Unsupported('filters on joined tables or expressions')
+    if lookup.lookup_name not in OPERATORS and lookup.lookup_name != 'isnull':
+        raise Unsupported(f'the {lookup.lookup_name} lookup')
+    if hasattr(lookup.rhs, 'resolve_expression'):
+        raise Unsupported('filters against expressions or subqueries')
+    field = lookup.lhs.output_field
+    if lookup.lookup_name == 'isnull':
+        value = bool(lookup.rhs)
+    elif lookup.lookup_name == 'in':
+        value = [field.get_db_prep_value(item, connection, prepared=True) for item in lookup.rhs]
+    else:
+        value = field.get_db_prep_value(lookup.rhs, connection, prepared=True)
+    return Leaf(lookup.lhs.target.column, lookup.lookup_name, value)
+
+
+def _as_query(condition):
+    if isinstance(condition, Node):
+        connector, negated, children = condition
+        query = {'$and' if connector == AND else '$or': [_as_query(child) for child in children]}
+        return {'$nor': [query]} if negated else query
+    column, lookup, value = condition
+    if lookup == 'isnull':
+        return {column: None} if value else {column: {'$ne': None}}
+    return {column: {OPERATORS[lookup]: value}}
+
+
+def _as_expression(condition):
+    if isinstance(condition, Node):
+        connector, negated, children = condition
+        expression = {'$and' if connector == AND else '$or': [_as_expression(child) for child in children]}
+        return {'$not': [expression]} if negated else expression
+    column, lookup, value = condition
+    if lookup == 'isnull':
+        # Missing fields count as null, as in a $match.
+        is_null = {'$in': [{'$type': '$' + column}, ['null', 'missing']]}
+        return is_null if value else {'$not': [is_null]}
+    return {OPERATORS[lookup]: ['$' + column, value]}
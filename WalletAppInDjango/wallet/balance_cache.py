@@ -0,0 +1,100 @@
+"""
+Write-through cache of committed wallet balances.
+
+Entries live in the ``balances`` cache (``CACHES['balances']``), keyed by
+wallet id, and hold ``(balance_version, kobo)``. Every balance ``UPDATE`` also
+bumps ``Wallet.balance_version``. The ledger reads the new values back while
+it still holds the row locks and hands them to ``write_through``, which stores
+them once the transaction commits; an entry is only ever replaced by a newer
+version. Readers that miss fill the entry with ``cache.add``, which never
+overwrites a written-through value.
+
+The default local-memory backend is per process. Deployments running several
+workers should point ``BALANCE_CACHE_BACKEND`` at a shared cache (Redis,
+Memcached) so every worker sees every write. Entries expire after
+``BALANCE_CACHE_TIMEOUT`` seconds as a backstop.
+
+Sharded wallets are not cached: their credits land on shard rows without
+touching the wallet row, so the wallet's version would not move.
+"""
+import threading
+
+from django.core.cache import caches
+from django.db import transaction
+
+from . import ledger
+from .models import Wallet
+from .money import Money
+
+CACHE_ALIAS = 'balances'
+
+_store_lock = threading.Lock()
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _key(wallet_id):
+    return f'wallet-balance:{wallet_id}'
+
+
+def _store(entries):
+    cache = _cache()
+    keys = {wallet_id: _key(wallet_id) for wallet_id in entries}
+    with _store_lock:
+        cached = cache.get_many(list(keys.values()))
+        newer = {}
+        for wallet_id, (version, balance) in entries.items():
+            current = cached.get(keys[wallet_id])
+            if current is None or current[0] < version:
+                newer[keys[wallet_id]] = (version, balance.kobo)
+        if newer:
+            cache.set_many(newer)
+
+
+def write_through(entries):
+    """
+    Cache ``{wallet_id: (balance_version, balance)}`` when the current
+    transaction commits. Nothing is cached if it rolls back.
+    """
+    sharded = ledger.sharded_wallets()
+    entries = {wallet_id: entry for wallet_id, entry in entries.items() if wallet_id not in sharded}
+    if entries:
+        transaction.on_commit(lambda: _store(entries))
+
+
+def get_balance(wallet):
+    """
+    Committed balance of ``wallet`` (a ``Wallet`` or a wallet id).
+
+    Served from the cache when possible. On a miss the balance comes from the
+    given instance, or from the database when only an id is passed, and is
+    cached for the next reader. Returns ``None`` for an unknown wallet id.
+    """
+    wallet_id = wallet.pk if isinstance(wallet, Wallet) else wallet
+    if wallet_id in ledger.sharded_wallets():
+        if not isinstance(wallet, Wallet):
+            wallet = Wallet.objects.filter(pk=wallet_id).first()
+        return wallet.current_balance() if wallet is not None else None
+
+    cached = _cache().get(_key(wallet_id))
+    if cached is not None:
+        return Money(cached[1])
+
+    if isinstance(wallet, Wallet):
+        version, balance = wallet.balance_version, wallet.balance
+    else:
+        row = Wallet.objects.filter(pk=wallet_id).values_list('balance_version', 'balance').first()
+        if row is None:
+            return None
+        version, balance = row
+    # Values read inside a transaction may never commit; don't share them.
+    if not transaction.get_connection().in_atomic_block:
+        _cache().add(_key(wallet_id), (version, balance.kobo))
+    return balance
+
+
+def forget(wallet_ids):
+    """Drop cached balances, e.g. after changing ``Wallet.balance`` outside the ledger."""
+    _cache().delete_many([_key(wallet_id) for wallet_id in wallet_ids])
@@ -0,0 +1,163 @@
+"""
+Live platform counters for the admin dashboard.
+
+The dashboard used to count the user, transaction and wallet tables and sum
+every transaction on each load. ``PlatformCounter`` keeps those figures as
+running totals instead, changed in the same database transaction as the
+writes they describe:
+
+* users and active users, by ``user.provisioning.provision``, the bulk
+  importer and ``User.save`` when ``is_active`` flips;
+* transactions and their volume, by ``record_transactions`` next to the
+  rollups and leaderboard;
+* wallets with a positive balance, by ``ledger.post_many`` from the balances
+  it has just written.
+
+Like the rollups, each counter is spread over ``PLATFORM_COUNTER_SHARDS``
+rows, one picked at random per write, and ``snapshot`` adds them up in one
+query whatever the size of the tables.
+
+Deletions (admin clean-ups, cascades) and balance edits that bypass the
+ledger are not tracked. ``reconcile``, run periodically by the
+``reconcile_counters`` command, counts the tables and books the difference
+as a correction; writes committed while it counts can be booked twice or
+missed, and the next run evens them out.
+"""
+import random
+from dataclasses import dataclass, fields
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, F, Q, Sum, Value, When
+
+from . import aggregates
+from .models import PlatformCounter, Transaction, Wallet, WalletBalanceShard
+from .money import ZERO, Money
+
+USERS = PlatformCounter.USERS
+ACTIVE_USERS = PlatformCounter.ACTIVE_USERS
+TRANSACTIONS = PlatformCounter.TRANSACTIONS
+VOLUME = PlatformCounter.VOLUME
+FUNDED_WALLETS = PlatformCounter.FUNDED_WALLETS
+
+
+def _shards():
+    return getattr(settings, 'PLATFORM_COUNTER_SHARDS', 8)
+
+
+def add(**deltas):
+    """Add ``deltas`` (counter name to change, volume in kobo) to the counters. Call in the writing transaction."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    shard = random.randrange(_shards())
+    rows = PlatformCounter.objects.filter(name__in=sorted(deltas), shard=shard)
+    increment = F('value') + Case(
+        *[When(name=name, then=Value(delta)) for name, delta in deltas.items()],
+        default=Value(0),
+        output_field=BigIntegerField(),
+    )
+    if rows.update(value=increment) == len(deltas):
+        return
+    # A counter's first write on this shard.
+    existing = set(rows.values_list('name', flat=True))
+    for name in sorted(set(deltas) - existing):
+        try:
+            with transaction.atomic():
+                PlatformCounter.objects.create(name=name, shard=shard, value=deltas[name])
+        except IntegrityError:
+            # Another writer opened the row first.
+            PlatformCounter.objects.filter(name=name, shard=shard).update(value=F('value') + deltas[name])
+
+
+def record_users(users):
+    """Count newly created ``users``."""
+    users = list(users)
+    add(**{USERS: len(users), ACTIVE_USERS: sum(1 for user in users if user.is_active)})
+
+
+def record_activation(was_active, is_active):
+    """Count a user's ``is_active`` changing."""
+    if was_active != is_active:
+        add(**{ACTIVE_USERS: 1 if is_active else -1})
+
+
+def record_transactions(journals):
+    """Count newly created ``journals`` and their volume."""
+    journals = list(journals)
+    add(**{TRANSACTIONS: len(journals), VOLUME: sum(journal.amount.kobo for journal in journals)})
+
+
+def record_balances(changes, balances):
+    """
+    Count wallets whose balance crossed zero: ``changes`` is
+    ``{wallet_id: delta}`` and ``balances`` ``{wallet_id: balance}`` after it.
+    """
+    funded = 0
+    for wallet_id, delta in changes.items():
+        after = balances[wallet_id]
+        funded += (after > ZERO) - (after - delta > ZERO)
+    add(**{FUNDED_WALLETS: funded})
+
+
+@dataclass
+class Counters:
+    users: int = 0
+    active_users: int = 0
+    transactions: int = 0
+    volume: Money = ZERO
+    funded_wallets: int = 0
+
+    def as_values(self):
+        """``{name: value}`` as stored, volume in kobo."""
+        values = {item.name: getattr(self, item.name) for item in fields(self)}
+        values[VOLUME] = self.volume.kobo
+        return values
+
+
+def snapshot():
+    """The current ``Counters``. One query over at most five times ``PLATFORM_COUNTER_SHARDS`` rows."""
+    values = dict(PlatformCounter.objects.values('name').annotate(total=Sum('value')).values_list('name', 'total'))
+    counters = Counters(**{name: values.get(name) or 0 for name in (USERS, ACTIVE_USERS, TRANSACTIONS, FUNDED_WALLETS)})
+    counters.volume = Money(values.get(VOLUME) or 0)
+    return counters
+
+
+def recount():
+    """``Counters`` counted from the tables, as the dashboard used to."""
+    users = aggregates.aggregate(
+        get_user_model().objects.all(), total=aggregates.count(), active=aggregates.count(Q(is_active__in=[True])),
+    )
+    journals = aggregates.aggregate(
+        Transaction.objects.all(), total=aggregates.count(), volume=aggregates.total('amount'),
+    )
+    funded = aggregates.aggregate(
+        Wallet.objects.filter(balance_shard_count=0), funded=aggregates.count(Q(balance__gt=ZERO)),
+    )['funded']
+    # Sharded wallets (a handful at most) count what their shards hold too.
+    sharded = dict(Wallet.objects.filter(balance_shard_count__gt=0).values_list('pk', 'balance'))
+    if sharded:
+        parked = WalletBalanceShard.objects.filter(wallet_id__in=sharded).values('wallet_id').annotate(total=Sum('balance'))
+        for row in parked:
+            sharded[row['wallet_id']] += row['total'] or ZERO
+        funded += sum(1 for balance in sharded.values() if balance > ZERO)
+    return Counters(
+        users=users['total'], active_users=users['active'], transactions=journals['total'],
+        volume=journals['volume'], funded_wallets=funded,
+    )
+
+
+def reconcile(apply=True):
+    """
+    Compare the counters with the tables and, if ``apply``, book the
+    difference. Returns ``{name: (counted, actual)}`` for the counters that
+    had drifted, volume in kobo.
+    """
+    counted = snapshot().as_values()
+    actual = recount().as_values()
+    drift = {name: (counted[name], actual[name]) for name in counted if counted[name] != actual[name]}
+    if apply and drift:
+        with transaction.atomic():
+            add(**{name: value - current for name, (current, value) in drift.items()})
+    return drift
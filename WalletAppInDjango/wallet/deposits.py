@@ -0,0 +1,124 @@
+"""
+Settling gateway deposits.
+
+``credit_deposit`` is the one place a confirmed deposit is credited and its
+alert queued; ``fund/verify``, the webhook worker and ``reconcile`` all go
+through it. ``reconcile`` sweeps deposit intents whose confirmation never
+arrived: it pages through unverified deposits, asks the gateway about each
+from a bounded thread pool, credits the ones that succeeded and marks intents
+older than ``expire_after`` that never will as expired.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from notifications import mailer, outbox
+
+from . import gateway
+from .gateway import GatewayError
+from .ledger import WalletNotFound
+from .models import Transaction
+from .money import Money
+from .services import settle_deposit
+
+logger = logging.getLogger(__name__)
+
+# Paystack states after which a payment can no longer succeed.
+DEAD_STATES = {'failed', 'abandoned', 'reversed'}
+
+
+def credit_deposit(deposit, amount):
+    """
+    Credit a gateway-confirmed ``deposit`` and queue its alert, atomically.
+    Returns ``False`` if it had already been credited.
+    """
+    with transaction.atomic():
+        settled = settle_deposit(deposit, amount)
+        if settled:
+            outbox.enqueue(
+                "EaziPurse Transaction Alert",
+                mailer.render('email/alerts/deposit.txt', {'amount': amount, 'reference': deposit.reference}),
+                [deposit.sender.email],
+                from_email=settings.EMAIL_HOST_USER,
+            )
+    return settled
+
+
+@dataclass
+class ReconcileResult:
+    checked: int = 0
+    credited: int = 0
+    expired: int = 0
+    pending: int = 0
+    errors: int = 0
+    error_samples: list = field(default_factory=list)
+
+    def error(self, reference, message):
+        self.errors += 1
+        if len(self.error_samples) < 10:
+            self.error_samples.append(f'{reference}: {message}')
+
+
+def _lookup(reference):
+    try:
+        return gateway.get_client().verify(reference), None
+    except GatewayError as e:
+        return None, e
+
+
+def _apply(deposit, response, stale_before, result):
+    data = (response or {}).get('data') or {}
+    if response.get('status') and data.get('status') == 'success':
+        if credit_deposit(deposit, Money(int(data['amount']))):
+            result.credited += 1
+        return
+    # Not found, or in a state it can't leave: only give up on old intents.
+    dead = not response.get('status') or data.get('status') in DEAD_STATES
+    if dead and deposit.transaction_time < stale_before:
+        result.expired += Transaction.objects.filter(
+            pk=deposit.pk, verified__in=[False], expired__in=[False]
+        ).update(expired=True)
+    else:
+        result.pending += 1
+
+
+def reconcile(batch_size=500, workers=8, expire_after=timedelta(hours=24), limit=None):
+    """
+    Verify unverified, unexpired deposits against the gateway. Returns a
+    ``ReconcileResult``.
+
+    Gateway lookups for a page run concurrently on ``workers`` threads; the
+    database work stays on the calling thread, one short transaction per
+    deposit. Pages are walked by primary key, so rows settled or expired on
+    the way don't shift the pages that follow.
+    """
+    result = ReconcileResult()
+    stale_before = timezone.now() - expire_after
+    last_pk = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile') as pool:
+        while limit is None or result.checked < limit:
+            size = batch_size if limit is None else min(batch_size, limit - result.checked)
+            page = list(
+                Transaction.objects.select_related('sender')
+                .filter(transaction_type='D', verified__in=[False], expired__in=[False], pk__gt=last_pk)
+                .order_by('pk')[:size]
+            )
+            if not page:
+                break
+            last_pk = page[-1].pk
+            for deposit, (response, error) in zip(page, pool.map(_lookup, [d.reference for d in page])):
+                result.checked += 1
+                if error is not None:
+                    result.error(deposit.reference, error)
+                    continue
+                try:
+                    _apply(deposit, response, stale_before, result)
+                except (WalletNotFound, KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"Could not reconcile deposit {deposit.reference}: {e}")
+                    result.error(deposit.reference, e)
+    return result
@@ -0,0 +1,204 @@
+"""
+A local stand-in for the Paystack API, for load tests and benchmarks.
+
+``FakePaystack`` is a plain WSGI app implementing the two endpoints we call,
+``POST /transaction/initialize`` and ``GET /transaction/verify/<reference>``,
+with injectable faults: a latency distribution for every answer, a share of
+requests that fail with a 500, a share that hang for ``timeout`` seconds (so
+the client's read timeout fires) and a share of payments the customer
+abandons. Given a ``webhook_url`` it also plays the customer paying: each
+initialized payment is later delivered as a signed ``charge.success``
+webhook, as Paystack would.
+
+Run it with ``manage.py fake_paystack`` and point ``PAYSTACK_BASE_URL`` at
+it, or start it in-process with ``serve()`` (``benchmark_wallet --gateway
+fake`` does).
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import requests
+
+from . import webhooks
+
+logger = logging.getLogger(__name__)
+
+VERIFY_PATH = re.compile(r'^/transaction/verify/(?P<reference>[^/]+)$')
+
+
+class Latency:
+    """
+    A latency distribution in milliseconds, parsed from a spec such as
+    ``0``, ``fixed:40``, ``uniform:20,200``, ``normal:80,20`` or
+    ``lognormal:60,0.5`` (median and sigma, for a realistic long tail).
+    """
+    KINDS = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+
+    def __init__(self, spec='0'):
+        kind, _, params = str(spec).partition(':')
+        if not params:
+            kind, params = 'fixed', kind
+        try:
+            values = [float(value) for value in params.split(',')]
+        except ValueError:
+            raise ValueError(f'Bad latency spec {spec!r}')
+        if kind not in self.KINDS or len(values) != self.KINDS[kind]:
+            raise ValueError(f'Bad latency spec {spec!r}: use fixed:MS, uniform:LO,HI, normal:MEAN,SD or lognormal:MEDIAN,SIGMA')
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng):
+        """One delay in seconds."""
+        if self.kind == 'fixed':
+            ms = self.values[0]
+        elif self.kind == 'uniform':
+            ms = rng.uniform(*self.values)
+        elif self.kind == 'normal':
+            ms = rng.gauss(*self.values)
+        else:
+            median, sigma = self.values
+            ms = median * rng.lognormvariate(0, sigma)
+        return max(ms, 0) / 1000
+
+    def __str__(self):
+        return str(self.spec)
+
+
+class FakePaystack:
+    def __init__(self, latency='0', error_rate=0.0, timeout_rate=0.0, timeout=30.0, abandon_rate=0.0,
+                 webhook_url=None, webhook_delay=0.5, secret_key=None, seed=None):
+        self.latency = latency if isinstance(latency, Latency) else Latency(latency)
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        self.abandon_rate = abandon_rate
+        self.webhook_url = webhook_url
+        self.webhook_delay = webhook_delay
+        self.secret_key = secret_key
+        self.payments = {}
+        self.counts = {'initialize': 0, 'verify': 0, 'errors': 0, 'timeouts': 0, 'webhooks': 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            return self._rng.random(), self._rng.random(), self.latency.sample(self._rng)
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def __call__(self, environ, start_response):
+        fault, _, delay = self._draw()
+        time.sleep(delay)
+        if fault < self.timeout_rate:
+            self._count('timeouts')
+            time.sleep(self.timeout)
+        elif fault < self.timeout_rate + self.error_rate:
+            self._count('errors')
+            return self._respond(start_response, '500 Internal Server Error',
+                                 {'status': False, 'message': 'Internal server error'})
+
+        if not environ.get('HTTP_AUTHORIZATION', '').startswith('Bearer '):
+            return self._respond(start_response, '401 Unauthorized',
+                                 {'status': False, 'message': 'No Authorization Header was found'})
+
+        method, path = environ['REQUEST_METHOD'], environ.get('PATH_INFO', '')
+        if method == 'POST' and path == '/transaction/initialize':
+            return self._initialize(environ, start_response)
+        match = VERIFY_PATH.match(path)
+        if method == 'GET' and match:
+            return self._verify(match.group('reference'), start_response)
+        return self._respond(start_response, '404 Not Found', {'status': False, 'message': 'Not found'})
+
+    def _initialize(self, environ, start_response):
+        self._count('initialize')
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            body = json.loads(environ['wsgi.input'].read(length) or b'{}')
+            reference, amount = body['reference'], int(body['amount'])
+        except (KeyError, TypeError, ValueError):
+            return self._respond(start_response, '400 Bad Request', {'status': False, 'message': 'Invalid body'})
+
+        _, abandon, _ = self._draw()
+        state = 'abandoned' if abandon < self.abandon_rate else 'success'
+        with self._lock:
+            self.payments[reference] = {'amount': amount, 'email': body.get('email'), 'status': state}
+        if state == 'success' and self.webhook_url:
+            timer = threading.Timer(self.webhook_delay, self._deliver_webhook, args=(reference,))
+            timer.daemon = True
+            timer.start()
+        return self._respond(start_response, '200 OK', {
+            'status': True,
+            'message': 'Authorization URL created',
+            'data': {
+                'authorization_url': f'https://checkout.invalid/{reference}',
+                'access_code': reference,
+                'reference': reference,
+            },
+        })
+
+    def _verify(self, reference, start_response):
+        self._count('verify')
+        with self._lock:
+            payment = self.payments.get(reference)
+        if payment is None:
+            return self._respond(start_response, '400 Bad Request',
+                                 {'status': False, 'message': 'Transaction reference not found'})
+        return self._respond(start_response, '200 OK', {
+            'status': True,
+            'message': 'Verification successful',
+            'data': {'status': payment['status'], 'amount': payment['amount'], 'reference': reference},
+        })
+
+    def _deliver_webhook(self, reference):
+        with self._lock:
+            payment = self.payments[reference]
+        body = json.dumps({'event': 'charge.success', 'data': {
+            'status': 'success',
+            'reference': reference,
+            'amount': payment['amount'],
+            'customer': {'email': payment['email']},
+        }}).encode()
+        try:
+            requests.post(self.webhook_url, data=body, timeout=10, headers={
+                'Content-Type': 'application/json',
+                webhooks.SIGNATURE_HEADER: webhooks.sign(body, self.secret_key),
+            })
+            self._count('webhooks')
+        except requests.RequestException as e:
+            logger.warning(f"Fake Paystack could not deliver webhook for {reference}: {e}")
+
+    def _respond(self, start_response, status_line, payload):
+        body = json.dumps(payload).encode()
+        start_response(status_line, [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    # Load tests open many connections at once.
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(app, host='127.0.0.1', port=0):
+    """
+    Serve ``app`` from a background thread. Returns ``(server, base_url)``;
+    call ``server.shutdown()`` to stop it. Port 0 picks a free port.
+    """
+    server = make_server(host, port, app, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, name='fake-paystack', daemon=True)
+    thread.start()
+    return server, f'http://{host}:{server.server_port}'
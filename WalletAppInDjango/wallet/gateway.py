@@ -0,0 +1,400 @@
+"""
+Paystack client used for all gateway I/O.
+
+``get_client()`` returns this process's client, built from the dotted path in
+``PAYSTACK_GATEWAY``. The default ``PaystackClient`` keeps one
+``requests.Session`` whose adapter pools keep-alive connections, so a call
+normally reuses an open TLS connection instead of handshaking again. Every
+call has connect and read timeouts (``PAYSTACK_CONNECT_TIMEOUT``,
+``PAYSTACK_READ_TIMEOUT``), so a slow gateway can't hold a worker
+indefinitely.
+
+Retries are bounded (``PAYSTACK_MAX_RETRIES``) with jittered exponential
+backoff. A connection that could not be established is retried for every
+call. Read timeouts and 429/5xx answers are only retried for ``verify``:
+replaying an ``initialize`` whose request may already have reached Paystack
+isn't safe.
+
+Every call, whichever client is in use, passes two guards first. A
+``Bulkhead`` caps concurrent calls per process (``PAYSTACK_MAX_CONCURRENCY``),
+so a slow gateway can't occupy every worker thread while dashboard reads
+queue behind it. A ``CircuitBreaker`` stops calling after repeated failures
+and probes again later. Refused calls raise ``GatewayUnavailable`` straight
+away; the views answer 503 with ``Retry-After``.
+
+Point ``PAYSTACK_GATEWAY`` at ``wallet.gateway.StubPaystack`` to run without
+the network (tests, benchmarks, local development). Latency and error counts
+per operation are kept in ``metrics``, whichever client is in use.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GATEWAY = 'wallet.gateway.PaystackClient'
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class GatewayError(Exception):
+    """Paystack could not be reached or did not answer in time."""
+
+
+class GatewayUnavailable(GatewayError):
+    """The call was refused before reaching Paystack; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(GatewayUnavailable):
+    pass
+
+
+class GatewayBusy(GatewayUnavailable):
+    pass
+
+
+class GatewayMetrics:
+    """Per-operation call counts, errors and recent latencies (milliseconds)."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = defaultdict(int)
+            self.errors = defaultdict(int)
+            self.latencies = defaultdict(lambda: deque(maxlen=self.window))
+            self.rejected = defaultdict(int)
+
+    def reject(self, operation, reason):
+        with self._lock:
+            self.rejected[f'{operation}:{reason}'] += 1
+
+    def record(self, operation, elapsed_ms, ok):
+        with self._lock:
+            self.calls[operation] += 1
+            if not ok:
+                self.errors[operation] += 1
+            self.latencies[operation].append(elapsed_ms)
+
+    def snapshot(self):
+        """``{operation: {calls, errors, p50_ms, p95_ms, max_ms}}`` over the recent window."""
+        with self._lock:
+            result = {}
+            for operation, calls in self.calls.items():
+                ordered = sorted(self.latencies[operation])
+                result[operation] = {
+                    'calls': calls,
+                    'errors': self.errors[operation],
+                    'p50_ms': round(ordered[len(ordered) // 2], 2),
+                    'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+                    'max_ms': round(ordered[-1], 2),
+                }
+            if self.rejected:
+                result['rejected'] = dict(self.rejected)
+            return result
+
+
+metrics = GatewayMetrics()
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing gateway for a while.
+
+    Closed: calls go through and consecutive failures are counted. After
+    ``failure_threshold`` of them the breaker opens and every call is refused
+    for ``reset_timeout`` seconds. Then it goes half-open and lets up to
+    ``half_open_calls`` probe calls through: a success closes it, a failure
+    opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_calls=1, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probes = 0
+        self.transitions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _move(self, state):
+        if state != self.state:
+            self.transitions[f'{self.state}->{state}'] += 1
+            logger.warning(f"Paystack circuit breaker {self.state} -> {state}")
+            self.state = state
+
+    def before_call(self):
+        """Claim permission to call; raises ``CircuitOpen`` if the breaker refuses."""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - self.clock()
+                if remaining > 0:
+                    raise CircuitOpen('Payment gateway is unavailable, please retry shortly', retry_after=remaining)
+                self._move(self.HALF_OPEN)
+                self.probes = 0
+            if self.state == self.HALF_OPEN:
+                if self.probes >= self.half_open_calls:
+                    raise CircuitOpen('Payment gateway is recovering, please retry shortly',
+                                      retry_after=self.reset_timeout)
+                self.probes += 1
+
+    def on_success(self):
+        with self._lock:
+            self.failures = 0
+            self._move(self.CLOSED)
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self._move(self.OPEN)
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'transitions': dict(self.transitions)}
+
+
+class Bulkhead:
+    """
+    Caps concurrent gateway calls in this process, so a slow gateway ties up
+    at most ``limit`` worker threads. Callers over the limit wait up to
+    ``wait`` seconds for a slot, then get ``GatewayBusy``.
+    """
+
+    def __init__(self, limit=10, wait=0.0):
+        self.limit = limit
+        self.wait = wait
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        acquired = self._slots.acquire(timeout=self.wait) if self.wait else self._slots.acquire(blocking=False)
+        if not acquired:
+            raise GatewayBusy('Payment gateway is busy, please retry shortly', retry_after=1)
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def snapshot(self):
+        with self._lock:
+            return {'limit': self.limit, 'in_flight': self.in_flight}
+
+
+class BaseGateway:
+    """The gateway interface; ``_call`` guards each operation and times it into ``metrics``."""
+
+    def initialize(self, email, amount, reference, callback_url):
+        """Start a payment of ``amount`` (a ``Money``). Returns Paystack's JSON answer."""
+        raise NotImplementedError
+
+    def verify(self, reference):
+        """Look up a payment by reference. Returns Paystack's JSON answer."""
+        raise NotImplementedError
+
+    def _call(self, operation, func, *args, **kwargs):
+        breaker, bulkhead = get_guards()
+        try:
+            bulkhead.acquire()
+            try:
+                breaker.before_call()
+            except CircuitOpen:
+                bulkhead.release()
+                raise
+        except GatewayUnavailable as e:
+            metrics.reject(operation, 'busy' if isinstance(e, GatewayBusy) else 'circuit_open')
+            raise
+
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = func(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            bulkhead.release()
+            (breaker.on_success if ok else breaker.on_failure)()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.record(operation, elapsed_ms, ok)
+            if not ok:
+                logger.warning(f"Paystack {operation} failed after {elapsed_ms:.0f}ms")
+
+
+class PaystackClient(BaseGateway):
+    def __init__(self, secret_key=None, base_url=None):
+        self.secret_key = secret_key or settings.PAYSTACK_SECRET_KEY
+        self.base_url = (base_url or _setting('PAYSTACK_BASE_URL', 'https://api.paystack.co')).rstrip('/')
+        self.timeout = (
+            _setting('PAYSTACK_CONNECT_TIMEOUT', 3.05),
+            _setting('PAYSTACK_READ_TIMEOUT', 10),
+        )
+        self.session = self._session()
+
+    def _session(self):
+        retries = _setting('PAYSTACK_MAX_RETRIES', 2)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            status_forcelist=RETRY_STATUSES,
+            # Read and status retries only; refused connections are retried for POST too.
+            allowed_methods=frozenset({'GET'}),
+            backoff_factor=_setting('PAYSTACK_RETRY_BACKOFF', 0.3),
+            backoff_jitter=_setting('PAYSTACK_RETRY_JITTER', 0.3),
+            raise_on_status=False,
+        )
+        pool_size = _setting('PAYSTACK_POOL_SIZE', 10)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Authorization'] = f'Bearer {self.secret_key}'
+        return session
+
+    def _request(self, method, path, **kwargs):
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+            if response.status_code >= 500:
+                raise GatewayError(f'Payment gateway error: HTTP {response.status_code}')
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GatewayError(f'Payment gateway error: {e}') from e
+
+    def initialize(self, email, amount, reference, callback_url):
+        return self._call('initialize', self._request, 'POST', '/transaction/initialize', json={
+            'amount': amount.kobo,
+            'reference': reference,
+            'email': email,
+            'callback_url': callback_url,
+        })
+
+    def verify(self, reference):
+        return self._call('verify', self._request, 'GET', f'/transaction/verify/{reference}')
+
+    def close(self):
+        self.session.close()
+
+
+class StubPaystack(BaseGateway):
+    """In-memory gateway: every initialized payment verifies as successful."""
+
+    def __init__(self):
+        self.amounts = {}
+        self._lock = threading.Lock()
+
+    def _initialize(self, email, amount, reference, callback_url):
+        with self._lock:
+            self.amounts[reference] = amount.kobo
+        return {'status': True, 'data': {
+            'authorization_url': f'https://checkout.invalid/{reference}',
+            'access_code': reference,
+            'reference': reference,
+        }}
+
+    def _verify(self, reference):
+        with self._lock:
+            amount = self.amounts.get(reference)
+        if amount is None:
+            return {'status': False, 'message': 'Transaction reference not found'}
+        return {'status': True, 'data': {'status': 'success', 'amount': amount, 'reference': reference}}
+
+    def initialize(self, email, amount, reference, callback_url):
+        return self._call('initialize', self._initialize, email, amount, reference, callback_url)
+
+    def verify(self, reference):
+        return self._call('verify', self._verify, reference)
+
+    def close(self):
+        pass
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """This process's gateway client, built on first use."""
+    global _client
+    # A forked child must not share the parent's pooled sockets.
+    if _client is None or _client[0] != os.getpid():
+        with _client_lock:
+            if _client is None or _client[0] != os.getpid():
+                gateway_class = import_string(_setting('PAYSTACK_GATEWAY', DEFAULT_GATEWAY))
+                _client = (os.getpid(), gateway_class())
+    return _client[1]
+
+
+_guards = None
+
+
+def get_guards():
+    """This process's ``(CircuitBreaker, Bulkhead)`` pair, shared by every gateway call."""
+    global _guards
+    if _guards is None or _guards[0] != os.getpid():
+        with _client_lock:
+            if _guards is None or _guards[0] != os.getpid():
+                breaker = CircuitBreaker(
+                    failure_threshold=_setting('PAYSTACK_BREAKER_FAILURES', 5),
+                    reset_timeout=_setting('PAYSTACK_BREAKER_RESET_SECONDS', 30),
+                    half_open_calls=_setting('PAYSTACK_BREAKER_PROBES', 1),
+                )
+                bulkhead = Bulkhead(
+                    limit=_setting('PAYSTACK_MAX_CONCURRENCY', 10),
+                    wait=_setting('PAYSTACK_BULKHEAD_WAIT', 0),
+                )
+                _guards = (os.getpid(), breaker, bulkhead)
+    return _guards[1], _guards[2]
+
+
+def guard_status():
+    """Breaker and bulkhead state for this process, for dashboards and health checks."""
+    breaker, bulkhead = get_guards()
+    return {'breaker': breaker.snapshot(), 'bulkhead': bulkhead.snapshot()}
+
+
+def reset_client():
+    """Drop the current client and guards; the next call builds new ones."""
+    global _client, _guards
+    with _client_lock:
+        previous, _client = _client, None
+        _guards = None
+    if previous is not None and previous[0] == os.getpid():
+        previous[1].close()
+
+
+@receiver(setting_changed)
+def _gateway_setting_changed(setting, **kwargs):
+    if setting.startswith('PAYSTACK_'):
+        reset_client()
@@ -0,0 +1,135 @@
+"""
+``Idempotency-Key`` support for the money-moving wallet endpoints.
+
+Clients (mostly the mobile app) retry on timeouts. When a request carries an
+``Idempotency-Key`` header, the first request claims the key by inserting an
+``IdempotencyKey`` row, runs the handler and stores the response. A retry with
+the same key and body is answered from that row without running the handler,
+so it cannot create another deposit intent or move money twice.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _claim(user, endpoint, key, request_hash):
+    """Insert the key row; returns ``None`` if another request already holds the key."""
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user=user,
+                endpoint=endpoint,
+                key=key,
+                request_hash=request_hash,
+                expires_at=timezone.now() + _ttl(),
+            )
+    except IntegrityError:
+        return None
+
+
+def _replay(record, request_hash):
+    if record.request_hash != request_hash:
+        return Response(
+            {"message": f"{HEADER} has already been used with a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return Response(
+            {"message": "A request with this Idempotency-Key is still being processed"},
+            status=status.HTTP_409_CONFLICT,
+        )
+    response = Response(json.loads(record.response_body), status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Make a DRF function view honour the ``Idempotency-Key`` header.
+
+    Apply it below ``@api_view`` so it receives the DRF request. Requests
+    without the header are passed straight through. Responses with a 5xx
+    status are not stored, so the client can retry them.
+    """
+    endpoint = view.__name__
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"message": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        request_hash = _fingerprint(request)
+        record = _claim(request.user, endpoint, key, request_hash)
+        if record is None:
+            existing = IdempotencyKey.objects.filter(user=request.user, endpoint=endpoint, key=key).first()
+            if existing is not None and existing.expires_at > timezone.now():
+                return _replay(existing, request_hash)
+            # The old row expired (or was purged) between our insert and the
+            # lookup: evict it and claim the key afresh.
+            IdempotencyKey.objects.filter(user=request.user, endpoint=endpoint, key=key,
+                                          expires_at__lte=timezone.now()).delete()
+            record = _claim(request.user, endpoint, key, request_hash)
+            if record is None:
+                return Response(
+                    {"message": "A request with this Idempotency-Key is still being processed"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500 or getattr(response, 'data', None) is None:
+            record.delete()
+            return response
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status_code=response.status_code,
+            response_body=json.dumps(response.data, cls=DjangoJSONEncoder, separators=(',', ':')),
+        )
+        return response
+
+    return wrapper
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys in batches; returns how many rows were removed."""
+    removed = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
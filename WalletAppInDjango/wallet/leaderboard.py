@@ -0,0 +1,103 @@
+"""
+Per-user transaction volume and the top-users leaderboard.
+
+"Top users by volume" used to be computed by summing each user's sent and
+received transactions, one user at a time. ``UserVolumeStats`` keeps those
+sums instead: ``record`` adds new transactions to their sender's and
+receiver's totals in the same database transaction that writes them, and
+``top`` reads the first rows of the index on ``volume``. A user's volume is
+everything they have sent or received, deposit intents included, as before.
+
+Stats rows are updated after the ledger has locked the same users' wallets
+in id order, so two postings never take the stats locks in opposite orders.
+``rebuild`` recomputes the totals from the transaction table, for the
+backfill and to correct drift; like the rollups, transactions committed
+while it runs can be missed.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, F, Sum, Value, When
+
+from . import ledger
+from .models import Transaction, UserVolumeStats
+from .money import ZERO, Money
+
+SENT, RECEIVED, COUNT = range(3)
+
+
+def _changes(journals):
+    changes = defaultdict(lambda: [0, 0, 0])
+    for journal in journals:
+        kobo = journal.amount.kobo
+        if journal.sender_id:
+            changes[journal.sender_id][SENT] += kobo
+        if journal.receiver_id:
+            changes[journal.receiver_id][RECEIVED] += kobo
+        for user_id in {journal.sender_id, journal.receiver_id} - {None}:
+            changes[user_id][COUNT] += 1
+    return changes
+
+
+def _increment(chunk, changes, index):
+    return Case(
+        *[When(user_id=user_id, then=Value(index(changes[user_id]))) for user_id in chunk],
+        default=Value(0),
+        output_field=BigIntegerField(),
+    )
+
+
+def _apply(changes):
+    # Each row costs the IN list entry and four WHEN pairs.
+    for chunk in ledger.batches(sorted(changes), params_per_row=9):
+        rows = UserVolumeStats.objects.filter(user_id__in=chunk)
+        updates = dict(
+            sent=F('sent') + _increment(chunk, changes, lambda change: change[SENT]),
+            received=F('received') + _increment(chunk, changes, lambda change: change[RECEIVED]),
+            volume=F('volume') + _increment(chunk, changes, lambda change: change[SENT] + change[RECEIVED]),
+            transaction_count=F('transaction_count') + _increment(chunk, changes, lambda change: change[COUNT]),
+        )
+        if rows.update(**updates) == len(chunk):
+            continue
+        # Someone's first transaction: open their row, then add to it. The
+        # update above may have covered some users of the chunk already.
+        existing = set(rows.values_list('user_id', flat=True))
+        missing = [user_id for user_id in chunk if user_id not in existing]
+        UserVolumeStats.objects.bulk_create([UserVolumeStats(user_id=user_id) for user_id in missing], ignore_conflicts=True)
+        UserVolumeStats.objects.filter(user_id__in=missing).update(**updates)
+
+
+def record(journals):
+    """Add newly created ``journals`` to their users' totals. Call in the transaction that created them."""
+    changes = _changes(journals)
+    if changes:
+        _apply(changes)
+
+
+def top(limit=10):
+    """The ``limit`` users with the highest volume, as ``UserVolumeStats`` with ``user`` loaded. One query."""
+    return list(
+        UserVolumeStats.objects.select_related('user').filter(volume__gt=ZERO).order_by('-volume', 'user_id')[:limit]
+    )
+
+
+def rebuild():
+    """Recompute every user's totals from the transaction table. Returns the number of users with any."""
+    totals = defaultdict(lambda: [0, 0, 0])
+    for column, index in (('sender_id', SENT), ('receiver_id', RECEIVED)):
+        grouped = Transaction.objects.filter(**{f'{column}__isnull': False}).values(column).annotate(
+            total=Sum('amount'), journals=Count('pk'),
+        ).order_by()
+        for row in grouped:
+            totals[row[column]][index] += row['total'].kobo
+            totals[row[column]][COUNT] += row['journals']
+    with transaction.atomic():
+        UserVolumeStats.objects.all().delete()
+        UserVolumeStats.objects.bulk_create([
+            UserVolumeStats(
+                user_id=user_id, sent=Money(sent), received=Money(received), volume=Money(sent + received),
+                transaction_count=count,
+            )
+            for user_id, (sent, received, count) in totals.items()
+        ], batch_size=1000)
+    return len(totals)
@@ -0,0 +1,378 @@
+"""
+Double-entry ledger for wallet money movements.
+
+Every movement is one journal: a ``Transaction`` header plus balanced
+``LedgerEntry`` legs. Wallet legs follow liability conventions, so a credit
+raises the wallet balance and a debit lowers it. ``Wallet.balance`` is kept as
+a materialised projection of those legs and is written in the same database
+transaction as the entries, so readers never have to re-sum history.
+
+Balance updates are conditional ``UPDATE`` statements applied in wallet id
+order: debits only succeed while the balance covers them, and two journals
+touching the same wallets always lock the rows in the same sequence.
+
+Every update of ``Wallet.balance`` also bumps ``Wallet.balance_version``, and
+``post_many`` hands the new values to ``wallet.balance_cache`` once the
+transaction commits.
+
+Wallets with ``balance_shard_count`` set (the platform fee wallet) take
+credits on one of their ``WalletBalanceShard`` rows instead of the wallet row,
+so a flood of credits does not queue on a single row lock.
+"""
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+
+from . import balance_cache, counters
+from .models import LedgerEntry, Wallet, WalletBalanceShard
+from .money import ZERO, Money
+
+
+MAX_BATCH_ROWS = 2000
+
+
+def _moved(delta_kobo):
+    """``UPDATE`` arguments that change a wallet's balance and bump its version."""
+    return {'balance': F('balance') + delta_kobo, 'balance_version': F('balance_version') + 1}
+
+
+class LedgerError(Exception):
+    """Base class for ledger posting failures."""
+
+
+class UnbalancedJournal(LedgerError):
+    pass
+
+
+class InsufficientFunds(LedgerError):
+    pass
+
+
+class WalletNotFound(LedgerError):
+    pass
+
+
+@dataclass(frozen=True)
+class Leg:
+    side: str
+    amount: Money
+    wallet_id: int = None
+    account: str = LedgerEntry.WALLET
+
+    @property
+    def delta(self):
+        """Signed change this leg makes to its wallet's balance."""
+        return self.amount if self.side == LedgerEntry.CREDIT else -self.amount
+
+
+def debit(wallet_id, amount):
+    return Leg(LedgerEntry.DEBIT, Money.from_naira(amount), wallet_id)
+
+
+def credit(wallet_id, amount):
+    return Leg(LedgerEntry.CREDIT, Money.from_naira(amount), wallet_id)
+
+
+def gateway_debit(amount):
+    """Money arriving from the payment gateway (the other side of a deposit)."""
+    return Leg(LedgerEntry.DEBIT, Money.from_naira(amount), account=LedgerEntry.GATEWAY)
+
+
+def gateway_credit(amount):
+    """Money paid out through the payment gateway (the other side of a withdrawal)."""
+    return Leg(LedgerEntry.CREDIT, Money.from_naira(amount), account=LedgerEntry.GATEWAY)
+
+
+_shard_cache = {'expires': 0.0, 'counts': {}}
+_shard_cache_lock = threading.Lock()
+
+
+def sharded_wallets():
+    """
+    Return ``{wallet_id: shard_count}`` for wallets with sharded balances.
+
+    Cached per process for ``BALANCE_SHARD_CACHE_SECONDS`` so ordinary
+    postings do not pay an extra query. A stale entry is harmless: shard
+    credits re-check the wallet's setting in the ``UPDATE`` itself.
+    """
+    now = time.monotonic()
+    if now >= _shard_cache['expires']:
+        with _shard_cache_lock:
+            if now >= _shard_cache['expires']:
+                _shard_cache['counts'] = dict(
+                    Wallet.objects.filter(balance_shard_count__gt=0).values_list('pk', 'balance_shard_count')
+                )
+                _shard_cache['expires'] = now + getattr(settings, 'BALANCE_SHARD_CACHE_SECONDS', 30)
+    return _shard_cache['counts']
+
+
+def invalidate_shard_cache():
+    _shard_cache['expires'] = 0.0
+
+
+def credit_shard(wallet_id, amount, shard_count):
+    """Credit a random shard; returns ``False`` if the wallet is no longer sharded."""
+    updated = WalletBalanceShard.objects.filter(
+        wallet_id=wallet_id,
+        shard=random.randrange(shard_count),
+        wallet__balance_shard_count__gt=0,
+    ).update(balance=F('balance') + amount.kobo)
+    return bool(updated)
+
+
+def fold_shards(wallet_id):
+    """
+    Move everything parked on a wallet's shards into ``Wallet.balance``.
+
+    Returns the amount moved. Must run inside a transaction.
+    """
+    shards = list(
+        WalletBalanceShard.objects.select_for_update()
+        .filter(wallet_id=wallet_id, balance__gt=0)
+        .order_by('shard')
+        .values_list('pk', 'balance')
+    )
+    total = sum((balance for _, balance in shards), ZERO)
+    if total:
+        WalletBalanceShard.objects.filter(pk__in=[pk for pk, _ in shards]).update(balance=ZERO)
+        Wallet.objects.filter(pk=wallet_id).update(**_moved(total.kobo))
+    return total
+
+
+def debit_wallet(wallet_id, amount):
+    """Take ``amount`` from a wallet's projection, failing instead of going negative."""
+    updated = Wallet.objects.filter(pk=wallet_id, balance__gte=amount).update(**_moved(-amount.kobo))
+    if not updated and wallet_id in sharded_wallets():
+        # The wallet row alone may not cover it while credits sit on shards.
+        with db_transaction.atomic():
+            fold_shards(wallet_id)
+        updated = Wallet.objects.filter(pk=wallet_id, balance__gte=amount).update(**_moved(-amount.kobo))
+    if not updated:
+        raise InsufficientFunds('Insufficient funds')
+
+
+def credit_wallet(wallet_id, amount):
+    """Add ``amount`` to a wallet's projection."""
+    shard_count = sharded_wallets().get(wallet_id)
+    if shard_count and credit_shard(wallet_id, amount, shard_count):
+        return
+    updated = Wallet.objects.filter(pk=wallet_id).update(**_moved(amount.kobo))
+    if not updated:
+        raise WalletNotFound('Wallet does not exist')
+
+
+def batches(items, params_per_row=1):
+    """
+    Split ``items`` into lists small enough for one statement each.
+
+    SQLite caps the number of bound parameters per query; elsewhere batches
+    are capped at ``MAX_BATCH_ROWS`` to keep statements a reasonable size.
+    """
+    items = list(items)
+    max_params = connection.features.max_query_params
+    size = min(MAX_BATCH_ROWS, max(1, max_params // params_per_row - 1)) if max_params else MAX_BATCH_ROWS
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def bulk_credit_wallets(changes):
+    """
+    Credit many wallets with one ``UPDATE ... SET balance = balance + CASE ...``
+    per chunk instead of one statement per wallet.
+    """
+    # Each row costs three parameters: the IN list entry and the WHEN pair.
+    for chunk in batches(sorted(changes), params_per_row=3):
+        increment = Case(
+            *[When(pk=wallet_id, then=Value(changes[wallet_id].kobo)) for wallet_id in chunk],
+            output_field=BigIntegerField(),
+        )
+        updated = Wallet.objects.filter(pk__in=chunk).update(**_moved(increment))
+        if updated != len(chunk):
+            raise WalletNotFound('Wallet does not exist')
+
+
+def lock_wallets(wallet_ids):
+    """Take row locks on ``wallet_ids`` in ascending id order."""
+    for chunk in batches(sorted(wallet_ids)):
+        list(Wallet.objects.select_for_update().filter(pk__in=chunk).order_by('pk').values_list('pk', flat=True))
+
+
+def apply_balance_changes(changes):
+    """Apply ``{wallet_id: delta}`` to the balance projection in wallet id order."""
+    if len(changes) <= 2:
+        for wallet_id in sorted(changes):
+            delta = changes[wallet_id]
+            if delta < 0:
+                debit_wallet(wallet_id, -delta)
+            elif delta > 0:
+                credit_wallet(wallet_id, delta)
+        return
+
+    # Fan-out journals: lock every row up front in id order, then debit the
+    # (usually single) payer and credit all payees in batched statements.
+    lock_wallets(changes)
+    sharded = sharded_wallets()
+    credits = {}
+    for wallet_id in sorted(changes):
+        delta = changes[wallet_id]
+        if delta < 0:
+            debit_wallet(wallet_id, -delta)
+        elif delta > 0 and wallet_id in sharded:
+            credit_wallet(wallet_id, delta)
+        elif delta > 0:
+            credits[wallet_id] = delta
+    bulk_credit_wallets(credits)
+
+
+def read_balances(wallet_ids):
+    """Return ``{wallet_id: (balance_version, balance)}`` for ``wallet_ids``."""
+    balances = {}
+    for chunk in batches(wallet_ids):
+        for wallet_id, version, balance in Wallet.objects.filter(pk__in=chunk).values_list(
+            'pk', 'balance_version', 'balance'
+        ):
+            balances[wallet_id] = (version, balance)
+    return balances
+
+
+def held_balances(balances):
+    """
+    ``{wallet_id: balance}`` from ``read_balances`` output, with what sharded
+    wallets have parked on their shards added back.
+    """
+    held = {wallet_id: balance for wallet_id, (_, balance) in balances.items()}
+    sharded = [wallet_id for wallet_id in held if wallet_id in sharded_wallets()]
+    if sharded:
+        rows = WalletBalanceShard.objects.filter(wallet_id__in=sharded).values('wallet_id').annotate(total=Sum('balance'))
+        for row in rows:
+            held[row['wallet_id']] += row['total'] or ZERO
+    return held
+
+
+def _validate(legs):
+    if not legs:
+        raise UnbalancedJournal('A journal needs at least one debit and one credit')
+    debits = credits = ZERO
+    for leg in legs:
+        if leg.amount <= 0:
+            raise UnbalancedJournal('Ledger amounts must be positive')
+        if (leg.account == LedgerEntry.WALLET) != (leg.wallet_id is not None):
+            raise UnbalancedJournal('Only wallet legs may reference a wallet')
+        if leg.side == LedgerEntry.DEBIT:
+            debits += leg.amount
+        else:
+            credits += leg.amount
+    if debits != credits or not debits:
+        raise UnbalancedJournal(f'Journal does not balance: debits {debits} != credits {credits}')
+
+
+def post(journal, legs):
+    """
+    Write ``legs`` against the ``journal`` transaction and update balances.
+
+    Raises ``InsufficientFunds`` (with nothing written) if a wallet debit is not
+    covered. Must be called with the journal already saved. Returns the new
+    balances like ``post_many``.
+    """
+    return post_many([(journal, legs)])
+
+
+def post_many(journals):
+    """
+    Post several ``(journal, legs)`` pairs as one unit.
+
+    Each journal must balance on its own. Balance changes are netted per
+    wallet first, so a payer funding many journals is debited once. Returns
+    ``{wallet_id: balance}`` for every wallet touched, as of the posting.
+    """
+    changes = {}
+    entries = []
+    for journal, legs in journals:
+        _validate(legs)
+        for leg in legs:
+            if leg.wallet_id is not None:
+                changes[leg.wallet_id] = changes.get(leg.wallet_id, ZERO) + leg.delta
+            entries.append(LedgerEntry(
+                transaction_id=journal.pk,
+                account=leg.account,
+                wallet_id=leg.wallet_id,
+                side=leg.side,
+                amount=leg.amount,
+            ))
+
+    with db_transaction.atomic():
+        apply_balance_changes(changes)
+        LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+        # Still holding the row locks, so these are exactly our results.
+        balances = read_balances(changes)
+        balance_cache.write_through(balances)
+        counters.record_balances(changes, held_balances(balances))
+    return {wallet_id: balance for wallet_id, (_, balance) in balances.items()}
+
+
+def wallet_ledger_balances():
+    """Return ``{wallet_id: balance}`` computed from the ledger entries alone."""
+    balances = {}
+    rows = (
+        LedgerEntry.objects.filter(account=LedgerEntry.WALLET)
+        .values('wallet_id', 'side')
+        .annotate(total=Sum('amount'))
+    )
+    for row in rows:
+        total = row['total'] or ZERO
+        signed = total if row['side'] == LedgerEntry.CREDIT else -total
+        balances[row['wallet_id']] = balances.get(row['wallet_id'], ZERO) + signed
+    return balances
+
+
+def wallet_balances():
+    """Return ``{wallet_id: balance}`` from the projection, shard balances included."""
+    balances = dict(Wallet.objects.values_list('pk', 'balance'))
+    rows = WalletBalanceShard.objects.values('wallet_id').annotate(total=Sum('balance'))
+    for row in rows:
+        balances[row['wallet_id']] = balances.get(row['wallet_id'], ZERO) + (row['total'] or ZERO)
+    return balances
+
+
+def enable_shards(wallet, shard_count):
+    """Spread future credits to ``wallet`` across ``shard_count`` shard rows."""
+    with db_transaction.atomic():
+        existing = set(wallet.balance_shards.values_list('shard', flat=True))
+        WalletBalanceShard.objects.bulk_create([
+            WalletBalanceShard(wallet=wallet, shard=shard)
+            for shard in range(shard_count) if shard not in existing
+        ])
+        Wallet.objects.filter(pk=wallet.pk).update(balance_shard_count=shard_count)
+    wallet.balance_shard_count = shard_count
+    invalidate_shard_cache()
+    # Shard credits don't bump the wallet's version, so stop caching it. Other
+    # processes notice within BALANCE_SHARD_CACHE_SECONDS.
+    balance_cache.forget([wallet.pk])
+
+
+def disable_shards(wallet):
+    """Stop sharding ``wallet`` and fold what the shards hold back into its balance."""
+    with db_transaction.atomic():
+        Wallet.objects.filter(pk=wallet.pk).update(balance_shard_count=0)
+        fold_shards(wallet.pk)
+    wallet.balance_shard_count = 0
+    invalidate_shard_cache()
+    balance_cache.forget([wallet.pk])
+
+
+def post_opening_balance(wallet, amount):
+    """Record a pre-ledger balance so the projection and the ledger agree."""
+    amount = Money.from_naira(amount)
+    side = LedgerEntry.CREDIT if amount > 0 else LedgerEntry.DEBIT
+    opposite = LedgerEntry.DEBIT if side == LedgerEntry.CREDIT else LedgerEntry.CREDIT
+    amount = abs(amount)
+    LedgerEntry.objects.bulk_create([
+        LedgerEntry(account=LedgerEntry.WALLET, wallet=wallet, side=side, amount=amount),
+        LedgerEntry(account=LedgerEntry.OPENING, side=opposite, amount=amount),
+    ])
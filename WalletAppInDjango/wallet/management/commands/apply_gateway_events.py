@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallet import webhooks
+
+
+class Command(BaseCommand):
+    help = 'Credit deposits from stored Paystack webhook events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new events')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --loop')
+        parser.add_argument('--batch-size', type=int, default=200, help='Events applied per batch')
+        parser.add_argument(
+            '--requeue', action='store_true', help='Put failed events back in the queue before applying',
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            self.stdout.write(f'Requeued {webhooks.requeue()} failed event(s).')
+        while True:
+            counts = webhooks.drain(options['batch_size'])
+            if counts or not options['loop']:
+                summary = ', '.join(f'{count} {outcome}' for outcome, count in sorted(counts.items())) or 'nothing to do'
+                self.stdout.write(self.style.SUCCESS(f'Gateway events: {summary}.'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
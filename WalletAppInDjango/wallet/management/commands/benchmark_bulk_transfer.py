@@ -0,0 +1,85 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from wallet import accounts, ledger
+from wallet.models import Wallet
+from wallet.money import Money
+from wallet.services import bulk_transfer_funds
+
+User = get_user_model()
+
+PHONE_LENGTH = 11
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time bulk transfers of N lines against throwaway wallets (all data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1000, 10000],
+                            help='Batch sizes to benchmark (default: 1000 10000)')
+        parser.add_argument('--amount', type=int, default=1000, help='Naira paid on every line')
+
+    def phone_prefix(self, width):
+        """A random phone prefix leaving ``width`` digits for a counter, that no existing phone starts with."""
+        while True:
+            prefix = '09' + ''.join(random.choices('0123456789', k=PHONE_LENGTH - 2 - width))
+            if not User.objects.filter(phone__startswith=prefix).exists():
+                return prefix
+
+    def seed(self, size, amount):
+        prefix = f'bench{int(time.time() * 1000)}'
+        width = len(str(size))
+        phone_prefix = self.phone_prefix(width)
+        users = User.objects.bulk_create([
+            User(
+                email=f'{prefix}_{i}@bench.local',
+                username=f'{prefix}_{i}',
+                phone=f'{phone_prefix}{i:0{width}d}',
+            )
+            for i in range(size + 1)
+        ], batch_size=1000)
+        users = list(User.objects.filter(email__startswith=f'{prefix}_').order_by('pk'))
+        # Fresh NUBANs, so the seed never clashes with existing wallets; the
+        # reservation is rolled back with everything else.
+        numbers = accounts.get_allocator().allocate_many(len(users))
+        Wallet.objects.bulk_create([
+            Wallet(user=user, account_number=account_number)
+            for user, account_number in zip(users, numbers)
+        ], batch_size=1000)
+        sender = users[0]
+        sender_wallet = Wallet.objects.get(user=sender)
+        funds = Money.from_naira(amount) * size
+        Wallet.objects.filter(pk=sender_wallet.pk).update(balance=funds)
+        ledger.post_opening_balance(sender_wallet, funds)
+        return sender, numbers[1:]
+
+    def handle(self, *args, **options):
+        amount = options['amount']
+        for size in options['lines']:
+            try:
+                with transaction.atomic():
+                    sender, numbers = self.seed(size, amount)
+                    payments = [(account_number, amount) for account_number in numbers]
+
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        result = bulk_transfer_funds(sender, payments)
+                        elapsed = time.perf_counter() - started
+
+                    paid = len(result.succeeded)
+                    self.stdout.write(
+                        f'{size:>6} lines: {elapsed:.3f}s, {paid / elapsed:,.0f} lines/s, '
+                        f'{len(queries)} queries, {len(result.failed)} failed'
+                    )
+                    raise Rollback
+            except Rollback:
+                pass
@@ -0,0 +1,391 @@
+import json
+import math
+import multiprocessing
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max, Sum
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from wallet import balance_cache, counters, gateway, ledger
+from wallet.fake_paystack import FakePaystack, serve
+from wallet.models import LedgerEntry, Transaction, Wallet
+from wallet.money import Money
+
+User = get_user_model()
+
+OPERATIONS = ('transfer', 'fund', 'deposit', 'withdraw')
+DEFAULT_MIX = 'transfer=70,fund=10,deposit=10,withdraw=10'
+AMOUNTS = (1000, 2500, 4000)
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def parse_mix(value):
+    weights = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise CommandError(f'Unknown operation {name!r} in --mix (choose from {", ".join(OPERATIONS)})')
+        try:
+            weights[name] = int(weight or 1)
+        except ValueError:
+            raise CommandError(f'Bad weight {weight!r} for {name} in --mix')
+    if not any(weights.values()):
+        raise CommandError('--mix needs at least one operation with a positive weight')
+    return weights
+
+
+class Worker:
+    """Runs a stream of random operations as one seeded user."""
+
+    def __init__(self, seed, user_ids, accounts, mix, operations):
+        self.rng = random.Random(seed)
+        self.user_ids = user_ids
+        self.accounts = accounts
+        self.mix = mix
+        self.operations = operations
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+
+    def run(self):
+        users = {user.pk: user for user in User.objects.filter(pk__in=self.user_ids)}
+        clients = {}
+        names, weights = zip(*self.mix.items())
+        try:
+            for _ in range(self.operations):
+                operation = self.rng.choices(names, weights)[0]
+                index = self.rng.randrange(len(self.user_ids))
+                user = users[self.user_ids[index]]
+                if user.pk not in clients:
+                    clients[user.pk] = APIClient()
+                    clients[user.pk].force_authenticate(user)
+                self.timed(operation, getattr(self, operation), user, clients[user.pk], index)
+        finally:
+            connection.close()
+        return self
+
+    def timed(self, name, operation, *args):
+        started = time.perf_counter()
+        try:
+            error = operation(*args)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        self.samples[name].append(time.perf_counter() - started)
+        if error:
+            self.errors[name] += 1
+            self.error_samples.setdefault(name, error)
+
+    def transfer(self, user, client, index):
+        target = self.rng.choice([i for i in range(len(self.accounts)) if i != index])
+        response = client.post('/wallet/fund/transfer', {
+            'account_number': self.accounts[target],
+            'amount': self.rng.choice(AMOUNTS),
+        }, format='json')
+        if response.status_code != 200:
+            return f'{response.status_code}: {response.data.get("message")}'
+
+    def fund(self, user, client, index):
+        # Timed as a whole (initialise + verify); the verify leg is also
+        # reported on its own.
+        amount = self.rng.choice(AMOUNTS)
+        response = client.post('/wallet/fund/account', {'amount': amount}, format='json')
+        if response.status_code != 200:
+            return f'fund {response.status_code}: {response.data.get("message")}'
+        started = time.perf_counter()
+        response = client.get('/wallet/fund/verify', {'reference': response.data['reference']})
+        self.samples['verify'].append(time.perf_counter() - started)
+        if response.status_code != 200:
+            return f'verify {response.status_code}: {response.data.get("message")}'
+
+    def deposit(self, user, client, index):
+        amount = Money.from_naira(self.rng.choice(AMOUNTS))
+        wallet = Wallet.objects.get(user=user)
+        if not wallet.deposit(amount):
+            return 'deposit refused'
+
+    def withdraw(self, user, client, index):
+        amount = Money.from_naira(self.rng.choice(AMOUNTS))
+        wallet = Wallet.objects.get(user=user)
+        # Insufficient funds is a legitimate outcome, not an error.
+        wallet.withdraw(amount)
+
+
+def run_threads(seeds, user_ids, accounts, mix, operations):
+    workers = [Worker(seed, user_ids, accounts, mix, operations) for seed in seeds]
+    threads = [threading.Thread(target=worker.run) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [
+        {
+            'samples': dict(worker.samples),
+            'errors': dict(worker.errors),
+            'error_samples': worker.error_samples,
+        }
+        for worker in workers
+    ]
+
+
+def run_workload(gateway_settings, seeds, user_ids, accounts, mix, operations):
+    with override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend',
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        **gateway_settings,
+    ):
+        return run_threads(seeds, user_ids, accounts, mix, operations)
+
+
+def run_process(*args):
+    # Never reuse a database connection inherited across the fork.
+    connections.close_all()
+    return run_workload(*args)
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive transfers, gateway deposits and Wallet.deposit/withdraw against seeded wallets from '
+        'concurrent threads and processes, check the money invariants and write latency stats as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=20, help='Wallets to seed (default: 20)')
+        parser.add_argument('--balance', type=int, default=100000, help='Opening balance per wallet in naira')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per process (default: 8)')
+        parser.add_argument('--processes', type=int, default=0,
+                            help='Worker processes; 0 runs the threads in this process (default: 0)')
+        parser.add_argument('--operations', type=int, default=200, help='Operations per thread (default: 200)')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Operation weights (default: {DEFAULT_MIX})')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--output', default='benchmark_wallet.json', help='Where to write the JSON results')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded users and their history')
+        parser.add_argument('--gateway', choices=['stub', 'fake'], default='stub',
+                            help='stub answers in memory; fake serves a fake Paystack over HTTP with the '
+                                 'latency and faults below, through the real client (default: stub)')
+        parser.add_argument('--gateway-latency', default='lognormal:80,0.5',
+                            help='Fake gateway latency spec in ms (default: lognormal:80,0.5)')
+        parser.add_argument('--gateway-error-rate', type=float, default=0.0, help='Share of fake gateway 500s')
+        parser.add_argument('--gateway-timeout-rate', type=float, default=0.0,
+                            help='Share of fake gateway requests that hang past the read timeout')
+        parser.add_argument('--gateway-read-timeout', type=float, default=2.0,
+                            help='Client read timeout against the fake gateway in seconds (default: 2)')
+
+    def start_gateway(self, options):
+        """Returns ``(fake_server or None, settings for the workers)``."""
+        if options['gateway'] == 'stub':
+            return None, {'PAYSTACK_GATEWAY': 'wallet.gateway.StubPaystack'}
+        app = FakePaystack(
+            latency=options['gateway_latency'],
+            error_rate=options['gateway_error_rate'],
+            timeout_rate=options['gateway_timeout_rate'],
+            timeout=options['gateway_read_timeout'] + 1,
+            seed=options['seed'],
+        )
+        server, url = serve(app)
+        return server, {
+            'PAYSTACK_GATEWAY': 'wallet.gateway.PaystackClient',
+            'PAYSTACK_BASE_URL': url,
+            'PAYSTACK_SECRET_KEY': settings.PAYSTACK_SECRET_KEY or 'sk_benchmark',
+            'PAYSTACK_READ_TIMEOUT': options['gateway_read_timeout'],
+        }
+
+    def gateway_config(self, options):
+        if options['gateway'] == 'stub':
+            return {'kind': 'stub'}
+        return {
+            'kind': 'fake',
+            'latency_ms': options['gateway_latency'],
+            'error_rate': options['gateway_error_rate'],
+            'timeout_rate': options['gateway_timeout_rate'],
+            'read_timeout_s': options['gateway_read_timeout'],
+        }
+
+    def seed(self, count, balance):
+        prefix = f'walletbench{int(time.time() * 1000)}'
+        User.objects.bulk_create([
+            User(email=f'{prefix}_{i}@bench.local', username=f'{prefix}_{i}', phone=f'{i:011d}')
+            for i in range(count)
+        ], batch_size=1000)
+        users = list(User.objects.filter(email__startswith=f'{prefix}_').order_by('pk'))
+        accounts = [f'8{i:09d}' for i in range(count)]
+        Wallet.objects.bulk_create([
+            Wallet(user=user, account_number=account, balance=balance)
+            for user, account in zip(users, accounts)
+        ], batch_size=1000)
+        last_entry = LedgerEntry.objects.aggregate(last=Max('pk'))['last'] or 0
+        for wallet in Wallet.objects.filter(user__in=users):
+            ledger.post_opening_balance(wallet, balance)
+        # The contra legs belong to no wallet or journal, so the cleanup's
+        # cascade would leave them behind.
+        opening_legs = list(LedgerEntry.objects.filter(
+            pk__gt=last_entry, account=LedgerEntry.OPENING, wallet__isnull=True,
+        ).values_list('pk', flat=True))
+        counters.record_users(users)
+        counters.add(**{counters.FUNDED_WALLETS: len(users) if balance > 0 else 0})
+        return prefix, [user.pk for user in users], accounts, opening_legs
+
+    def summarise(self, results, elapsed):
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        error_samples = {}
+        for result in results:
+            for name, values in result['samples'].items():
+                samples[name].extend(values)
+            for name, count in result['errors'].items():
+                errors[name] += count
+            for name, message in result['error_samples'].items():
+                error_samples.setdefault(name, message)
+
+        summary = {}
+        for name in sorted(samples):
+            ordered = sorted(samples[name])
+            summary[name] = {
+                'count': len(ordered),
+                'errors': errors.get(name, 0),
+                'ops_per_sec': round(len(ordered) / elapsed, 2) if elapsed else None,
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+                'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+                'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+                'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3),
+            }
+            if name in error_samples:
+                summary[name]['first_error'] = error_samples[name]
+        return summary
+
+    def check_invariants(self, user_ids, opening_total):
+        # Counted from the database, since a request can fail after its
+        # deposit was settled.
+        funded = Transaction.objects.filter(
+            sender_id__in=user_ids, transaction_type='D', verified__in=[True]
+        ).aggregate(total=Sum('amount'))['total'] or Money(0)
+        withdrawn = Transaction.objects.filter(
+            sender_id__in=user_ids, transaction_type='W', verified__in=[True]
+        ).aggregate(total=Sum('amount'))['total'] or Money(0)
+
+        wallet_ids = list(Wallet.objects.filter(user_id__in=user_ids).values_list('pk', flat=True))
+        projected = ledger.wallet_balances()
+        from_ledger = ledger.wallet_ledger_balances()
+        balances = {wallet_id: projected.get(wallet_id, Money(0)) for wallet_id in wallet_ids}
+        expected_total = opening_total + funded.kobo - withdrawn.kobo
+        actual_total = sum(balance.kobo for balance in balances.values())
+        drifted = [
+            wallet_id for wallet_id, balance in balances.items()
+            if balance != from_ledger.get(wallet_id, Money(0))
+        ]
+        return {
+            'expected_total': str(Money(expected_total)),
+            'actual_total': str(Money(actual_total)),
+            'total_conserved': actual_total == expected_total,
+            'no_negative_balances': all(balance.kobo >= 0 for balance in balances.values()),
+            'ledger_matches_balances': not drifted,
+            'drifted_wallets': drifted,
+        }
+
+    def handle(self, *args, **options):
+        if options['wallets'] < 2:
+            raise CommandError('--wallets must be at least 2')
+        mix = parse_mix(options['mix'])
+        workers = max(options['processes'], 1) * options['threads']
+        seeds = [options['seed'] * 100000 + i for i in range(workers)]
+
+        try:
+            fake_server, gateway_settings = self.start_gateway(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        prefix, user_ids, accounts, opening_legs = self.seed(options['wallets'], options['balance'])
+        opening_total = Money.from_naira(options['balance']).kobo * len(user_ids)
+        args = (user_ids, accounts, mix, options['operations'])
+        self.stdout.write(
+            f'Seeded {len(user_ids)} wallets; running {workers} worker(s) x {options["operations"]} operations '
+            f'on {connection.vendor}...'
+        )
+
+        try:
+            started_at = datetime.now(timezone.utc)
+            started = time.perf_counter()
+            if options['processes']:
+                try:
+                    context = multiprocessing.get_context('fork')
+                except ValueError:
+                    raise CommandError('--processes needs the fork start method')
+                per_process = options['threads']
+                connections.close_all()
+                with ProcessPoolExecutor(options['processes'], mp_context=context) as pool:
+                    futures = [
+                        pool.submit(run_process, gateway_settings, seeds[i:i + per_process], *args)
+                        for i in range(0, workers, per_process)
+                    ]
+                    results = [result for future in futures for result in future.result()]
+            else:
+                gateway.metrics.reset()
+                results = run_workload(gateway_settings, seeds, *args)
+            elapsed = time.perf_counter() - started
+
+            report = {
+                'started_at': started_at.isoformat(),
+                'database': {'vendor': connection.vendor, 'name': str(connection.settings_dict.get('NAME'))},
+                'config': {
+                    'wallets': len(user_ids),
+                    'processes': options['processes'],
+                    'threads': options['threads'],
+                    'operations_per_thread': options['operations'],
+                    'mix': mix,
+                    'seed': options['seed'],
+                    'gateway': self.gateway_config(options),
+                },
+                'elapsed_s': round(elapsed, 3),
+                'operations': self.summarise(results, elapsed),
+                'invariants': self.check_invariants(user_ids, opening_total),
+            }
+            if fake_server is not None:
+                report['gateway'] = {'server': dict(fake_server.get_app().counts)}
+                if not options['processes']:
+                    # Client-side timings, including retries; only known in-process.
+                    report['gateway']['client'] = gateway.metrics.snapshot()
+        finally:
+            if fake_server is not None:
+                fake_server.shutdown()
+            if not options['keep']:
+                wallet_ids = list(Wallet.objects.filter(user_id__in=user_ids).values_list('pk', flat=True))
+                User.objects.filter(email__startswith=f'{prefix}_').delete()
+                LedgerEntry.objects.filter(pk__in=opening_legs).delete()
+                balance_cache.forget(wallet_ids)
+                # The cascade took the benchmark's transactions and wallets with it.
+                counters.reconcile()
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for name, stats in report['operations'].items():
+            self.stdout.write(
+                f'{name:>9}: {stats["count"]:>6} ops, {stats["ops_per_sec"]:>9,.1f} ops/s, '
+                f'p50 {stats["p50_ms"]:.1f}ms  p95 {stats["p95_ms"]:.1f}ms  p99 {stats["p99_ms"]:.1f}ms, '
+                f'{stats["errors"]} errors'
+            )
+        invariants = report['invariants']
+        self.stdout.write(f'Results written to {options["output"]}')
+        if not (invariants['total_conserved'] and invariants['no_negative_balances']
+                and invariants['ledger_matches_balances']):
+            raise CommandError(f'Money invariants violated: {invariants}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Invariants hold: total {invariants["actual_total"]}, no negative balances, ledger agrees.'
+        ))
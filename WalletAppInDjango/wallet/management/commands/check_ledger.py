@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from wallet import ledger
+from wallet.models import LedgerEntry, Wallet
+from wallet.money import ZERO
+
+
+class Command(BaseCommand):
+    help = 'Check that wallet balances match the double-entry ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--open-balances',
+            action='store_true',
+            help='Post opening-balance entries for wallets whose balance predates the ledger',
+        )
+
+    def handle(self, *args, **options):
+        problems = 0
+
+        # Every journal must balance.
+        totals = {}
+        rows = LedgerEntry.objects.values('transaction_id', 'side').annotate(total=Sum('amount'))
+        for row in rows:
+            journal = totals.setdefault(row['transaction_id'], {LedgerEntry.DEBIT: ZERO, LedgerEntry.CREDIT: ZERO})
+            journal[row['side']] += row['total'] or ZERO
+        for journal_id, sides in totals.items():
+            if sides[LedgerEntry.DEBIT] != sides[LedgerEntry.CREDIT]:
+                problems += 1
+                label = journal_id if journal_id is not None else 'opening balances'
+                self.stdout.write(self.style.ERROR(
+                    f'Journal {label} does not balance: debits {sides[LedgerEntry.DEBIT]} != credits {sides[LedgerEntry.CREDIT]}'
+                ))
+
+        # Every wallet projection must equal the sum of its legs.
+        ledger_balances = ledger.wallet_ledger_balances()
+        projected = ledger.wallet_balances()
+        opened = 0
+        for wallet in Wallet.objects.only('id', 'account_number').iterator():
+            expected = ledger_balances.get(wallet.pk, ZERO)
+            balance = projected.get(wallet.pk, ZERO)
+            if balance == expected:
+                continue
+            drift = balance - expected
+            if options['open_balances']:
+                with transaction.atomic():
+                    ledger.post_opening_balance(wallet, drift)
+                opened += 1
+                continue
+            problems += 1
+            self.stdout.write(self.style.WARNING(
+                f'Wallet {wallet.account_number}: balance {balance} but ledger says {expected} (drift {drift})'
+            ))
+
+        if opened:
+            self.stdout.write(f'Posted opening balances for {opened} wallet(s).')
+        if problems:
+            self.stdout.write(self.style.ERROR(f'Ledger check found {problems} problem(s).'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Ledger and wallet balances agree.'))
@@ -1,9 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from wallet import accounts
 from wallet.models import Wallet, Transaction
-from decimal import Decimal
-import random
-import string
 
 User = get_user_model()
 
@@ -22,7 +20,7 @@ class Command(BaseCommand):
             # Check if admin has a wallet
             try:
                 wallet = Wallet.objects.get(user=admin)
-                self.stdout.write(f'  ✓ Wallet exists: {wallet.account_number} (Balance: ₦{wallet.balance})')
+                self.stdout.write(f'  ✓ Wallet exists: {wallet.account_number} (Balance: ₦{wallet.current_balance()})')
                 
                 # Check wallet transactions
                 wallet_transactions = Transaction.objects.filter(
@@ -37,24 +35,9 @@ class Command(BaseCommand):
                 
                 # Create wallet for admin
                 try:
-                    # Generate account number
-                    if admin.phone and len(admin.phone) >= 11:
-                        account_number = admin.phone[1:]
-                    else:
-                        account_number = '1' + str(admin.id).zfill(9)
-                    
-                    # Ensure uniqueness
-                    counter = 1
-                    original_account = account_number
-                    while Wallet.objects.filter(account_number=account_number).exists():
-                        account_number = f"{original_account}{counter}"
-                        counter += 1
-                    
-                    wallet = Wallet.objects.create(
-                        user=admin,
-                        account_number=account_number,
-                        balance=Decimal('0.00')
-                    )
+                    # Same allocation as signup: the phone-derived number if
+                    # it is free, else a NUBAN from the reserved serial blocks.
+                    wallet = accounts.create_wallet(admin)
                     self.stdout.write(f'  ✓ Created wallet: {wallet.account_number}')
                 except Exception as e:
                     self.stdout.write(f'  ✗ Error creating wallet: {e}')
@@ -0,0 +1,56 @@
+from wsgiref.simple_server import make_server
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.fake_paystack import FakePaystack, Latency, QuietHandler, ThreadingWSGIServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake Paystack API with configurable latency and faults'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8099)
+        parser.add_argument('--latency', default='0',
+                            help='Latency per answer in ms: fixed:MS, uniform:LO,HI, normal:MEAN,SD or '
+                                 'lognormal:MEDIAN,SIGMA (default: 0)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500')
+        parser.add_argument('--timeout-rate', type=float, default=0.0, help='Share of requests that hang')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds a hanging request hangs for')
+        parser.add_argument('--abandon-rate', type=float, default=0.0, help='Share of payments never completed')
+        parser.add_argument('--webhook-url', help='Deliver a signed charge.success webhook here for each payment')
+        parser.add_argument('--webhook-delay', type=float, default=0.5, help='Seconds before the webhook is sent')
+        parser.add_argument('--seed', type=int, help='Random seed for the faults')
+
+    def handle(self, *args, **options):
+        try:
+            latency = Latency(options['latency'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['webhook_url'] and not settings.PAYSTACK_SECRET_KEY:
+            raise CommandError('Set PAYSTACK_SECRET_KEY to sign webhooks')
+
+        app = FakePaystack(
+            latency=latency,
+            error_rate=options['error_rate'],
+            timeout_rate=options['timeout_rate'],
+            timeout=options['timeout'],
+            abandon_rate=options['abandon_rate'],
+            webhook_url=options['webhook_url'],
+            webhook_delay=options['webhook_delay'],
+            seed=options['seed'],
+        )
+        server = make_server(options['host'], options['port'], app,
+                             server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+        url = f'http://{options["host"]}:{server.server_port}'
+        self.stdout.write(self.style.SUCCESS(
+            f'Fake Paystack listening on {url} (latency {latency}, {options["error_rate"]:.0%} errors, '
+            f'{options["timeout_rate"]:.0%} timeouts). Set PAYSTACK_BASE_URL={url}'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(f'Stopping. Served {app.counts}')
+        finally:
+            server.server_close()
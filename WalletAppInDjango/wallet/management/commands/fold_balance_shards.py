@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from wallet import ledger
+from wallet.models import WalletBalanceShard
+
+
+class Command(BaseCommand):
+    help = 'Fold credits parked on balance shards back into their wallet balances (run periodically)'
+
+    def handle(self, *args, **options):
+        wallet_ids = WalletBalanceShard.objects.filter(balance__gt=0).values_list('wallet_id', flat=True).distinct()
+        folded = 0
+        for wallet_id in list(wallet_ids):
+            with transaction.atomic():
+                amount = ledger.fold_shards(wallet_id)
+            if amount:
+                folded += 1
+                self.stdout.write(f'Wallet {wallet_id}: folded ₦{amount}')
+        self.stdout.write(self.style.SUCCESS(f'Folded shards for {folded} wallet(s).'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from wallet import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's sent/received totals behind the top-users leaderboard from the transaction table"
+
+    def handle(self, *args, **options):
+        users = leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt volume stats for {users} user(s).'))
@@ -0,0 +1,33 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from wallet import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the hourly and daily transaction rollups from the transaction table, '
+        'for a backfill or to correct drift'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild, YYYY-MM-DD (default: the beginning)')
+        parser.add_argument('--until', help='Day to stop before, YYYY-MM-DD (default: no end)')
+        parser.add_argument('--days', type=int, help='Rebuild only the last N days, today included')
+
+    def handle(self, *args, **options):
+        try:
+            since = date.fromisoformat(options['since']) if options['since'] else None
+            until = date.fromisoformat(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(f'Dates must be YYYY-MM-DD: {e}')
+        if options['days'] is not None:
+            if options['days'] < 1:
+                raise CommandError('--days must be at least 1')
+            since = timezone.localdate() - timedelta(days=options['days'] - 1)
+
+        written = rollups.rebuild(since=since, until=until)
+        span = f'{since or "the beginning"} to {until or "now"}'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} rollup row(s) from {span}.'))
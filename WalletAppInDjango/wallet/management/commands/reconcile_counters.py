@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from wallet import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Count users, transactions and funded wallets from their tables and correct any drift in the '
+        'live platform counters behind the admin dashboard; run periodically'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Report drift without correcting it')
+
+    def handle(self, *args, **options):
+        drift = counters.reconcile(apply=not options['check'])
+        for name, (counted, actual) in sorted(drift.items()):
+            self.stdout.write(f'  {name}: counted {counted}, actual {actual} ({actual - counted:+d})')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Platform counters match the tables.'))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} counter(s) have drifted.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Corrected {len(drift)} counter(s).'))
@@ -0,0 +1,42 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.deposits import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Verify unverified gateway deposits against Paystack, credit the ones that succeeded '
+        'and expire stale intents that never will'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Deposits read per page (default: 500)')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent gateway lookups, at most PAYSTACK_MAX_CONCURRENCY (default: 8)')
+        parser.add_argument('--expire-after', type=float, default=24,
+                            help='Hours after which a failed or unknown intent is expired (default: 24)')
+        parser.add_argument('--limit', type=int, help='Stop after checking this many deposits')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be at least 1')
+
+        started = time.perf_counter()
+        result = reconcile(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            expire_after=timedelta(hours=options['expire_after']),
+            limit=options['limit'],
+        )
+        elapsed = time.perf_counter() - started
+        rate = result.checked / elapsed * 60 if elapsed else 0
+
+        for sample in result.error_samples:
+            self.stderr.write(f'  {sample}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {result.checked} deposit(s) in {elapsed:.1f}s ({rate:,.0f}/min): '
+            f'{result.credited} credited, {result.expired} expired, {result.pending} still pending, '
+            f'{result.errors} error(s).'
+        ))
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from wallet import reports
+
+
+class Command(BaseCommand):
+    help = 'Render queued admin PDF reports in a process pool and store them for download'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new jobs')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --loop')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes rendering reports; 0 renders in this process (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, help='Jobs claimed per poll (default: one per worker)')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 0 or (options['batch_size'] is not None and options['batch_size'] < 1):
+            raise CommandError('--workers must be at least 0 and --batch-size at least 1')
+        batch_size = options['batch_size'] or max(options['workers'], 1)
+
+        pool = nullcontext()
+        if options['workers']:
+            try:
+                context = multiprocessing.get_context('fork')
+            except ValueError:
+                raise CommandError('--workers needs the fork start method; use --workers 0')
+            # The workers open their own database connections: fork them all
+            # now, before this process opens one they could inherit.
+            connections.close_all()
+            pool = ProcessPoolExecutor(options['workers'], mp_context=context)
+            pool.submit(int).result()
+
+        with pool as executor:
+            while True:
+                done = failed = 0
+                # Work through everything queued, a batch at a time.
+                while True:
+                    result = reports.run_pending(executor, batch_size)
+                    if not result:
+                        break
+                    done += result.done
+                    failed += result.failed
+                    for sample in result.error_samples:
+                        self.stderr.write(f'  {sample}')
+                purged = reports.purge()
+                if done or failed or purged or not options['loop']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Report jobs: {done} done, {failed} failed, {purged} purged.'
+                    ))
+                if not options['loop']:
+                    return
+                time.sleep(options['interval'])
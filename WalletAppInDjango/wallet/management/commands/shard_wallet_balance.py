@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet import ledger
+from wallet.models import Wallet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Turn sharded balances on or off for hot wallets such as the platform fee wallet'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--account-number', help='Wallet to change')
+        target.add_argument('--admin', action='store_true', help='Change every superuser wallet')
+        parser.add_argument('--shards', type=int, default=16, help='Number of balance shards (default: 16)')
+        parser.add_argument('--disable', action='store_true', help='Fold the shards back and stop sharding')
+
+    def handle(self, *args, **options):
+        if options['admin']:
+            wallets = Wallet.objects.filter(user__is_superuser__in=[True])
+        else:
+            wallets = Wallet.objects.filter(account_number=options['account_number'])
+        wallets = list(wallets)
+        if not wallets:
+            raise CommandError('No matching wallet found')
+        if not options['disable'] and options['shards'] < 2:
+            raise CommandError('--shards must be at least 2')
+
+        for wallet in wallets:
+            if options['disable']:
+                ledger.disable_shards(wallet)
+                self.stdout.write(f'Wallet {wallet.account_number}: sharding disabled')
+            else:
+                ledger.enable_shards(wallet, options['shards'])
+                self.stdout.write(f'Wallet {wallet.account_number}: credits spread over {options["shards"]} shards')
+            wallet.refresh_from_db()
+            self.stdout.write(f'  Balance: ₦{wallet.current_balance()}')
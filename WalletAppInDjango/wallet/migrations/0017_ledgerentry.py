@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-17 11:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0016_fix_duplicate_references'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account', models.CharField(choices=[('wallet', 'Customer wallet'), ('gateway', 'Payment gateway clearing'), ('opening', 'Opening balances')], default='wallet', max_length=10)),
+                ('side', models.CharField(choices=[('D', 'DEBIT'), ('C', 'CREDIT')], max_length=1)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('transaction', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='wallet.transaction')),
+                ('wallet', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='wallet.wallet')),
+            ],
+        ),
+    ]
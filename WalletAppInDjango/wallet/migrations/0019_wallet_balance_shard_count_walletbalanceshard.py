@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-17 11:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0018_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='balance_shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='WalletBalanceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_shards', to='wallet.wallet')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='walletbalanceshard',
+            constraint=models.UniqueConstraint(fields=('wallet', 'shard'), name='unique_wallet_balance_shard'),
+        ),
+    ]
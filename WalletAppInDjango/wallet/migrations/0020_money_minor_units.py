@@ -0,0 +1,126 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import F
+
+import wallet.money
+
+# (model, field, max_digits before this migration, default)
+MONEY_FIELDS = [
+    ('wallet', 'balance', 10, 0.0),
+    ('walletbalanceshard', 'balance', 12, 0.0),
+    ('transaction', 'amount', 10, None),
+    ('ledgerentry', 'amount', 12, None),
+]
+
+
+def decimal_field(max_digits, default):
+    if default is None:
+        return models.DecimalField(decimal_places=2, max_digits=max_digits)
+    return models.DecimalField(decimal_places=2, default=default, max_digits=max_digits)
+
+
+def money_field(default):
+    if default is None:
+        return wallet.money.MoneyField()
+    return wallet.money.MoneyField(default=0)
+
+
+def is_mongo(connection):
+    return connection.vendor == 'djongo' or connection.settings_dict['ENGINE'] == 'djongo'
+
+
+def rewrite_documents(apps, schema_editor, convert):
+    """
+    Rewrite every money value document by document on MongoDB, where djongo
+    can neither run the ``F()`` update nor change a column's type.
+    """
+    from bson import Decimal128
+    from pymongo import UpdateOne
+
+    connection = schema_editor.connection
+    connection.ensure_connection()
+    # djongo's connection is the pymongo Database.
+    database = connection.connection
+    for model_name, field, _, _ in MONEY_FIELDS:
+        model = apps.get_model('wallet', model_name)
+        collection = database[model._meta.db_table]
+        column = model._meta.get_field(field).column
+        updates = []
+        for document in collection.find({column: {'$ne': None}}, {column: 1}):
+            value = document[column]
+            value = value.to_decimal() if isinstance(value, Decimal128) else Decimal(str(value))
+            updates.append(UpdateOne({'_id': document['_id']}, {'$set': {column: convert(value)}}))
+            if len(updates) == 1000:
+                collection.bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            collection.bulk_write(updates, ordered=False)
+
+
+def to_kobo(naira):
+    from bson import Int64
+
+    return Int64((naira * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_naira(kobo):
+    from bson import Decimal128
+
+    return Decimal128((kobo / 100).quantize(Decimal('0.01')))
+
+
+def naira_to_kobo(apps, schema_editor):
+    if is_mongo(schema_editor.connection):
+        rewrite_documents(apps, schema_editor, to_kobo)
+        return
+    for model_name, field, _, _ in MONEY_FIELDS:
+        apps.get_model('wallet', model_name).objects.update(**{field: F(field) * 100})
+
+
+def kobo_to_naira(apps, schema_editor):
+    if is_mongo(schema_editor.connection):
+        rewrite_documents(apps, schema_editor, to_naira)
+        return
+    for model_name, field, _, _ in MONEY_FIELDS:
+        apps.get_model('wallet', model_name).objects.update(**{field: F(field) / 100})
+
+
+class AlterColumn(migrations.AlterField):
+    """``AlterField`` that only changes the migration state on MongoDB, whose documents have no column types."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not is_mongo(schema_editor.connection):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not is_mongo(schema_editor.connection):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def alter_all(make_field):
+    return [
+        AlterColumn(model_name=model_name, name=field, field=make_field(max_digits, default))
+        for model_name, field, max_digits, default in MONEY_FIELDS
+    ]
+
+
+class Migration(migrations.Migration):
+    """
+    Store money as integer kobo.
+
+    Columns are widened first so multiplying by 100 cannot overflow, scaled
+    while still decimal, then converted to BIGINT. Reversing divides back.
+    On MongoDB (djongo) the column changes are skipped and each document's
+    Decimal128 naira value is rewritten as an Int64 of kobo instead.
+    """
+
+    dependencies = [
+        ('wallet', '0019_wallet_balance_shard_count_walletbalanceshard'),
+    ]
+
+    operations = [
+        *alter_all(lambda max_digits, default: decimal_field(20, default)),
+        migrations.RunPython(naira_to_kobo, kobo_to_naira),
+        *alter_all(lambda max_digits, default: money_field(default)),
+    ]
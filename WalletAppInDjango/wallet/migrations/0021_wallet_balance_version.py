@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0020_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='balance_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:11
+
+from django.db import migrations, models
+import wallet.money
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0021_wallet_balance_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GatewayEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=100, unique=True)),
+                ('event', models.CharField(max_length=50)),
+                ('amount', wallet.money.MoneyField()),
+                ('payload', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('applied', 'Applied'), ('ignored', 'Ignored'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
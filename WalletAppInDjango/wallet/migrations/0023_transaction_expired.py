@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0022_gatewayevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='expired',
+            field=models.BooleanField(default=False),
+        ),
+    ]
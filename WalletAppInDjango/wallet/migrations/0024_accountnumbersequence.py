@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0023_transaction_expired'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bank_code', models.CharField(max_length=3, unique=True)),
+                ('next_serial', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:33
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+import wallet.money
+
+
+def backfill_rollups(apps, schema_editor):
+    """Roll up the existing transactions; manage.py rebuild_rollups does the same later on."""
+    Transaction = apps.get_model('wallet', 'Transaction')
+    TransactionRollup = apps.get_model('wallet', 'TransactionRollup')
+    rows = []
+    for period, truncate in (('H', TruncHour), ('D', TruncDay)):
+        grouped = Transaction.objects.annotate(bucket=truncate('transaction_time')).values(
+            'bucket', 'transaction_type', 'verified',
+        ).annotate(total_count=Count('pk'), total_volume=Sum('amount')).order_by()
+        rows.extend(
+            TransactionRollup(
+                period=period, bucket=row['bucket'], transaction_type=row['transaction_type'],
+                verified=row['verified'], count=row['total_count'], volume=row['total_volume'] or 0,
+            )
+            for row in grouped
+        )
+    TransactionRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0024_accountnumbersequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('H', 'HOUR'), ('D', 'DAY')], max_length=1)),
+                ('bucket', models.DateTimeField()),
+                ('transaction_type', models.CharField(choices=[('D', 'DEPOSIT'), ('W', 'WITHDRAW'), ('T', 'TRANSFER'), ('B', 'BALANCE')], max_length=1)),
+                ('verified', models.BooleanField()),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.BigIntegerField(default=0)),
+                ('volume', wallet.money.MoneyField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='transactionrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket', 'transaction_type', 'verified', 'shard'), name='unique_transaction_rollup'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
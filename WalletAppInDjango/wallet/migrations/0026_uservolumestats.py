@@ -0,0 +1,57 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:35
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+import wallet.money
+from wallet.money import Money
+
+
+def backfill_stats(apps, schema_editor):
+    """Total up the existing transactions; manage.py rebuild_leaderboard does the same later on."""
+    Transaction = apps.get_model('wallet', 'Transaction')
+    UserVolumeStats = apps.get_model('wallet', 'UserVolumeStats')
+    totals = defaultdict(lambda: [0, 0, 0])
+    for column, index in (('sender_id', 0), ('receiver_id', 1)):
+        grouped = Transaction.objects.filter(**{f'{column}__isnull': False}).values(column).annotate(
+            total=Sum('amount'), journals=Count('pk'),
+        ).order_by()
+        for row in grouped:
+            totals[row[column]][index] += row['total'].kobo
+            totals[row[column]][2] += row['journals']
+    UserVolumeStats.objects.bulk_create([
+        UserVolumeStats(
+            user_id=user_id, sent=Money(sent), received=Money(received), volume=Money(sent + received),
+            transaction_count=count,
+        )
+        for user_id, (sent, received, count) in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wallet', '0025_transactionrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserVolumeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='volume_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('sent', wallet.money.MoneyField(default=0)),
+                ('received', wallet.money.MoneyField(default=0)),
+                ('volume', wallet.money.MoneyField(default=0)),
+                ('transaction_count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='uservolumestats',
+            index=models.Index(fields=['-volume'], name='wallet_user_volume_idx'),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
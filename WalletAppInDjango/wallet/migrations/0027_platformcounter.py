@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:42
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_counters(apps, schema_editor):
+    """Count the existing rows; manage.py reconcile_counters does the same later on."""
+    User = apps.get_model('user', 'User')
+    Transaction = apps.get_model('wallet', 'Transaction')
+    Wallet = apps.get_model('wallet', 'Wallet')
+    WalletBalanceShard = apps.get_model('wallet', 'WalletBalanceShard')
+    PlatformCounter = apps.get_model('wallet', 'PlatformCounter')
+
+    held = {wallet_id: balance.kobo for wallet_id, balance in Wallet.objects.values_list('pk', 'balance').iterator()}
+    for row in WalletBalanceShard.objects.values('wallet_id').annotate(total=Sum('balance')).order_by():
+        held[row['wallet_id']] += row['total'].kobo if row['total'] else 0
+    volume = Transaction.objects.aggregate(total=Sum('amount'))['total']
+    values = {
+        'users': User.objects.count(),
+        'active_users': User.objects.filter(is_active__in=[True]).count(),
+        'transactions': Transaction.objects.count(),
+        'volume': volume.kobo if volume else 0,
+        'funded_wallets': sum(1 for kobo in held.values() if kobo > 0),
+    }
+    PlatformCounter.objects.bulk_create([PlatformCounter(name=name, value=value) for name, value in values.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0010_profile_identity_hashes'),
+        ('wallet', '0026_uservolumestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(choices=[('users', 'Users'), ('active_users', 'Active users'), ('transactions', 'Transactions'), ('volume', 'Transaction volume (kobo)'), ('funded_wallets', 'Wallets with a positive balance')], max_length=20)),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-transaction_time'], name='wallet_transaction_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='platformcounter',
+            constraint=models.UniqueConstraint(fields=('name', 'shard'), name='unique_platform_counter'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wallet', '0027_platformcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_type', models.CharField(choices=[('Platform Report', 'Platform Report'), ('User Activity Report', 'User Activity Report'), ('Transaction Summary Report', 'Transaction Summary Report'), ('Revenue Analysis Report', 'Revenue Analysis Report'), ('System Performance Report', 'System Performance Report')], default='Platform Report', max_length=40)),
+                ('date_range', models.CharField(choices=[('week', 'Last week'), ('month', 'Last month'), ('quarter', 'Last quarter'), ('year', 'Last year')], default='month', max_length=10)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('file', models.FileField(blank=True, upload_to='reports/')),
+                ('filename', models.CharField(max_length=120)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
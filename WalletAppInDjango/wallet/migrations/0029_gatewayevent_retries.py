@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-17 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0028_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gatewayevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='gatewayevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
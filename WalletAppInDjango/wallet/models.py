@@ -1,4 +1,3 @@
-from decimal import Decimal
 from uuid import uuid4
 
 from django.conf import settings
@@ -6,42 +5,84 @@ from django.conf import settings
 from django.db import models
 from django.core.exceptions import ValidationError
 
+from .money import ZERO, Money, MoneyField
+
 def generate_reference():
     return 'ref_' + str(uuid4())
 
 
 class Wallet(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='wallet')
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    balance = MoneyField(default=0)
     account_number = models.CharField(max_length=10, unique=True)
+    # 0 means credits land on ``balance`` directly. Hot wallets (the platform
+    # fee wallet) can spread credits across this many WalletBalanceShard rows.
+    balance_shard_count = models.PositiveSmallIntegerField(default=0)
+    # Bumped by every balance update; lets wallet.balance_cache tell newer
+    # cached balances from older ones.
+    balance_version = models.PositiveBigIntegerField(default=0)
 
-    def _normalize_decimal(self, value):
-        if value is None:
-            return Decimal("0.00")
-        if isinstance(value, Decimal):
-            return value
-        if hasattr(value, 'to_decimal'):
-            return value.to_decimal()
-        return Decimal(str(value))
+    def current_balance(self):
+        """Balance including credits still parked on balance shards."""
+        if not self.balance_shard_count:
+            return self.balance
+        parked = self.balance_shards.aggregate(total=models.Sum('balance'))['total']
+        return self.balance + (parked or ZERO)
 
     def deposit(self, amount):
-        amount = self._normalize_decimal(amount)
-        self.balance = self._normalize_decimal(self.balance)
-        if amount > Decimal("0.00"):
-            self.balance += amount
-            self.save()
-            return True
-        return False
+        """Credit ``amount`` from the payment gateway as a ledger journal."""
+        from .services import InvalidAmount, deposit_funds
+
+        try:
+            deposit_funds(self, amount)
+        except InvalidAmount:
+            return False
+        return True
 
     def withdraw(self, amount):
-        amount = self._normalize_decimal(amount)
-        self.balance = self._normalize_decimal(self.balance)
-        if amount > Decimal("0.00"):
-            if amount <= self.balance:
-                self.balance -= amount
-                self.save()
-                return True
-        return False
+        """Pay ``amount`` out through the payment gateway; ``False`` if the balance does not cover it."""
+        from .ledger import InsufficientFunds
+        from .services import InvalidAmount, withdraw_funds
+
+        try:
+            withdraw_funds(self, amount)
+        except (InsufficientFunds, InvalidAmount):
+            return False
+        return True
+
+class WalletBalanceShard(models.Model):
+    """
+    A slice of a hot wallet's balance.
+
+    Credits to a sharded wallet update one randomly chosen shard row, so
+    concurrent credits rarely wait on the same row lock. The shard sums are
+    added on read (``Wallet.current_balance``) and periodically folded back
+    into ``Wallet.balance``.
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='balance_shards')
+    shard = models.PositiveSmallIntegerField()
+    balance = MoneyField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'shard'], name='unique_wallet_balance_shard'),
+        ]
+
+
+class AccountNumberSequence(models.Model):
+    """
+    Next unreserved account number serial, per bank code.
+
+    ``wallet.accounts`` reserves serials from here a block at a time and hands
+    them out from memory, so allocating a number costs no query at all most
+    of the time and never needs a uniqueness probe.
+    """
+    bank_code = models.CharField(max_length=3, unique=True)
+    next_serial = models.BigIntegerField()
+
+    def __str__(self):
+        return f'{self.bank_code}: next {self.next_serial}'
+
 
 class Transaction(models.Model):
     # wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT)
@@ -54,23 +95,268 @@ class Transaction(models.Model):
     ]
     reference = models.CharField(max_length=40, unique=True, default=generate_reference)
     transaction_type = models.CharField(max_length=1, choices=TRANSACTION_TYPE, default='D')
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField()
     transaction_time = models.DateTimeField(auto_now_add=True)
     verified = models.BooleanField(default=False)
+    # Set by ``reconcile_deposits`` on deposit intents the gateway never
+    # completed; a late confirmation still settles them.
+    expired = models.BooleanField(default=False)
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sender', null=True)
     receiver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='receiver', null=True)
 
-    def _normalize_decimal(self, value):
-        if value is None:
-            return Decimal('0.00')
-        if isinstance(value, Decimal):
-            return value
-        if hasattr(value, 'to_decimal'):
-            return value.to_decimal()
-        return Decimal(str(value))
+    class Meta:
+        indexes = [
+            # Latest transactions first, for the admin dashboard.
+            models.Index(fields=['-transaction_time'], name='wallet_transaction_time_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.sender is None and self.receiver is None:
             raise ValidationError("Sender and receiver cannot be None")
-        self.amount = self._normalize_decimal(self.amount)
-        super().save(*args, **kwargs)
\ No newline at end of file
+        if self.amount is not None and not isinstance(self.amount, Money):
+            self.amount = Money.from_naira(self.amount)
+        super().save(*args, **kwargs)
+
+class TransactionRollup(models.Model):
+    """
+    Count and volume of the transactions of one hour or day, by type and
+    verified state, kept up to date by ``wallet.rollups`` as transactions are
+    written. A bucket is spread over a few ``shard`` rows so concurrent
+    writers rarely wait on the same row lock; readers add the shards up.
+    """
+    HOUR = 'H'
+    DAY = 'D'
+    PERIODS = [
+        (HOUR, "HOUR"),
+        (DAY, "DAY"),
+    ]
+
+    period = models.CharField(max_length=1, choices=PERIODS)
+    # Start of the hour or day, in the current time zone.
+    bucket = models.DateTimeField()
+    transaction_type = models.CharField(max_length=1, choices=Transaction.TRANSACTION_TYPE)
+    verified = models.BooleanField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.BigIntegerField(default=0)
+    volume = MoneyField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index range reads use: period, then bucket.
+            models.UniqueConstraint(fields=['period', 'bucket', 'transaction_type', 'verified', 'shard'],
+                                    name='unique_transaction_rollup'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_period_display()} {self.bucket:%Y-%m-%d %H:%M} {self.transaction_type}: {self.count}'
+
+
+class UserVolumeStats(models.Model):
+    """
+    Running totals of what a user has sent and received, kept up to date by
+    ``wallet.leaderboard`` as transactions are written, so "top users by
+    volume" is a read of the first rows of the ``volume`` index.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='volume_stats')
+    sent = MoneyField(default=0)
+    received = MoneyField(default=0)
+    # sent + received, stored so the leaderboard can be read off an index.
+    volume = MoneyField(default=0)
+    transaction_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-volume'], name='wallet_user_volume_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.volume}'
+
+
+class PlatformCounter(models.Model):
+    """
+    One shard of a platform-wide running total, kept up to date by
+    ``wallet.counters`` in the transactions that change it, so the admin
+    dashboard reads a handful of rows instead of counting whole tables.
+    Volume is held in kobo.
+    """
+    USERS = 'users'
+    ACTIVE_USERS = 'active_users'
+    TRANSACTIONS = 'transactions'
+    VOLUME = 'volume'
+    FUNDED_WALLETS = 'funded_wallets'
+    NAMES = [
+        (USERS, "Users"),
+        (ACTIVE_USERS, "Active users"),
+        (TRANSACTIONS, "Transactions"),
+        (VOLUME, "Transaction volume (kobo)"),
+        (FUNDED_WALLETS, "Wallets with a positive balance"),
+    ]
+
+    name = models.CharField(max_length=20, choices=NAMES)
+    shard = models.PositiveSmallIntegerField(default=0)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'shard'], name='unique_platform_counter'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}[{self.shard}]: {self.value}'
+
+
+class LedgerEntry(models.Model):
+    """
+    One leg of a double-entry journal.
+
+    A ``Transaction`` is the journal header; its entries must balance (total
+    debits == total credits). Entries are append-only: corrections are posted
+    as new journals, never by editing old legs. ``Wallet.balance`` is the
+    running projection of a wallet's entries and is updated in the same
+    database transaction that writes them.
+    """
+    DEBIT = 'D'
+    CREDIT = 'C'
+    SIDES = [
+        (DEBIT, "DEBIT"),
+        (CREDIT, "CREDIT"),
+    ]
+
+    WALLET = 'wallet'
+    GATEWAY = 'gateway'
+    OPENING = 'opening'
+    ACCOUNTS = [
+        (WALLET, "Customer wallet"),
+        (GATEWAY, "Payment gateway clearing"),
+        (OPENING, "Opening balances"),
+    ]
+
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='entries', null=True)
+    account = models.CharField(max_length=10, choices=ACCOUNTS, default=WALLET)
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='ledger_entries', null=True)
+    side = models.CharField(max_length=1, choices=SIDES)
+    amount = MoneyField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Ledger entries are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Ledger entries are append-only")
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored outcome of a request made with an ``Idempotency-Key`` header.
+
+    A row is inserted before the handler runs (``status_code`` is null while
+    it is in flight) and filled with the response afterwards, so retries are
+    answered from here instead of running the handler again. Rows expire after
+    ``IDEMPOTENCY_KEY_TTL`` and are purged by ``purge_idempotency_keys``.
+    """
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    endpoint = models.CharField(max_length=50)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'endpoint', 'key'], name='unique_idempotency_key'),
+        ]
+
+
+class GatewayEvent(models.Model):
+    """
+    A signed Paystack webhook, stored as received.
+
+    The webhook endpoint only checks the signature and inserts the row, so
+    Paystack gets its 200 straight away; ``apply_gateway_events`` credits the
+    deposits afterwards. ``reference`` is unique, so a redelivered webhook is
+    stored once. An event whose credit hit an unexpected error stays pending
+    and is retried from ``next_attempt_at``.
+    """
+    PENDING = 'pending'
+    APPLIED = 'applied'
+    IGNORED = 'ignored'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, "Pending"),
+        (APPLIED, "Applied"),
+        (IGNORED, "Ignored"),
+        (FAILED, "Failed"),
+    ]
+
+    reference = models.CharField(max_length=100, unique=True)
+    event = models.CharField(max_length=50)
+    amount = MoneyField()
+    payload = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING, db_index=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.event} {self.reference} ({self.status})'
+
+
+class ReportJob(models.Model):
+    """
+    A PDF report requested from the admin dashboard.
+
+    The request only inserts the row; ``run_report_jobs`` renders the PDF in
+    a process pool and stores it under ``MEDIA_ROOT/reports/``, and the
+    client polls the job until it can download the file.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    PLATFORM = 'Platform Report'
+    USER_ACTIVITY = 'User Activity Report'
+    TRANSACTION_SUMMARY = 'Transaction Summary Report'
+    REVENUE_ANALYSIS = 'Revenue Analysis Report'
+    SYSTEM_PERFORMANCE = 'System Performance Report'
+    REPORT_TYPES = [(name, name) for name in (
+        PLATFORM, USER_ACTIVITY, TRANSACTION_SUMMARY, REVENUE_ANALYSIS, SYSTEM_PERFORMANCE,
+    )]
+    DATE_RANGES = [
+        ('week', "Last week"),
+        ('month', "Last month"),
+        ('quarter', "Last quarter"),
+        ('year', "Last year"),
+    ]
+
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='report_jobs')
+    report_type = models.CharField(max_length=40, choices=REPORT_TYPES, default=PLATFORM)
+    date_range = models.CharField(max_length=10, choices=DATE_RANGES, default='month')
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED, db_index=True)
+    # Times a worker has picked the job up; a job whose worker died is
+    # picked up again until REPORT_JOB_MAX_ATTEMPTS.
+    attempts = models.PositiveSmallIntegerField(default=0)
+    file = models.FileField(upload_to='reports/', blank=True)
+    # Name the download is offered under.
+    filename = models.CharField(max_length=120)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.report_type} #{self.pk} ({self.status})'
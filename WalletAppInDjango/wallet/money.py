@@ -0,0 +1,194 @@
+"""
+Money stored as an integer number of kobo.
+
+``MoneyField`` keeps amounts in a ``BIGINT`` column, so every backend (djongo
+included, where amounts used to come back as ``Decimal128``) can compare and
+aggregate them natively, and balances are no longer capped by
+``max_digits``. In Python the column is exposed as ``Money``, a small
+immutable value type doing integer arithmetic.
+
+Plain numbers (``int``, ``Decimal``, ``float``, ``str``) handed to ``Money``
+helpers or assigned to a ``MoneyField`` are always read as naira, matching how
+amounts travel through the API. Use ``Money(kobo)`` or ``money.kobo`` when you
+need minor units, e.g. for Paystack or in ``F()`` expressions.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django import forms
+from django.core import exceptions
+from django.db import models
+
+KOBO_PER_NAIRA = 100
+_ONE_KOBO = Decimal('0.01')
+
+
+def _to_decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    if hasattr(value, 'to_decimal'):
+        # Money, and bson's Decimal128 from legacy djongo documents.
+        return value.to_decimal()
+    if isinstance(value, float):
+        return Decimal(str(value))
+    return Decimal(value)
+
+
+class Money:
+    """An amount of naira held as integer kobo."""
+
+    __slots__ = ('kobo',)
+
+    def __init__(self, kobo=0):
+        if not isinstance(kobo, int) or isinstance(kobo, bool):
+            raise TypeError(f'Money() takes an integer number of kobo, not {type(kobo).__name__}')
+        self.kobo = kobo
+
+    @classmethod
+    def from_naira(cls, value):
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, int) and not isinstance(value, bool):
+            return cls(value * KOBO_PER_NAIRA)
+        naira = _to_decimal(value).quantize(_ONE_KOBO, rounding=ROUND_HALF_UP)
+        return cls(int(naira * KOBO_PER_NAIRA))
+
+    coerce = from_naira
+
+    def to_decimal(self):
+        return Decimal(self.kobo).scaleb(-2)
+
+    @property
+    def naira(self):
+        return self.to_decimal()
+
+    def __str__(self):
+        return str(self.to_decimal())
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec)
+
+    def __float__(self):
+        return self.kobo / KOBO_PER_NAIRA
+
+    def __bool__(self):
+        return self.kobo != 0
+
+    def __hash__(self):
+        # Equal to the matching Decimal, so keep the hashes equal too.
+        return hash(self.to_decimal())
+
+    def _other(self, other):
+        if isinstance(other, Money):
+            return other.kobo
+        if isinstance(other, (int, Decimal, float)) and not isinstance(other, bool):
+            return Money.from_naira(other).kobo
+        return None
+
+    def __eq__(self, other):
+        kobo = self._other(other)
+        return NotImplemented if kobo is None else self.kobo == kobo
+
+    def __lt__(self, other):
+        kobo = self._other(other)
+        return NotImplemented if kobo is None else self.kobo < kobo
+
+    def __le__(self, other):
+        kobo = self._other(other)
+        return NotImplemented if kobo is None else self.kobo <= kobo
+
+    def __gt__(self, other):
+        kobo = self._other(other)
+        return NotImplemented if kobo is None else self.kobo > kobo
+
+    def __ge__(self, other):
+        kobo = self._other(other)
+        return NotImplemented if kobo is None else self.kobo >= kobo
+
+    def __add__(self, other):
+        kobo = self._other(other)
+        return NotImplemented if kobo is None else Money(self.kobo + kobo)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        kobo = self._other(other)
+        return NotImplemented if kobo is None else Money(self.kobo - kobo)
+
+    def __rsub__(self, other):
+        kobo = self._other(other)
+        return NotImplemented if kobo is None else Money(kobo - self.kobo)
+
+    def __neg__(self):
+        return Money(-self.kobo)
+
+    def __abs__(self):
+        return Money(abs(self.kobo))
+
+    def __mul__(self, factor):
+        if isinstance(factor, int) and not isinstance(factor, bool):
+            return Money(self.kobo * factor)
+        if isinstance(factor, (Decimal, float)):
+            kobo = (Decimal(self.kobo) * _to_decimal(factor)).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+            return Money(int(kobo))
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if isinstance(other, Money):
+            return Decimal(self.kobo) / Decimal(other.kobo)
+        if isinstance(other, (int, Decimal, float)) and not isinstance(other, bool):
+            kobo = (Decimal(self.kobo) / _to_decimal(other)).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+            return Money(int(kobo))
+        return NotImplemented
+
+
+ZERO = Money(0)
+
+
+class MoneyField(models.BigIntegerField):
+    """A ``BIGINT`` column of kobo, read and written as ``Money``."""
+
+    description = "Amount of money stored as integer kobo"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return Money(int(value))
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Money):
+            return value
+        try:
+            return Money.from_naira(value)
+        except (TypeError, ValueError, InvalidOperation):
+            raise exceptions.ValidationError(
+                self.error_messages['invalid'],
+                code='invalid',
+                params={'value': value},
+            )
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return self.to_python(value).kobo
+
+    @property
+    def validators(self):
+        # IntegerField's range validators compare raw numbers; Money values
+        # are bounded by the BIGINT column itself.
+        return [*self.default_validators, *self._validators]
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        return '' if value is None else str(value)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'decimal_places': 2,
+            **kwargs,
+        })
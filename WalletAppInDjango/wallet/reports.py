@@ -0,0 +1,164 @@
+"""
+Asynchronous PDF reports.
+
+Building a report with reportlab used to happen inside the admin's request,
+so a big dataset ran into the HTTP timeout and every report held a web
+worker for as long as it took. Reports are now ``ReportJob`` rows:
+
+* ``enqueue`` (the ``admin/reports/`` POST) inserts a queued job and returns
+  at once;
+* ``manage.py run_report_jobs`` claims queued jobs with a conditional
+  ``UPDATE``, so several workers never render the same job, renders them in
+  a process pool and saves each PDF to the default storage under
+  ``reports/``;
+* the client polls the job and downloads the file once it is done.
+
+A job whose worker died mid-render stays ``running``; after
+``REPORT_JOB_TIMEOUT`` seconds it is claimed again, up to
+``REPORT_JOB_MAX_ATTEMPTS`` times, then failed. Finished jobs and their
+files are purged after ``REPORT_RETENTION_DAYS``.
+"""
+import logging
+from concurrent.futures import as_completed
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+
+def _timeout():
+    return timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 600))
+
+
+def _max_attempts():
+    return getattr(settings, 'REPORT_JOB_MAX_ATTEMPTS', 3)
+
+
+def _retention():
+    return timedelta(days=getattr(settings, 'REPORT_RETENTION_DAYS', 7))
+
+
+def download_name(report_type, date_range, moment):
+    stamp = timezone.localtime(moment).strftime('%Y%m%d_%H%M%S')
+    if report_type == ReportJob.PLATFORM:
+        return f'eazipurse_report_{stamp}.pdf'
+    return f'{report_type.replace(" ", "_")}_{date_range}_{stamp}.pdf'
+
+
+def enqueue(user, report_type=ReportJob.PLATFORM, date_range='month'):
+    """Queue a report for ``run_report_jobs``. Returns the ``ReportJob``."""
+    return ReportJob.objects.create(
+        requested_by=user, report_type=report_type, date_range=date_range,
+        filename=download_name(report_type, date_range, timezone.now()),
+    )
+
+
+def _abandoned(now):
+    return Q(status=ReportJob.RUNNING, started_at__lt=now - _timeout())
+
+
+def _claimable(now):
+    return Q(status=ReportJob.QUEUED) | _abandoned(now)
+
+
+def claim(limit):
+    """Mark up to ``limit`` queued (or abandoned) jobs as running for this worker and return them."""
+    now = timezone.now()
+    # Abandoned too often: the report itself is probably what kills the worker.
+    ReportJob.objects.filter(_abandoned(now), attempts__gte=_max_attempts()).update(
+        status=ReportJob.FAILED, error='The worker stopped while rendering this report', finished_at=now,
+    )
+    candidates = list(ReportJob.objects.filter(_claimable(now)).order_by('pk').values_list('pk', flat=True)[:limit])
+    claimed = [
+        pk for pk in candidates
+        if ReportJob.objects.filter(_claimable(now), pk=pk).update(
+            status=ReportJob.RUNNING, started_at=now, attempts=F('attempts') + 1,
+        )
+    ]
+    return list(ReportJob.objects.filter(pk__in=claimed).order_by('pk'))
+
+
+def render(report_type, date_range):
+    """The PDF for a report, as bytes. Runs in the worker pool."""
+    # Every report type renders the platform report, as it did when reports
+    # were built in the request; the type and range name the file.
+    from .utils import generate_platform_report
+
+    return generate_platform_report().getvalue()
+
+
+def complete(job, content):
+    job.file.save(job.filename, ContentFile(content), save=False)
+    ReportJob.objects.filter(pk=job.pk).update(
+        status=ReportJob.DONE, file=job.file.name, error='', finished_at=timezone.now(),
+    )
+
+
+def fail(job, error):
+    ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.FAILED, error=error, finished_at=timezone.now())
+
+
+@dataclass
+class RunResult:
+    done: int = 0
+    failed: int = 0
+    error_samples: list = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.done or self.failed)
+
+
+def run_pending(pool=None, batch_size=10):
+    """
+    Claim up to ``batch_size`` jobs and render them, in ``pool`` (an
+    executor) if given, else in this process. Returns a ``RunResult``.
+    """
+    jobs = claim(batch_size)
+    result = RunResult()
+    if pool is None:
+        outcomes = ((job, _outcome(lambda: render(job.report_type, job.date_range))) for job in jobs)
+    else:
+        futures = {pool.submit(render, job.report_type, job.date_range): job for job in jobs}
+        outcomes = ((futures[future], _outcome(future.result)) for future in as_completed(futures))
+    for job, (content, error) in outcomes:
+        if error is None:
+            try:
+                complete(job, content)
+            except Exception as e:
+                logger.exception(f'Could not store report job {job.pk}')
+                error = f'Could not store the report: {e}'
+        if error is None:
+            result.done += 1
+        else:
+            fail(job, error)
+            result.failed += 1
+            if len(result.error_samples) < 10:
+                result.error_samples.append(f'job {job.pk}: {error}')
+    return result
+
+
+def _outcome(get):
+    """``(content, None)`` from ``get()``, or ``(None, error)`` if rendering failed."""
+    try:
+        return get(), None
+    except Exception as e:
+        logger.exception('Report rendering failed')
+        return None, str(e) or e.__class__.__name__
+
+
+def purge():
+    """Delete finished jobs older than ``REPORT_RETENTION_DAYS``, files included. Returns how many."""
+    jobs = list(ReportJob.objects.filter(
+        status__in=[ReportJob.DONE, ReportJob.FAILED], finished_at__lt=timezone.now() - _retention(),
+    ))
+    for job in jobs:
+        if job.file:
+            job.file.delete(save=False)
+    return ReportJob.objects.filter(pk__in=[job.pk for job in jobs]).delete()[0]
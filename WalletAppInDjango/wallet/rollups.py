@@ -0,0 +1,194 @@
+"""
+Hourly and daily transaction rollups.
+
+The admin analytics used to count and sum the transaction table once per
+figure and twice per day on the chart. ``TransactionRollup`` keeps the count
+and volume of every hour and day instead, by transaction type and verified
+state, so analytics read a handful of small rows whatever the table size.
+
+Rollups are maintained on write, in the same database transaction as the
+write they describe: ``record`` for new transactions and
+``record_verified`` when a deposit is settled. Every writer would otherwise
+queue on the current hour's row, so each call adds to one of
+``TRANSACTION_ROLLUP_SHARDS`` rows per bucket, picked at random, and rows
+are always updated in key order. Writers call these after posting to the
+ledger, so rollup rows are the last locks any of them takes.
+
+``rebuild`` recomputes whole days from the transaction table: the backfill,
+and the fix for drift such as deleted transactions, which are never
+subtracted. Transactions committed in the rebuilt range while it runs can
+be missed; rebuild days that are still being written once they are quiet.
+"""
+import random
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, time as day_time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import Transaction, TransactionRollup
+from .money import ZERO, Money
+
+HOUR = TransactionRollup.HOUR
+DAY = TransactionRollup.DAY
+TRUNCATE = {HOUR: TruncHour, DAY: TruncDay}
+
+
+def _shards():
+    return getattr(settings, 'TRANSACTION_ROLLUP_SHARDS', 8)
+
+
+def bucket_start(moment, period):
+    """Start of the hour or day ``moment`` falls in, in the current time zone."""
+    local = timezone.localtime(moment)
+    if period == DAY:
+        return day_start(local.date())
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(date):
+    return timezone.make_aware(datetime.combine(date, day_time.min))
+
+
+def _deltas(changes):
+    """Sum ``(moment, type, verified, count, kobo)`` changes per rollup key, for both periods."""
+    deltas = defaultdict(lambda: [0, 0])
+    for moment, transaction_type, verified, count, kobo in changes:
+        for period in (HOUR, DAY):
+            delta = deltas[(period, bucket_start(moment, period), transaction_type, verified)]
+            delta[0] += count
+            delta[1] += kobo
+    return deltas
+
+
+def _apply(deltas):
+    shard = random.randrange(_shards())
+    for key in sorted(deltas):
+        count, kobo = deltas[key]
+        if not count and not kobo:
+            continue
+        period, bucket, transaction_type, verified = key
+        row = TransactionRollup.objects.filter(
+            period=period, bucket=bucket, transaction_type=transaction_type, verified=verified, shard=shard,
+        )
+        if row.update(count=F('count') + count, volume=F('volume') + kobo):
+            continue
+        try:
+            with transaction.atomic():
+                TransactionRollup.objects.create(
+                    period=period, bucket=bucket, transaction_type=transaction_type, verified=verified,
+                    shard=shard, count=count, volume=Money(kobo),
+                )
+        except IntegrityError:
+            # Another writer opened the bucket first.
+            row.update(count=F('count') + count, volume=F('volume') + kobo)
+
+
+def record(journals):
+    """Add newly created ``journals`` to the rollups. Call in the transaction that created them."""
+    _apply(_deltas(
+        (journal.transaction_time, journal.transaction_type, journal.verified, 1, journal.amount.kobo)
+        for journal in journals
+    ))
+
+
+def record_verified(journal):
+    """Move ``journal``, just verified, from the unverified to the verified rollups."""
+    kobo = journal.amount.kobo
+    _apply(_deltas([
+        (journal.transaction_time, journal.transaction_type, False, -1, -kobo),
+        (journal.transaction_time, journal.transaction_type, True, 1, kobo),
+    ]))
+
+
+@dataclass
+class Totals:
+    """Counts and volumes by ``(transaction_type, verified)``."""
+    rows: dict = field(default_factory=dict)
+
+    def _select(self, transaction_type, verified):
+        return [
+            value for (row_type, row_verified), value in self.rows.items()
+            if transaction_type in (None, row_type) and verified in (None, row_verified)
+        ]
+
+    def count(self, transaction_type=None, verified=None):
+        return sum(count for count, _ in self._select(transaction_type, verified))
+
+    def volume(self, transaction_type=None, verified=None):
+        return sum((volume for _, volume in self._select(transaction_type, verified)), ZERO)
+
+
+def _range(period, since, until):
+    rollups = TransactionRollup.objects.filter(period=period)
+    if since is not None:
+        rollups = rollups.filter(bucket__gte=since)
+    if until is not None:
+        rollups = rollups.filter(bucket__lt=until)
+    return rollups
+
+
+def totals(since=None, until=None, period=DAY):
+    """``Totals`` of the buckets starting in ``[since, until)``. One query."""
+    rows = _range(period, since, until).values('transaction_type', 'verified').annotate(
+        total_count=Sum('count'), total_volume=Sum('volume'),
+    )
+    return Totals({
+        (row['transaction_type'], row['verified']): (row['total_count'], row['total_volume'] or ZERO)
+        for row in rows
+    })
+
+
+def series(since, until=None, period=DAY):
+    """``{bucket: (count, volume)}`` for the buckets starting in ``[since, until)`` that have any. One query."""
+    rows = _range(period, since, until).values('bucket').annotate(
+        total_count=Sum('count'), total_volume=Sum('volume'),
+    )
+    return {
+        timezone.localtime(row['bucket']): (row['total_count'], row['total_volume'] or ZERO)
+        for row in rows
+    }
+
+
+def daily_series(since, until):
+    """``[(date, count, volume)]`` for every day from ``since`` to ``until`` (dates, inclusive)."""
+    found = {bucket.date(): value for bucket, value in series(day_start(since), day_start(until + timedelta(days=1))).items()}
+    days = (since + timedelta(days=offset) for offset in range((until - since).days + 1))
+    return [(day, *found.get(day, (0, ZERO))) for day in days]
+
+
+def rebuild(since=None, until=None):
+    """
+    Recompute the rollups of the days from ``since`` up to but not including
+    ``until`` (dates; open-ended if ``None``) from the transaction table.
+    Returns the number of rollup rows written.
+    """
+    since = day_start(since) if since else None
+    until = day_start(until) if until else None
+    journals = Transaction.objects.all()
+    if since is not None:
+        journals = journals.filter(transaction_time__gte=since)
+    if until is not None:
+        journals = journals.filter(transaction_time__lt=until)
+
+    with transaction.atomic():
+        for period in (HOUR, DAY):
+            _range(period, since, until).delete()
+        rows = []
+        for period, truncate in TRUNCATE.items():
+            grouped = journals.annotate(bucket=truncate('transaction_time')).values(
+                'bucket', 'transaction_type', 'verified',
+            ).annotate(total_count=Count('pk'), total_volume=Sum('amount')).order_by()
+            rows.extend(
+                TransactionRollup(
+                    period=period, bucket=row['bucket'], transaction_type=row['transaction_type'],
+                    verified=row['verified'], count=row['total_count'], volume=row['total_volume'] or ZERO,
+                )
+                for row in grouped
+            )
+        TransactionRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -12,14 +12,19 @@ class TransferFundSerializer(serializers.Serializer):
     account_number = serializers.CharField(max_length=100)
 
 
+class BulkTransferSerializer(serializers.Serializer):
+    transfers = TransferFundSerializer(many=True, allow_empty=False, max_length=10000)
+
+
 class TransactionSerializer(serializers.ModelSerializer):
     sender = CustomUserSerializer(read_only=True)
     receiver = CustomUserSerializer(read_only=True)
-    
+    amount = serializers.DecimalField(max_digits=20, decimal_places=2, read_only=True)
+
     class Meta:
         model = Transaction
         fields = [
             'id', 'reference', 'transaction_type', 'amount', 
-            'transaction_time', 'verified', 'sender', 'receiver'
+            'transaction_time', 'verified', 'expired', 'sender', 'receiver'
         ]
 
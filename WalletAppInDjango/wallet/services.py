@@ -0,0 +1,290 @@
+"""
+Money movement between wallets.
+
+Each movement is posted to the double-entry ledger (see ``wallet.ledger``),
+which owns the balance projection: balances are changed with conditional
+``UPDATE`` statements in wallet id order, never read-modify-written.
+"""
+from dataclasses import dataclass
+from decimal import InvalidOperation
+from uuid import uuid4
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import counters, leaderboard, ledger, rollups
+from .ledger import LedgerError, WalletNotFound
+from .models import Transaction, Wallet
+from .money import ZERO, Money
+
+
+class TransferError(LedgerError):
+    """Base class for transfer failures that should be reported to the client."""
+
+
+class SelfTransfer(TransferError):
+    pass
+
+
+class InvalidAmount(TransferError):
+    pass
+
+
+@dataclass
+class TransferResult:
+    reference: str
+    amount: Money
+    sender_wallet: Wallet
+    receiver_wallet: Wallet
+    sender_balance: Money
+
+
+def _to_amount(value):
+    try:
+        amount = Money.from_naira(value)
+    except (TypeError, ValueError, InvalidOperation):
+        raise InvalidAmount('Amount must be a number')
+    if amount <= ZERO:
+        raise InvalidAmount('Amount must be greater than zero')
+    return amount
+
+
+def _load_wallets(sender, account_number):
+    # One query for both sides of the transfer.
+    wallets = Wallet.objects.select_related('user').filter(
+        Q(user=sender) | Q(account_number=account_number)
+    )
+    sender_wallet = receiver_wallet = None
+    for wallet in wallets:
+        if wallet.user_id == sender.pk:
+            sender_wallet = wallet
+        if wallet.account_number == account_number:
+            receiver_wallet = wallet
+    if sender_wallet is None or receiver_wallet is None:
+        raise WalletNotFound('Wallet does not exist')
+    return sender_wallet, receiver_wallet
+
+
+def transfer_funds(sender, account_number, amount):
+    """
+    Move ``amount`` from ``sender``'s wallet to the wallet ``account_number``.
+
+    The transfer is a single journal: one ``Transaction`` row and a debit and
+    credit leg. Raises a ``LedgerError`` subclass when the transfer cannot
+    happen; in that case nothing has been written.
+    """
+    amount = _to_amount(amount)
+    sender_wallet, receiver_wallet = _load_wallets(sender, account_number)
+    if sender_wallet.pk == receiver_wallet.pk:
+        raise SelfTransfer('You cannot make transfer to yourself')
+
+    reference = f'ref_{uuid4().hex}'
+    with transaction.atomic():
+        journal = Transaction.objects.create(
+            amount=amount,
+            sender=sender,
+            receiver=receiver_wallet.user,
+            reference=reference,
+            transaction_type='T',
+            verified=True,
+        )
+        balances = ledger.post(journal, [
+            ledger.debit(sender_wallet.pk, amount),
+            ledger.credit(receiver_wallet.pk, amount),
+        ])
+        rollups.record([journal])
+        leaderboard.record([journal])
+        counters.record_transactions([journal])
+    sender_balance = balances[sender_wallet.pk]
+
+    sender_wallet.balance = sender_balance
+    return TransferResult(
+        reference=reference,
+        amount=amount,
+        sender_wallet=sender_wallet,
+        receiver_wallet=receiver_wallet,
+        sender_balance=sender_balance,
+    )
+
+
+def settle_deposit(journal, amount):
+    """
+    Credit a gateway-confirmed deposit to its owner's wallet exactly once.
+
+    The ``verified`` flag is flipped with a conditional update, so concurrent
+    verifications of the same reference cannot credit twice. Returns ``False``
+    if the deposit had already been settled.
+    """
+    amount = _to_amount(amount)
+    with transaction.atomic():
+        claimed = Transaction.objects.filter(pk=journal.pk, verified__in=[False]).update(verified=True, expired=False)
+        if not claimed:
+            return False
+        try:
+            wallet_id = Wallet.objects.values_list('pk', flat=True).get(user_id=journal.sender_id)
+        except Wallet.DoesNotExist:
+            raise WalletNotFound('Wallet does not exist')
+        ledger.post(journal, [
+            ledger.gateway_debit(amount),
+            ledger.credit(wallet_id, amount),
+        ])
+        rollups.record_verified(journal)
+    journal.verified = True
+    journal.expired = False
+    return True
+
+
+def _post_gateway_journal(wallet, amount, transaction_type, legs):
+    with transaction.atomic():
+        journal = Transaction.objects.create(
+            amount=amount,
+            sender_id=wallet.user_id,
+            transaction_type=transaction_type,
+            verified=True,
+        )
+        balances = ledger.post(journal, legs)
+        rollups.record([journal])
+        leaderboard.record([journal])
+        counters.record_transactions([journal])
+    wallet.balance = balances[wallet.pk]
+    return journal
+
+
+def deposit_funds(wallet, amount):
+    """
+    Credit ``amount`` to ``wallet`` from the payment gateway as one verified
+    deposit journal. Returns the journal; ``wallet.balance`` is updated.
+    """
+    amount = _to_amount(amount)
+    return _post_gateway_journal(wallet, amount, 'D', [
+        ledger.gateway_debit(amount),
+        ledger.credit(wallet.pk, amount),
+    ])
+
+
+def withdraw_funds(wallet, amount):
+    """
+    Pay ``amount`` out of ``wallet`` through the payment gateway as one
+    withdrawal journal. Raises ``InsufficientFunds``, with nothing written,
+    if the balance does not cover it.
+    """
+    amount = _to_amount(amount)
+    return _post_gateway_journal(wallet, amount, 'W', [
+        ledger.debit(wallet.pk, amount),
+        ledger.gateway_credit(amount),
+    ])
+
+
+@dataclass
+class BulkTransferLine:
+    line: int
+    account_number: str
+    amount: Money
+    reference: str = None
+    error: str = None
+    recipient_email: str = None
+
+
+@dataclass
+class BulkTransferResult:
+    lines: list
+    total: Money
+    sender_wallet: Wallet
+    sender_balance: Money
+
+    @property
+    def succeeded(self):
+        return [line for line in self.lines if line.error is None]
+
+    @property
+    def failed(self):
+        return [line for line in self.lines if line.error is not None]
+
+
+def _resolve_accounts(account_numbers):
+    """Map account numbers to ``(wallet_id, user_id, email)`` in as few queries as the backend allows."""
+    resolved = {}
+    for chunk in ledger.batches(account_numbers):
+        rows = Wallet.objects.filter(account_number__in=chunk).values_list(
+            'account_number', 'pk', 'user_id', 'user__email'
+        )
+        for account_number, wallet_id, user_id, email in rows:
+            resolved[account_number] = (wallet_id, user_id, email)
+    return resolved
+
+
+def bulk_transfer_funds(sender, payments):
+    """
+    Pay many recipients from ``sender``'s wallet in one atomic unit.
+
+    ``payments`` is a sequence of ``(account_number, amount)`` pairs. Lines
+    that cannot be paid (unknown account, paying yourself, bad amount) are
+    reported back with an error and skipped; every other line is paid. The
+    sender is debited once for the total, payees are credited with batched
+    updates and the ``Transaction`` rows are bulk-inserted. If the sender
+    cannot cover the total, ``InsufficientFunds`` is raised and nothing is
+    written.
+    """
+    try:
+        sender_wallet = Wallet.objects.get(user=sender)
+    except Wallet.DoesNotExist:
+        raise WalletNotFound('Wallet does not exist')
+
+    lines = [
+        BulkTransferLine(line=index, account_number=str(account_number), amount=amount)
+        for index, (account_number, amount) in enumerate(payments, start=1)
+    ]
+    recipients = _resolve_accounts({line.account_number for line in lines})
+
+    journals = []
+    total = ZERO
+    for line in lines:
+        try:
+            line.amount = _to_amount(line.amount)
+        except InvalidAmount as e:
+            line.error = str(e)
+            continue
+        recipient = recipients.get(line.account_number)
+        if recipient is None:
+            line.error = 'Wallet does not exist'
+            continue
+        wallet_id, user_id, line.recipient_email = recipient
+        if wallet_id == sender_wallet.pk:
+            line.error = 'You cannot make transfer to yourself'
+            continue
+        line.reference = f'ref_{uuid4().hex}'
+        total += line.amount
+        journals.append((line, wallet_id, Transaction(
+            amount=line.amount,
+            sender=sender,
+            receiver_id=user_id,
+            reference=line.reference,
+            transaction_type='T',
+            verified=True,
+        )))
+
+    if not journals:
+        return BulkTransferResult(lines=lines, total=total, sender_wallet=sender_wallet,
+                                  sender_balance=sender_wallet.balance)
+
+    with transaction.atomic():
+        created = Transaction.objects.bulk_create([journal for _, _, journal in journals], batch_size=1000)
+        if any(journal.pk is None for journal in created):
+            # Backends that cannot return ids from a bulk insert: look them up
+            # by the references we generated.
+            ids = {}
+            for chunk in ledger.batches(line.reference for line, _, _ in journals):
+                ids.update(Transaction.objects.filter(reference__in=chunk).values_list('reference', 'pk'))
+            for line, _, journal in journals:
+                journal.pk = ids[line.reference]
+        balances = ledger.post_many([
+            (journal, [ledger.debit(sender_wallet.pk, line.amount), ledger.credit(wallet_id, line.amount)])
+            for line, wallet_id, journal in journals
+        ])
+        rollups.record([journal for _, _, journal in journals])
+        leaderboard.record([journal for _, _, journal in journals])
+        counters.record_transactions([journal for _, _, journal in journals])
+    sender_balance = balances[sender_wallet.pk]
+
+    sender_wallet.balance = sender_balance
+    return BulkTransferResult(lines=lines, total=total, sender_wallet=sender_wallet, sender_balance=sender_balance)
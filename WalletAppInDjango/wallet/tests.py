@@ -1,3 +1,1202 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import requests
+from rest_framework.test import APIClient
+
+from . import (
+    aggregates, balance_cache, counters, deposits, fake_paystack, gateway, idempotency, leaderboard, ledger, reports,
+    rollups, webhooks,
+)
+from .models import (
+    GatewayEvent, ReportJob, IdempotencyKey, LedgerEntry, Transaction, TransactionRollup, UserVolumeStats, Wallet,
+    WalletBalanceShard,
+)
+from .accounts import Allocator, check_digit, get_allocator, is_valid_nuban, nuban
+from .ledger import InsufficientFunds, WalletNotFound
+from .money import Money
+from .utils import generate_platform_report
+from .services import SelfTransfer, bulk_transfer_funds, settle_deposit, transfer_funds
+
+User = get_user_model()
+
+
+def make_user(index, balance=Decimal('0.00')):
+    user = User.objects.create_user(
+        email=f'user{index}@example.com',
+        password='pass12345',
+        first_name=f'user{index}',
+        phone=f'080{index:08d}',
+    )
+    if balance:
+        wallet = Wallet.objects.get(user=user)
+        Wallet.objects.filter(pk=wallet.pk).update(balance=balance)
+        ledger.post_opening_balance(wallet, balance)
+    return user
+
+
+def sum_amounts(journals):
+    return sum((journal.amount for journal in journals), Money(0))
+
+
+def assert_ledger_matches_balances(test):
+    balances = ledger.wallet_ledger_balances()
+    for wallet_id, balance in ledger.wallet_balances().items():
+        test.assertEqual(balances.get(wallet_id, Decimal('0.00')), balance)
+
+
+class TransferServiceTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1, Decimal('5000.00'))
+        self.bob = make_user(2)
+
+    def test_transfer_moves_money_and_records_transactions(self):
+        result = transfer_funds(self.alice, self.bob.wallet.account_number, 2000)
+
+        self.assertEqual(result.sender_balance, Decimal('3000.00'))
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, Decimal('2000.00'))
+        journal = Transaction.objects.get(reference=result.reference)
+        self.assertEqual(journal.transaction_type, 'T')
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(journal.entries.count(), 2)
+        assert_ledger_matches_balances(self)
+
+    def test_insufficient_funds_writes_nothing(self):
+        with self.assertRaises(InsufficientFunds):
+            transfer_funds(self.alice, self.bob.wallet.account_number, 6000)
+
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('5000.00'))
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, Decimal('0.00'))
+        self.assertFalse(Transaction.objects.exists())
+        assert_ledger_matches_balances(self)
+
+    def test_rejects_self_and_unknown_wallets(self):
+        with self.assertRaises(SelfTransfer):
+            transfer_funds(self.alice, self.alice.wallet.account_number, 1000)
+        with self.assertRaises(WalletNotFound):
+            transfer_funds(self.alice, '0000000000', 1000)
+
+    def test_withdraw_reports_insufficient_funds(self):
+        wallet = Wallet.objects.get(user=self.bob)
+        self.assertFalse(wallet.withdraw(Decimal('1.00')))
+        self.assertTrue(wallet.deposit(Decimal('10.00')))
+        self.assertTrue(wallet.withdraw(Decimal('4.00')))
+        self.assertEqual(wallet.balance, Decimal('6.00'))
+        self.assertEqual(
+            list(Transaction.objects.filter(sender=self.bob).order_by('pk').values_list('transaction_type', flat=True)),
+            ['D', 'W'],
+        )
+        assert_ledger_matches_balances(self)
+
+
+class BulkTransferTests(TestCase):
+    def setUp(self):
+        self.payer = make_user(1, Decimal('10000.00'))
+        self.payees = [make_user(i) for i in range(2, 6)]
+        self.accounts = [user.wallet.account_number for user in self.payees]
+
+    def test_pays_valid_lines_and_reports_failures(self):
+        payments = [
+            (self.accounts[0], 1000),
+            (self.accounts[1], 2000),
+            ('0000000000', 1000),
+            (self.payer.wallet.account_number, 1000),
+            (self.accounts[0], 500),
+        ]
+        result = bulk_transfer_funds(self.payer, payments)
+
+        self.assertEqual([line.line for line in result.failed], [3, 4])
+        self.assertEqual(result.total, Decimal('3500'))
+        self.assertEqual(result.sender_balance, Decimal('6500.00'))
+        self.assertEqual(Wallet.objects.get(user=self.payees[0]).balance, Decimal('1500.00'))
+        self.assertEqual(Transaction.objects.filter(sender=self.payer).count(), 3)
+        assert_ledger_matches_balances(self)
+
+    def test_insufficient_funds_pays_nobody(self):
+        payments = [(account, 3000) for account in self.accounts]
+        with self.assertRaises(InsufficientFunds):
+            bulk_transfer_funds(self.payer, payments)
+
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(Wallet.objects.get(user=self.payer).balance, Decimal('10000.00'))
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.payer)
+        response = client.post('/wallet/fund/transfer/bulk', {
+            'transfers': [
+                {'account_number': self.accounts[2], 'amount': 1000},
+                {'account_number': '0000000000', 'amount': 1000},
+            ],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['transfers']), 1)
+        self.assertEqual(response.data['failed'][0]['line'], 2)
+        self.assertEqual(response.data['new balance'], '9000.00')
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1, Decimal('10000.00'))
+        self.bob = make_user(2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def post_transfer(self, key, amount=1000):
+        return self.client.post('/wallet/fund/transfer', {
+            'account_number': self.bob.wallet.account_number,
+            'amount': amount,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_transfer_moves_money_once(self):
+        first = self.post_transfer('retry-1')
+        second = self.post_transfer('retry-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('9000.00'))
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        self.post_transfer('retry-2')
+        response = self.post_transfer('retry-2', amount=2000)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    @override_settings(PAYSTACK_GATEWAY='wallet.gateway.StubPaystack')
+    def test_retried_funding_initialises_gateway_once(self):
+        for _ in range(3):
+            response = self.client.post('/wallet/fund/account', {'amount': 5000}, format='json',
+                                        HTTP_IDEMPOTENCY_KEY='fund-1')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(len(gateway.get_client().amounts), 1)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_expired_keys_are_purged(self):
+        self.post_transfer('retry-3')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(idempotency.purge_expired(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@override_settings(PAYSTACK_GATEWAY='wallet.gateway.StubPaystack')
+class GatewayTests(TestCase):
+    def setUp(self):
+        gateway.metrics.reset()
+        self.alice = make_user(1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_funding_round_trip_through_the_stub(self):
+        response = self.client.post('/wallet/fund/account', {'amount': 2500}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/wallet/fund/verify', {'reference': response.data['reference']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('2500.00'))
+        self.assertEqual(gateway.metrics.snapshot()['verify']['calls'], 1)
+
+    def test_client_is_reused(self):
+        self.assertIs(gateway.get_client(), gateway.get_client())
+        with override_settings(PAYSTACK_GATEWAY='wallet.gateway.PaystackClient', PAYSTACK_SECRET_KEY='sk_test'):
+            self.assertIsInstance(gateway.get_client(), gateway.PaystackClient)
+        self.assertIsInstance(gateway.get_client(), gateway.StubPaystack)
+
+    @override_settings(PAYSTACK_SECRET_KEY='sk_test', PAYSTACK_MAX_RETRIES=3,
+                       PAYSTACK_CONNECT_TIMEOUT=1, PAYSTACK_READ_TIMEOUT=4)
+    def test_paystack_client_bounds_and_pools_requests(self):
+        client = gateway.PaystackClient()
+        adapter = client.session.get_adapter('https://api.paystack.co')
+        retry = adapter.max_retries
+
+        self.assertEqual(client.timeout, (1, 4))
+        self.assertEqual(retry.total, 3)
+        self.assertGreater(retry.backoff_jitter, 0)
+        self.assertIn('GET', retry.allowed_methods)
+        self.assertNotIn('POST', retry.allowed_methods)
+        self.assertEqual(client.session.headers['Authorization'], 'Bearer sk_test')
+
+        with mock.patch.object(client.session, 'request', side_effect=requests.ConnectTimeout('slow')) as request:
+            with self.assertRaises(gateway.GatewayError):
+                client.verify('ref_1')
+        self.assertEqual(request.call_args.kwargs['timeout'], (1, 4))
+        self.assertEqual(gateway.metrics.snapshot()['verify']['errors'], 1)
+
+    def test_unreachable_gateway_is_a_bad_gateway(self):
+        with mock.patch.object(gateway.StubPaystack, 'verify', side_effect=gateway.GatewayError('down')):
+            response = self.client.get('/wallet/fund/verify', {'reference': 'ref_1'})
+
+        self.assertEqual(response.status_code, 502)
+
+
+@override_settings(PAYSTACK_SECRET_KEY='sk_test_webhook')
+class WebhookTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1)
+        self.deposit = Transaction.objects.create(amount=Money.from_naira(2500), sender=self.alice)
+        self.client = APIClient()
+
+    def deliver(self, reference=None, amount=250000, event='charge.success', signature=None):
+        body = json.dumps({'event': event, 'data': {
+            'status': 'success', 'reference': reference or self.deposit.reference, 'amount': amount,
+        }}).encode()
+        return self.client.post('/wallet/fund/webhook', body, content_type='application/json',
+                                HTTP_X_PAYSTACK_SIGNATURE=signature or webhooks.sign(body))
+
+    def test_signed_event_is_stored_once_and_credited_by_the_worker(self):
+        self.assertEqual(self.deliver().status_code, 200)
+        self.assertEqual(self.deliver().status_code, 200)
+
+        self.assertEqual(GatewayEvent.objects.count(), 1)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('0.00'))
+
+        self.assertEqual(webhooks.drain(), {GatewayEvent.APPLIED: 1})
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('2500.00'))
+        self.deposit.refresh_from_db()
+        self.assertTrue(self.deposit.verified)
+        assert_ledger_matches_balances(self)
+
+    def test_bad_signature_is_rejected(self):
+        response = self.deliver(signature='0' * 128)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(GatewayEvent.objects.exists())
+
+    def test_unknown_references_and_other_events_are_not_credited(self):
+        self.deliver(reference='ref_unknown')
+        self.deliver(event='transfer.success')
+
+        self.assertEqual(webhooks.drain(), {GatewayEvent.IGNORED: 1})
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('0.00'))
+
+    def test_webhook_after_browser_verification_does_not_credit_twice(self):
+        settle_deposit(self.deposit, Money.from_naira(2500))
+        self.deliver()
+
+        call_command('apply_gateway_events', stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('2500.00'))
+        self.assertEqual(GatewayEvent.objects.get().error, 'Already verified')
+
+    @override_settings(GATEWAY_EVENT_MAX_ATTEMPTS=2, GATEWAY_EVENT_RETRY_SECONDS=60)
+    def test_transient_errors_are_retried_with_backoff_then_failed(self):
+        self.deliver()
+        with mock.patch('wallet.webhooks.credit_deposit', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('wallet.webhooks', 'ERROR'):
+            self.assertEqual(webhooks.drain(), {GatewayEvent.PENDING: 1})
+            event = GatewayEvent.objects.get()
+            self.assertEqual((event.status, event.attempts), (GatewayEvent.PENDING, 1))
+            self.assertGreater(event.next_attempt_at, timezone.now())
+            # Not due yet.
+            self.assertEqual(webhooks.drain(), {})
+
+            GatewayEvent.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(webhooks.drain(), {GatewayEvent.FAILED: 1})
+            self.assertEqual(GatewayEvent.objects.get().error, 'database is locked')
+
+        out = io.StringIO()
+        call_command('apply_gateway_events', '--requeue', stdout=out)
+
+        self.assertIn('Requeued 1 failed event(s).', out.getvalue())
+        self.assertEqual(GatewayEvent.objects.get().status, GatewayEvent.APPLIED)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('2500.00'))
+
+
+@override_settings(PAYSTACK_GATEWAY='wallet.gateway.StubPaystack')
+class ReconcileDepositsTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1)
+
+    def intent(self, naira, initialized=True, age=timedelta(0)):
+        deposit = Transaction.objects.create(amount=Money.from_naira(naira), sender=self.alice)
+        if initialized:
+            gateway.get_client().initialize(self.alice.email, deposit.amount, deposit.reference, 'https://cb')
+        Transaction.objects.filter(pk=deposit.pk).update(transaction_time=timezone.now() - age)
+        return deposit
+
+    def test_credits_confirmed_and_expires_stale_intents(self):
+        paid = [self.intent(1000) for _ in range(5)]
+        stale = self.intent(700, initialized=False, age=timedelta(days=2))
+        recent = self.intent(300, initialized=False)
+
+        result = deposits.reconcile(batch_size=2, workers=3)
+
+        self.assertEqual((result.checked, result.credited, result.expired, result.pending), (7, 5, 1, 1))
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('5000.00'))
+        self.assertTrue(all(Transaction.objects.get(pk=d.pk).verified for d in paid))
+        self.assertTrue(Transaction.objects.get(pk=stale.pk).expired)
+        self.assertFalse(Transaction.objects.get(pk=recent.pk).expired)
+        assert_ledger_matches_balances(self)
+
+        # Settled and expired intents are not looked at again.
+        self.assertEqual(deposits.reconcile().checked, 1)
+
+    def test_gateway_errors_leave_deposits_pending(self):
+        deposit = self.intent(1000)
+        with mock.patch.object(gateway.StubPaystack, 'verify', side_effect=gateway.GatewayError('down')):
+            result = deposits.reconcile()
+
+        self.assertEqual(result.errors, 1)
+        self.assertFalse(Transaction.objects.get(pk=deposit.pk).verified)
+
+    def test_late_confirmation_settles_an_expired_intent(self):
+        deposit = self.intent(1000)
+        Transaction.objects.filter(pk=deposit.pk).update(expired=True)
+
+        self.assertTrue(settle_deposit(Transaction.objects.get(pk=deposit.pk), Money.from_naira(1000)))
+        self.assertFalse(Transaction.objects.get(pk=deposit.pk).expired)
+
+    def test_command_reports_throughput(self):
+        self.intent(1000)
+        out = io.StringIO()
+        call_command('reconcile_deposits', workers=2, stdout=out)
+
+        self.assertIn('1 credited', out.getvalue())
+        self.assertIn('/min', out.getvalue())
+
+
+@override_settings(PAYSTACK_SECRET_KEY='sk_test_fake', PAYSTACK_RETRY_BACKOFF=0, PAYSTACK_RETRY_JITTER=0)
+class FakePaystackTests(TestCase):
+    def start(self, **kwargs):
+        app = fake_paystack.FakePaystack(seed=1, **kwargs)
+        server, url = fake_paystack.serve(app)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = gateway.PaystackClient(base_url=url)
+        self.addCleanup(client.close)
+        return app, client
+
+    def test_initialize_then_verify_over_http(self):
+        app, client = self.start(latency='uniform:1,5')
+
+        response = client.initialize('a@example.com', Money.from_naira(2500), 'ref_fake_1', 'https://cb')
+        self.assertTrue(response['status'])
+        response = client.verify('ref_fake_1')
+
+        self.assertEqual(response['data'], {'status': 'success', 'amount': 250000, 'reference': 'ref_fake_1'})
+        self.assertFalse(client.verify('ref_unknown')['status'])
+
+    def test_server_errors_are_retried_for_verify_only(self):
+        app, client = self.start(error_rate=1.0)
+
+        with self.assertRaises(gateway.GatewayError):
+            client.verify('ref_x')
+        self.assertEqual(app.counts['errors'], 1 + settings.PAYSTACK_MAX_RETRIES)
+
+        with self.assertRaises(gateway.GatewayError):
+            client.initialize('a@example.com', Money.from_naira(10), 'ref_y', 'https://cb')
+        self.assertEqual(app.counts['errors'], 2 + settings.PAYSTACK_MAX_RETRIES)
+
+    @override_settings(PAYSTACK_READ_TIMEOUT=0.2, PAYSTACK_MAX_RETRIES=0)
+    def test_hung_requests_hit_the_read_timeout(self):
+        app, client = self.start(timeout_rate=1.0, timeout=1)
+
+        with self.assertRaises(gateway.GatewayError):
+            client.verify('ref_slow')
+
+    def test_webhooks_are_signed(self):
+        received = []
+
+        def receiver(environ, start_response):
+            body = environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
+            received.append((body, environ.get('HTTP_X_PAYSTACK_SIGNATURE')))
+            start_response('200 OK', [('Content-Length', '0')])
+            return [b'']
+
+        hook_server, hook_url = fake_paystack.serve(receiver)
+        self.addCleanup(hook_server.server_close)
+        self.addCleanup(hook_server.shutdown)
+        app, client = self.start(webhook_url=hook_url, webhook_delay=0)
+
+        client.initialize('a@example.com', Money.from_naira(50), 'ref_hook', 'https://cb')
+        for _ in range(100):
+            if received:
+                break
+            time.sleep(0.02)
+
+        body, signature = received[0]
+        self.assertTrue(webhooks.valid_signature(body, signature))
+        self.assertEqual(json.loads(body)['data']['amount'], 5000)
+
+    def test_latency_specs(self):
+        rng = random.Random(0)
+        self.assertEqual(fake_paystack.Latency('fixed:40').sample(rng), 0.04)
+        self.assertTrue(0.02 <= fake_paystack.Latency('uniform:20,30').sample(rng) <= 0.03)
+        self.assertGreater(fake_paystack.Latency('lognormal:60,0.5').sample(rng), 0)
+        with self.assertRaises(ValueError):
+            fake_paystack.Latency('gamma:1')
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.breaker = gateway.CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: self.now)
+
+    def test_opens_after_failures_then_probes(self):
+        for _ in range(2):
+            self.breaker.before_call()
+            self.breaker.on_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(gateway.CircuitOpen) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 10)
+
+        self.now = 11
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, 'half_open')
+        # Only one probe at a time.
+        with self.assertRaises(gateway.CircuitOpen):
+            self.breaker.before_call()
+
+        self.breaker.on_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.before_call()
+
+    def test_failed_probe_reopens(self):
+        for _ in range(2):
+            self.breaker.on_failure()
+        self.now = 11
+        self.breaker.before_call()
+        self.breaker.on_failure()
+
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertEqual(self.breaker.snapshot()['transitions'], {
+            'closed->open': 1, 'open->half_open': 1, 'half_open->open': 1,
+        })
+
+
+@override_settings(PAYSTACK_GATEWAY='wallet.gateway.StubPaystack', PAYSTACK_BREAKER_FAILURES=2,
+                   PAYSTACK_MAX_CONCURRENCY=1)
+class GatewayGuardTests(TestCase):
+    def setUp(self):
+        gateway.metrics.reset()
+        self.alice = make_user(1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_open_breaker_fails_fast_with_retry_after(self):
+        with mock.patch.object(gateway.StubPaystack, '_verify', side_effect=gateway.GatewayError('down')) as verify:
+            for _ in range(2):
+                self.assertEqual(self.client.get('/wallet/fund/verify', {'reference': 'r'}).status_code, 502)
+            response = self.client.get('/wallet/fund/verify', {'reference': 'r'})
+
+        self.assertEqual(verify.call_count, 2)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(gateway.guard_status()['breaker']['state'], 'open')
+
+    def test_calls_over_the_concurrency_limit_are_refused(self):
+        breaker, bulkhead = gateway.get_guards()
+        bulkhead.acquire()
+        try:
+            response = self.client.post('/wallet/fund/account', {'amount': 1000}, format='json')
+        finally:
+            bulkhead.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(gateway.metrics.snapshot()['rejected'], {'initialize:busy': 1})
+        self.assertEqual(self.client.post('/wallet/fund/account', {'amount': 1000}, format='json').status_code, 200)
+
+
+class AccountNumberTests(TestCase):
+    def test_wallets_use_the_phone_number_when_free(self):
+        user = make_user(1)
+
+        self.assertEqual(user.wallet.account_number, '8000000001')
+
+    def test_taken_or_unusable_phone_numbers_get_an_allocated_nuban(self):
+        squatter = make_user(1)
+        Wallet.objects.filter(user=squatter).update(account_number='8000000002')
+        user = make_user(2)
+        odd = User.objects.create_user(email='odd@example.com', password='pass12345', phone='+2348012')
+
+        for wallet in (Wallet.objects.get(user=user), Wallet.objects.get(user=odd)):
+            self.assertEqual(len(wallet.account_number), 10)
+            self.assertTrue(is_valid_nuban(wallet.account_number))
+            self.assertTrue(wallet.account_number.startswith('1'))
+
+    def test_numbers_come_from_reserved_blocks(self):
+        allocator = Allocator()
+        with self.captureOnCommitCallbacks(execute=True):
+            first = allocator.allocate()
+        with self.assertNumQueries(0):
+            numbers = [allocator.allocate() for _ in range(20)]
+
+        self.assertEqual(len(set([first, *numbers])), 21)
+        self.assertEqual([int(n[:9]) for n in numbers], list(range(int(first[:9]) + 1, int(first[:9]) + 21)))
+        self.assertTrue(all(is_valid_nuban(n) for n in numbers))
+
+    def test_block_reserved_in_a_rolled_back_transaction_is_not_reused(self):
+        allocator = Allocator()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                rolled_back = allocator.allocate()
+                raise RuntimeError
+
+        # The rest of that block was never pooled, and the sequence was
+        # rolled back, so the next reservation hands out the same range afresh.
+        self.assertEqual(allocator.allocate(), rolled_back)
+
+    def test_clash_with_a_legacy_number_moves_on(self):
+        allocator = get_allocator()
+        with self.captureOnCommitCallbacks(execute=True):
+            upcoming = allocator.allocate()
+        legacy_owner = make_user(1)
+        next_number = nuban(int(upcoming[:9]) + 1)
+        Wallet.objects.filter(user=legacy_owner).update(account_number=next_number)
+
+        user = User.objects.create_user(email='new@example.com', password='pass12345', phone='1234')
+
+        self.assertEqual(user.wallet.account_number, nuban(int(upcoming[:9]) + 2))
+
+    def test_admin_wallet_commands_allocate_like_signup(self):
+        squatter = make_user(1)
+        admin = User.objects.create_superuser(email='admin@example.com', password='pass12345')
+        Wallet.objects.filter(user=admin).delete()
+        # Its phone-derived number is taken by someone else.
+        Wallet.objects.filter(user=squatter).update(account_number='8000000000')
+
+        for command in ('fix_admin_wallet', 'ensure_admin_wallet'):
+            call_command(command, stdout=io.StringIO())
+
+        wallet = Wallet.objects.get(user=admin)
+        self.assertEqual(len(wallet.account_number), 10)
+        self.assertTrue(is_valid_nuban(wallet.account_number))
+
+    def test_check_digit(self):
+        # The worked example from the CBN NUBAN standard.
+        self.assertEqual(check_digit(1457, '011'), 9)
+        self.assertTrue(is_valid_nuban('0000014579', '011'))
+        self.assertFalse(is_valid_nuban('0000014578', '011'))
+
+
+class BalanceCacheTests(TestCase):
+    def setUp(self):
+        caches[balance_cache.CACHE_ALIAS].clear()
+        self.alice = make_user(1, Decimal('5000.00'))
+        self.bob = make_user(2)
+        self.alice_wallet = Wallet.objects.get(user=self.alice)
+
+    def test_committed_transfer_writes_through(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            transfer_funds(self.alice, self.bob.wallet.account_number, 2000)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(balance_cache.get_balance(self.alice_wallet.pk), Decimal('3000.00'))
+            self.assertEqual(balance_cache.get_balance(self.bob.wallet.pk), Decimal('2000.00'))
+
+    def test_failed_transfer_leaves_cache_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            transfer_funds(self.alice, self.bob.wallet.account_number, 1000)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(InsufficientFunds):
+                transfer_funds(self.alice, self.bob.wallet.account_number, 9000)
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(balance_cache.get_balance(self.alice_wallet.pk), Decimal('4000.00'))
+
+    def test_older_versions_never_replace_newer(self):
+        balance_cache._store({self.alice_wallet.pk: (5, Money(100))})
+        balance_cache._store({self.alice_wallet.pk: (4, Money(999))})
+
+        self.assertEqual(balance_cache.get_balance(self.alice_wallet.pk), Money(100))
+
+    def test_deposit_and_withdraw_write_through(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice_wallet.withdraw(Decimal('500.00'))
+            self.alice_wallet.deposit(Decimal('20.00'))
+
+        self.assertEqual(balance_cache.get_balance(self.alice_wallet.pk), Decimal('4520.00'))
+
+
+class ShardedBalanceTests(TestCase):
+    def setUp(self):
+        self.house = make_user(1)
+        self.payers = [make_user(i, Decimal('5000.00')) for i in range(2, 5)]
+        self.wallet = Wallet.objects.get(user=self.house)
+        ledger.enable_shards(self.wallet, 4)
+
+    def tearDown(self):
+        ledger.invalidate_shard_cache()
+
+    def test_credits_land_on_shards_and_are_summed_on_read(self):
+        for payer in self.payers:
+            transfer_funds(payer, self.wallet.account_number, 1000)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('0.00'))
+        self.assertEqual(self.wallet.current_balance(), Decimal('3000.00'))
+        assert_ledger_matches_balances(self)
+
+    def test_debit_folds_shards_when_needed(self):
+        for payer in self.payers:
+            transfer_funds(payer, self.wallet.account_number, 1000)
+
+        transfer_funds(self.house, self.payers[0].wallet.account_number, 2500)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.current_balance(), Decimal('500.00'))
+        self.assertEqual(self.wallet.balance, Decimal('500.00'))
+        assert_ledger_matches_balances(self)
+
+    def test_disable_folds_everything_back(self):
+        transfer_funds(self.payers[0], self.wallet.account_number, 1000)
+        ledger.disable_shards(self.wallet)
+        transfer_funds(self.payers[1], self.wallet.account_number, 1000)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('2000.00'))
+        self.assertFalse(WalletBalanceShard.objects.filter(balance__gt=0).exists())
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1, Decimal('5000.00'))
+        self.bob = make_user(2)
+        self.carol = make_user(3)
+
+    def assert_rollups_match_transactions(self):
+        for period in (TransactionRollup.HOUR, TransactionRollup.DAY):
+            totals = rollups.totals(period=period)
+            self.assertEqual(totals.count(), Transaction.objects.count())
+            for transaction_type in ('D', 'T'):
+                for verified in (True, False):
+                    journals = Transaction.objects.filter(transaction_type=transaction_type, verified__in=[verified])
+                    self.assertEqual(totals.count(transaction_type, verified), journals.count())
+                    self.assertEqual(totals.volume(transaction_type, verified), sum_amounts(journals))
+
+    def test_writes_are_rolled_up_as_they_happen(self):
+        transfer_funds(self.alice, self.bob.wallet.account_number, 100)
+        bulk_transfer_funds(self.alice, [(self.bob.wallet.account_number, 50), (self.carol.wallet.account_number, 25)])
+        deposit = Transaction.objects.create(amount=Decimal('300.00'), sender=self.bob)
+        rollups.record([deposit])
+        self.assert_rollups_match_transactions()
+
+        settle_deposit(deposit, Decimal('300.00'))
+
+        self.assert_rollups_match_transactions()
+        totals = rollups.totals(since=rollups.day_start(timezone.localdate()))
+        self.assertEqual((totals.count('D', True), totals.count('D', False)), (1, 0))
+        self.assertEqual(totals.volume(), Decimal('475.00'))
+
+    @override_settings(TRANSACTION_ROLLUP_SHARDS=3)
+    def test_buckets_are_spread_over_shards(self):
+        for _ in range(30):
+            transfer_funds(self.alice, self.bob.wallet.account_number, 1)
+
+        hourly = TransactionRollup.objects.filter(period=TransactionRollup.HOUR)
+        self.assertGreater(hourly.count(), 1)
+        self.assertLessEqual(hourly.count(), 3)
+        self.assertEqual(rollups.totals(period=TransactionRollup.HOUR).count('T', True), 30)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        transfer_funds(self.alice, self.bob.wallet.account_number, 100)
+        old = Transaction.objects.create(amount=Decimal('20.00'), sender=self.carol, verified=True)
+        Transaction.objects.filter(pk=old.pk).update(transaction_time=timezone.now() - timedelta(days=40))
+
+        call_command('rebuild_rollups', stdout=open(os.devnull, 'w'))
+
+        self.assert_rollups_match_transactions()
+        series = rollups.daily_series(timezone.localdate() - timedelta(days=40), timezone.localdate())
+        self.assertEqual(len(series), 41)
+        self.assertEqual(series[0][1:], (1, Decimal('20.00')))
+        self.assertEqual(series[-1][1:], (1, Decimal('100.00')))
+
+    def test_analytics_read_rollups_not_transactions(self):
+        admin = User.objects.create_user(email='admin@example.com', password='x', phone='09000000000', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        transfer_funds(self.alice, self.bob.wallet.account_number, 100)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('admin-analytics'), {'period': 'year'})
+
+        data = response.json()
+        self.assertEqual(data['transaction_analytics']['transactions_today'], 1)
+        self.assertEqual(data['transaction_analytics']['volume_week'], 100.0)
+        self.assertEqual(len(data['daily_activity']), 365)
+        self.assertEqual(data['daily_activity'][-1]['transactions'], 1)
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertFalse([sql for sql in statements if 'transaction_time' in sql])
+        self.assertEqual(len([sql for sql in statements if 'wallet_transactionrollup' in sql]), 5)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1, Decimal('5000.00'))
+        self.bob = make_user(2)
+        self.carol = make_user(3)
+        self.admin = User.objects.create_user(email='admin@example.com', password='x', phone='09000000000', is_staff=True)
+
+    def stats(self):
+        return {
+            stats.user_id: (stats.sent, stats.received, stats.volume, stats.transaction_count)
+            for stats in UserVolumeStats.objects.all()
+        }
+
+    def test_stats_follow_transactions(self):
+        transfer_funds(self.alice, self.bob.wallet.account_number, 300)
+        bulk_transfer_funds(self.alice, [(self.bob.wallet.account_number, 50), (self.carol.wallet.account_number, 25)])
+        transfer_funds(self.bob, self.carol.wallet.account_number, 100)
+        incremental = self.stats()
+
+        self.assertEqual(incremental[self.alice.pk], (Decimal('375.00'), Decimal('0.00'), Decimal('375.00'), 3))
+        self.assertEqual(incremental[self.bob.pk], (Decimal('100.00'), Decimal('350.00'), Decimal('450.00'), 3))
+        leaderboard.rebuild()
+        self.assertEqual(self.stats(), incremental)
+
+    def test_top_reads_highest_volume_first(self):
+        transfer_funds(self.alice, self.bob.wallet.account_number, 300)
+        transfer_funds(self.alice, self.carol.wallet.account_number, 100)
+
+        with self.assertNumQueries(1):
+            top = leaderboard.top(2)
+
+        self.assertEqual([stats.user.email for stats in top], ['user1@example.com', 'user2@example.com'])
+
+    def test_endpoint(self):
+        transfer_funds(self.alice, self.bob.wallet.account_number, 300)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        response = client.get(reverse('admin-leaderboard'), {'limit': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{
+            'id': self.alice.pk, 'name': 'user1', 'email': 'user1@example.com', 'total_volume': 300.0,
+            'sent_amount': 300.0, 'received_amount': 0.0, 'transaction_count': 1,
+        }])
+        client.force_authenticate(self.bob)
+        self.assertEqual(client.get(reverse('admin-leaderboard')).status_code, 403)
+
+    def test_report_and_analytics_do_not_grow_with_users(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        def queries():
+            with CaptureQueriesContext(connection) as context:
+                generate_platform_report()
+                client.get(reverse('admin-analytics'))
+            return len(context.captured_queries)
+
+        transfer_funds(self.alice, self.bob.wallet.account_number, 300)
+        before = queries()
+        for index in range(10, 20):
+            make_user(index)
+            transfer_funds(self.alice, Wallet.objects.get(user__email=f'user{index}@example.com').account_number, 1)
+        self.assertEqual(queries(), before)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1, Decimal('500.00'))
+        self.bob = make_user(2)
+        self.carol = make_user(3)
+        self.admin = User.objects.create_user(email='admin@example.com', password='x', phone='09000000000', is_staff=True)
+        # make_user funds Alice behind the ledger's back.
+        counters.reconcile()
+
+    def assert_counters_match_tables(self):
+        self.assertEqual(counters.snapshot(), counters.recount())
+
+    def test_counters_follow_writes(self):
+        self.assertEqual(counters.snapshot(), counters.Counters(
+            users=4, active_users=4, transactions=0, volume=Money(0), funded_wallets=1,
+        ))
+
+        transfer_funds(self.alice, self.bob.wallet.account_number, 300)
+        bulk_transfer_funds(self.alice, [(self.bob.wallet.account_number, 150), (self.carol.wallet.account_number, 50)])
+        deposit = Transaction.objects.create(amount=Decimal('80.00'), sender=self.alice)
+        counters.record_transactions([deposit])
+        make_user(4)
+
+        # Alice is drained, Bob and Carol are funded.
+        self.assertEqual(counters.snapshot(), counters.Counters(
+            users=5, active_users=5, transactions=4, volume=Money.from_naira(580), funded_wallets=2,
+        ))
+        settle_deposit(deposit, Decimal('80.00'))
+        self.assertEqual(counters.snapshot().funded_wallets, 3)
+        self.assert_counters_match_tables()
+
+    def test_deactivation_is_counted_once(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        client.patch(reverse('admin-user-detail', args=[self.bob.pk]), {'is_active': False}, format='json')
+        client.patch(reverse('admin-user-detail', args=[self.bob.pk]), {'is_active': False}, format='json')
+        self.assertEqual(counters.snapshot().active_users, 3)
+
+        bob = User.objects.get(pk=self.bob.pk)
+        bob.is_active = True
+        bob.save(update_fields=['last_name'])
+        self.assertEqual(counters.snapshot().active_users, 3)
+        bob.save()
+        self.assertEqual(counters.snapshot().active_users, 4)
+        self.assert_counters_match_tables()
+
+    def test_reconcile_corrects_drift(self):
+        transfer_funds(self.alice, self.bob.wallet.account_number, 100)
+        Transaction.objects.all().delete()
+        out = io.StringIO()
+
+        call_command('reconcile_counters', '--check', stdout=out)
+        self.assertIn('transactions: counted 1, actual 0 (-1)', out.getvalue())
+        self.assertNotEqual(counters.snapshot(), counters.recount())
+
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assert_counters_match_tables()
+        self.assertEqual(counters.reconcile(), {})
+
+    def test_admin_dashboard_does_not_grow_with_tables(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        def queries():
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(reverse('admin-dashboard'))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+            return len(context.captured_queries), response.json()
+
+        transfer_funds(self.alice, self.bob.wallet.account_number, 300)
+        before, _ = queries()
+        for index in range(10, 20):
+            make_user(index)
+            transfer_funds(self.alice, Wallet.objects.get(user__email=f'user{index}@example.com').account_number, 1)
+        after, data = queries()
+
+        self.assertEqual(after, before)
+        self.assertEqual(
+            (data['total_users'], data['active_users'], data['total_transactions'], data['total_transaction_volume'],
+             data['active_wallets']),
+            (14, 14, 11, 310.0, 12),
+        )
+
+
+class AggregateTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1, Decimal('1000.00'))
+        self.bob = make_user(2)
+        transfer_funds(self.alice, self.bob.wallet.account_number, 300)
+        transfer_funds(self.alice, self.bob.wallet.account_number, 50)
+        Transaction.objects.create(amount=Decimal('20.00'), receiver=self.bob)
+
+    def test_computes_every_figure_in_one_query(self):
+        with self.assertNumQueries(1):
+            figures = aggregates.aggregate(
+                Transaction.objects.filter(Q(sender=self.bob) | Q(receiver=self.bob)),
+                transactions=aggregates.count(),
+                volume=aggregates.total('amount'),
+                verified=aggregates.count(Q(verified__in=[True])),
+                verified_volume=aggregates.total('amount', Q(verified__in=[True])),
+            )
+
+        self.assertEqual(figures, {
+            'transactions': 3, 'volume': Money.from_naira(370), 'verified': 2,
+            'verified_volume': Money.from_naira(350),
+        })
+
+    def test_empty_sets_give_zero(self):
+        figures = aggregates.aggregate(
+            Transaction.objects.filter(sender=self.bob), transactions=aggregates.count(), volume=aggregates.total(),
+        )
+
+        self.assertEqual(figures, {'transactions': 0, 'volume': Money(0)})
+        self.assertIsInstance(aggregates.volume(Transaction.objects.none()), Money)
+
+    def test_builds_a_mongo_pipeline(self):
+        steps = aggregates.pipeline(
+            Transaction.objects.filter(Q(sender=self.bob) | Q(receiver=self.bob), amount__gte=Money(100)),
+            {'transactions': aggregates.count(), 'verified_volume': aggregates.total('amount', Q(verified__in=[True]))},
+        )
+
+        self.assertEqual(steps, [
+            {'$match': {'$and': [
+                {'$or': [{'sender_id': {'$eq': self.bob.pk}}, {'receiver_id': {'$eq': self.bob.pk}}]},
+                {'amount': {'$gte': 100}},
+            ]}},
+            {'$group': {
+                '_id': None,
+                'transactions': {'$sum': 1},
+                'verified_volume': {'$sum': {'$cond': [{'$and': [{'$in': ['$verified', [True]]}]}, '$amount', 0]}},
+            }},
+        ])
+
+    def test_untranslatable_filters_fall_back_to_one_query_per_figure(self):
+        queryset = Transaction.objects.filter(sender__email='user1@example.com')
+        with self.assertRaises(aggregates.Unsupported):
+            aggregates.pipeline(queryset, {'transactions': aggregates.count()})
+
+        with mock.patch.object(aggregates, 'is_mongo', return_value=True), self.assertNumQueries(2):
+            figures = aggregates.aggregate(queryset, transactions=aggregates.count(), volume=aggregates.total())
+
+        self.assertEqual(figures, {'transactions': 2, 'volume': Money.from_naira(350)})
+
+
+class ReportJobTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_root = override_settings(MEDIA_ROOT=media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.admin = User.objects.create_user(email='admin@example.com', password='x', phone='09000000000', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        make_user(1, Decimal('100.00'))
+
+    def request_report(self, **data):
+        response = self.client.post(reverse('admin-reports'), data, format='json')
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_request_only_queues_the_job(self):
+        with mock.patch.object(reports, 'render') as render:
+            job = self.request_report(report_type='Transaction Summary Report', date_range='week')
+
+        render.assert_not_called()
+        self.assertEqual((job['status'], job['download_url']), (ReportJob.QUEUED, None))
+        self.assertTrue(job['filename'].startswith('Transaction_Summary_Report_week_'))
+        self.assertEqual(self.client.post(reverse('admin-reports'), {'report_type': 'Nope'}).status_code, 400)
+        user = APIClient()
+        user.force_authenticate(User.objects.get(email='user1@example.com'))
+        self.assertEqual(user.post(reverse('admin-reports'), {}).status_code, 403)
+
+    def test_worker_renders_and_client_downloads(self):
+        job = self.request_report()
+        download = reverse('admin-report-download', args=[job['id']])
+        self.assertEqual(self.client.get(download).status_code, 409)
+
+        result = reports.run_pending()
+
+        self.assertEqual((result.done, result.failed), (1, 0))
+        polled = self.client.get(reverse('admin-report', args=[job['id']])).json()
+        self.assertEqual(polled['status'], ReportJob.DONE)
+        self.assertTrue(polled['download_url'].endswith(download))
+        response = self.client.get(download)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'filename="{job["filename"]}"', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        response.close()
+
+    def test_pool_failures_are_recorded(self):
+        first, second = self.request_report(), self.request_report()
+
+        def render(report_type, date_range):
+            if render.calls:
+                raise ValueError('out of paper')
+            render.calls += 1
+            return b'%PDF-1.4 stub'
+        render.calls = 0
+
+        with mock.patch.object(reports, 'render', render), ThreadPoolExecutor(1) as pool:
+            with self.assertLogs('wallet.reports', 'ERROR'):
+                result = reports.run_pending(pool)
+
+        self.assertEqual((result.done, result.failed), (1, 1))
+        jobs = {job.pk: job for job in ReportJob.objects.all()}
+        self.assertEqual(jobs[first['id']].status, ReportJob.DONE)
+        self.assertEqual((jobs[second['id']].status, jobs[second['id']].error), (ReportJob.FAILED, 'out of paper'))
+
+    def test_abandoned_jobs_are_retried_then_failed(self):
+        job = reports.enqueue(self.admin)
+        self.assertEqual(reports.claim(5), [job])
+        self.assertEqual(reports.claim(5), [])
+
+        ReportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(reports.claim(5), [job])
+        ReportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1), attempts=3)
+        self.assertEqual(reports.claim(5), [])
+        self.assertEqual(ReportJob.objects.get(pk=job.pk).status, ReportJob.FAILED)
+
+    def test_old_reports_are_purged_with_their_files(self):
+        job = reports.enqueue(self.admin)
+        call_command('run_report_jobs', '--workers', '0', stdout=io.StringIO())
+        job.refresh_from_db()
+        path = job.file.path
+        self.assertTrue(os.path.exists(path))
+
+        ReportJob.objects.filter(pk=job.pk).update(finished_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(reports.purge(), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ReportJob.objects.exists())
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.alice = make_user(1)
+        self.wallet = Wallet.objects.get(user=self.alice)
+
+    def test_unbalanced_journal_is_rejected(self):
+        journal = Transaction.objects.create(amount=Decimal('10.00'), sender=self.alice)
+        with self.assertRaises(ledger.UnbalancedJournal):
+            ledger.post(journal, [ledger.credit(self.wallet.pk, Decimal('10.00'))])
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_settle_deposit_credits_once(self):
+        journal = Transaction.objects.create(amount=Decimal('1500.00'), sender=self.alice)
+
+        self.assertTrue(settle_deposit(journal, Decimal('1500.00')))
+        self.assertFalse(settle_deposit(journal, Decimal('1500.00')))
+
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).balance, Decimal('1500.00'))
+        self.assertEqual(journal.entries.count(), 2)
+        assert_ledger_matches_balances(self)
+
+    def test_entries_are_append_only(self):
+        journal = Transaction.objects.create(amount=Decimal('5.00'), sender=self.alice)
+        settle_deposit(journal, Decimal('5.00'))
+        entry = journal.entries.first()
+        with self.assertRaises(ValidationError):
+            entry.save()
+        with self.assertRaises(ValidationError):
+            entry.delete()
+
+
+class MoneyTests(TestCase):
+    def test_plain_numbers_are_naira(self):
+        self.assertEqual(Money.from_naira('1234.565').kobo, 123457)
+        self.assertEqual(Money.from_naira(0.1) + Money.from_naira(0.2), Money(30))
+        self.assertEqual(Money(150) * 3, Decimal('4.50'))
+        self.assertEqual(str(Money(-5)), '-0.05')
+        self.assertEqual(f'{Money(123456789):,.2f}', '1,234,567.89')
+
+    def test_amounts_are_stored_as_kobo(self):
+        alice = make_user(1)
+        journal = Transaction.objects.create(amount=Decimal('12.34'), sender=alice)
+        self.assertEqual(Transaction.objects.filter(amount=Money(1234)).get(), journal)
+        self.assertEqual(Transaction.objects.values_list('amount', flat=True).get(), Money(1234))
+
+    def test_balances_are_not_capped_at_ten_digits(self):
+        wallet = Wallet.objects.get(user=make_user(1))
+        self.assertTrue(wallet.deposit(Decimal('987654321012.34')))
+        self.assertEqual(Wallet.objects.get(pk=wallet.pk).balance, Decimal('987654321012.34'))
+
+    def test_kobo_migration_rewrites_mongo_documents(self):
+        from bson import Decimal128, Int64
+        from django.apps import apps
+
+        migration = importlib.import_module('wallet.migrations.0020_money_minor_units')
+        documents = {
+            table: [{'_id': 1, column: Decimal128('12.34')}, {'_id': 2, column: Decimal128('0.005')}]
+            for table, column in [('wallet_wallet', 'balance'), ('wallet_walletbalanceshard', 'balance'),
+                                  ('wallet_transaction', 'amount'), ('wallet_ledgerentry', 'amount')]
+        }
+
+        class Collection:
+            def __init__(self, table):
+                self.table = table
+
+            def find(self, query, projection):
+                return [dict(document) for document in documents[self.table]]
+
+            def bulk_write(self, updates, ordered):
+                for update in updates:
+                    document = next(d for d in documents[self.table] if d['_id'] == update._filter['_id'])
+                    document.update(update._doc['$set'])
+
+        schema_editor = mock.Mock()
+        schema_editor.connection.vendor = 'djongo'
+        schema_editor.connection.connection = {table: Collection(table) for table in documents}
+
+        migration.naira_to_kobo(apps, schema_editor)
+        self.assertEqual(documents['wallet_transaction'], [{'_id': 1, 'amount': 1234}, {'_id': 2, 'amount': 1}])
+        self.assertIsInstance(documents['wallet_wallet'][0]['balance'], Int64)
+
+        migration.kobo_to_naira(apps, schema_editor)
+        self.assertEqual(documents['wallet_ledgerentry'][0]['amount'], Decimal128('12.34'))
+
+
+class TransferConcurrencyTests(TransactionTestCase):
+    """Hammer a few wallets from many threads and check no money is created or lost."""
+
+    wallets = 4
+    threads = 8
+    transfers_per_thread = 25
+
+    def test_concurrent_transfers_conserve_money(self):
+        users = [make_user(i, Decimal('10000.00')) for i in range(self.wallets)]
+        accounts = [Wallet.objects.get(user=user).account_number for user in users]
+        expected_total = Decimal('10000.00') * self.wallets
+        errors = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(self.transfers_per_thread):
+                    sender, receiver = rng.sample(range(self.wallets), 2)
+                    try:
+                        transfer_funds(users[sender], accounts[receiver], rng.choice([1000, 2500, 4000]))
+                    except InsufficientFunds:
+                        pass
+                    except OperationalError:
+                        # SQLite locks the whole database; a busy writer is a
+                        # failed transfer, not lost money.
+                        pass
+            except Exception as e:  # pragma: no cover - surfaced below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        balances = list(Wallet.objects.values_list('balance', flat=True))
+        self.assertEqual(sum(balances, Decimal('0.00')), expected_total)
+        self.assertTrue(all(balance >= 0 for balance in balances))
+        self.assertGreater(Transaction.objects.filter(transaction_type='T').count(), 0)
+        assert_ledger_matches_balances(self)
+
+
+@override_settings(OUTBOX_DISPATCH_IN_PROCESS=False)
+class BenchmarkCommandTests(TransactionTestCase):
+    def test_mixed_workload_keeps_invariants(self):
+        fd, output = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, output)
+
+        call_command('benchmark_wallet', wallets=4, threads=3, operations=15, output=output, stdout=open(os.devnull, 'w'))
+
+        with open(output) as f:
+            report = json.load(f)
+        self.assertTrue(report['invariants']['total_conserved'])
+        self.assertTrue(report['invariants']['no_negative_balances'])
+        self.assertTrue(report['invariants']['ledger_matches_balances'])
+        self.assertEqual(sum(stats['count'] for name, stats in report['operations'].items() if name != 'verify'), 45)
+        for stats in report['operations'].values():
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertFalse(Wallet.objects.exists())
@@ -11,9 +11,12 @@ urlpatterns = [
 
     path('fund/verify', views.verify_fund, name = 'verify_fund'),
 
+    path('fund/webhook', views.paystack_webhook, name = 'paystack_webhook'),
+
     path('fund/transfer', views.transfer, name = 'transfer'),
+
+    path('fund/transfer/bulk', views.bulk_transfer, name = 'bulk_transfer'),
     
     path('transactions/', views.transaction_history, name='transaction_history'),
     path('admin/transactions/', views.admin_transaction_history, name='admin_transaction_history'),
-    path('admin/report/', views.generate_report, name='generate_report'),
 ]
\ No newline at end of file
@@ -6,32 +6,14 @@ from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from io import BytesIO
 from datetime import datetime, timedelta
-from decimal import Decimal
 from django.db.models import Sum, Count, Q
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from bson.decimal128 import Decimal128
+from . import aggregates, leaderboard
 from .models import Transaction, Wallet
 
 User = get_user_model()
 
-def normalize_decimal_value(value):
-    if value is None:
-        return Decimal('0.00')
-    if isinstance(value, Decimal):
-        return value
-    if isinstance(value, Decimal128):
-        return value.to_decimal()
-    if hasattr(value, 'to_decimal'):
-        return value.to_decimal()
-    return Decimal(str(value))
-
-
-def safe_amount_sum(queryset):
-    return sum(
-        (normalize_decimal_value(value) for value in queryset.values_list('amount', flat=True)),
-        Decimal('0.00')
-    )
 
 def generate_platform_report():
     """
@@ -79,15 +61,32 @@ def generate_platform_report():
         story.append(Paragraph("Executive Summary", heading_style))
         
         # Get platform statistics
-        total_users = User.objects.count()
-        active_users = User.objects.filter(is_active__in=[True], account_status='active').count()
-        pending_users = User.objects.filter(account_status='pending').count()
-        suspended_users = User.objects.filter(account_status='suspended').count()
-        
-        total_transactions = Transaction.objects.count()
-        total_volume = safe_amount_sum(Transaction.objects.all())
-        verified_transactions = Transaction.objects.filter(verified__in=[True]).count()
-        pending_transactions = Transaction.objects.filter(verified__in=[False]).count()
+        users = aggregates.aggregate(
+            User.objects.all(),
+            total=aggregates.count(),
+            active=aggregates.count(Q(is_active__in=[True], account_status='active')),
+            pending=aggregates.count(Q(account_status='pending')),
+            suspended=aggregates.count(Q(account_status='suspended')),
+        )
+        total_users = users['total']
+        active_users = users['active']
+        pending_users = users['pending']
+        suspended_users = users['suspended']
+        
+        transactions = aggregates.aggregate(
+            Transaction.objects.all(),
+            total=aggregates.count(),
+            volume=aggregates.total('amount'),
+            verified=aggregates.count(Q(verified__in=[True])),
+            pending=aggregates.count(Q(verified__in=[False])),
+            deposits=aggregates.count(Q(transaction_type='D')),
+            transfers=aggregates.count(Q(transaction_type='T')),
+            withdrawals=aggregates.count(Q(transaction_type='W')),
+        )
+        total_transactions = transactions['total']
+        total_volume = transactions['volume']
+        verified_transactions = transactions['verified']
+        pending_transactions = transactions['pending']
         
         # Calculate revenue (1% of total volume)
         revenue = float(total_volume) * 0.01
@@ -129,18 +128,18 @@ def generate_platform_report():
         
         # Get recent statistics
         thirty_days_ago = timezone.now() - timedelta(days=30)
-        recent_transactions = Transaction.objects.filter(
-            transaction_time__gte=thirty_days_ago
-        ).count()
+        recent = aggregates.aggregate(
+            Transaction.objects.filter(transaction_time__gte=thirty_days_ago),
+            transactions=aggregates.count(),
+            volume=aggregates.total('amount'),
+        )
+        recent_transactions = recent['transactions']
+        recent_volume = recent['volume']
         
         recent_users = User.objects.filter(
             date_joined__gte=thirty_days_ago
         ).count()
         
-        recent_volume = safe_amount_sum(Transaction.objects.filter(
-            transaction_time__gte=thirty_days_ago
-        ))
-        
         recent_data = [
             ['Period', 'Transactions', 'New Users', 'Volume'],
             ['Last 30 Days', str(recent_transactions), str(recent_users), f'₦{recent_volume:,.2f}'],
@@ -167,35 +166,18 @@ def generate_platform_report():
         # Top Users by Transaction Volume
         story.append(Paragraph("Top Users by Transaction Volume", heading_style))
         
-        # Get users with their transaction volumes
-        users_with_transactions = []
-        for user in User.objects.all():
-            sent_amount = safe_amount_sum(Transaction.objects.filter(sender=user))
-            received_amount = safe_amount_sum(Transaction.objects.filter(receiver=user))
-            total_volume = float(sent_amount) + float(received_amount)
-            
-            if total_volume > 0:
-                users_with_transactions.append({
-                    'user': user,
-                    'total_volume': total_volume,
-                    'sent_amount': float(sent_amount),
-                    'received_amount': float(received_amount)
-                })
-        
-        # Sort by total volume and take top 10
-        users_with_transactions.sort(key=lambda x: x['total_volume'], reverse=True)
-        top_users = users_with_transactions[:10]
+        # Read off the leaderboard index instead of summing every user's history
+        top_users = leaderboard.top(10)
         
         if top_users:
             user_data = [['Rank', 'User', 'Email', 'Total Volume']]
-            for i, user_data_item in enumerate(top_users, 1):
-                user = user_data_item['user']
-                total_volume = user_data_item['total_volume']
+            for i, stats in enumerate(top_users, 1):
+                user = stats.user
                 user_data.append([
                     str(i),
                     f"{user.first_name} {user.last_name}".strip() or user.email,
                     user.email,
-                    f'₦{total_volume:,.2f}'
+                    f'₦{float(stats.volume):,.2f}'
                 ])
             
             user_table = Table(user_data, colWidths=[0.5*inch, 2*inch, 2*inch, 1.5*inch])
@@ -222,9 +204,9 @@ def generate_platform_report():
         # Transaction Types Breakdown
         story.append(Paragraph("Transaction Types Breakdown", heading_style))
         
-        deposit_count = Transaction.objects.filter(transaction_type='D').count()
-        transfer_count = Transaction.objects.filter(transaction_type='T').count()
-        withdrawal_count = Transaction.objects.filter(transaction_type='W').count()
+        deposit_count = transactions['deposits']
+        transfer_count = transactions['transfers']
+        withdrawal_count = transactions['withdrawals']
         
         type_data = [
             ['Transaction Type', 'Count', 'Percentage'],
@@ -1,27 +1,30 @@
+import math
 import os
-from decimal import Decimal
-from datetime import datetime
-from django.utils import timezone
-
-import requests
 
 from uuid import uuid4
 
-from django.core.mail import send_mail
 from django.db import transaction, models
 from django.http import HttpResponse
 
 from django.conf import settings
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render
 from django.http import HttpResponse
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from .models import Transaction, Wallet
-from .utils import generate_platform_report
+from notifications import mailer, outbox
+
+from . import counters, gateway, leaderboard, rollups, webhooks
+from .deposits import credit_deposit
+from .gateway import GatewayError, GatewayUnavailable
+from .models import Transaction
+from .idempotency import idempotent
+from .ledger import LedgerError, WalletNotFound
+from .money import Money
+from .services import bulk_transfer_funds, transfer_funds
 
-from wallet.serializers import FundSerializer, TransferFundSerializer, TransactionSerializer
+from wallet.serializers import BulkTransferSerializer, FundSerializer, TransferFundSerializer, TransactionSerializer
 
 
 @api_view()
@@ -33,8 +36,18 @@ def greeting(request, name):
 
 def second_greeting(request, name):
     return render(request, 'hello.html', {'name': name})
+
+
+def gateway_unavailable(error):
+    """503 for a gateway call refused by the breaker or bulkhead; safe to retry."""
+    response = Response({"message": str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+
 @permission_classes([IsAuthenticated])
 @api_view(['POST'])
+@idempotent
 def fund_wallet(request):
     # Check if user can operate
     if not request.user.can_operate:
@@ -46,42 +59,33 @@ def fund_wallet(request):
     try:
         data=FundSerializer(data=request.data)
         data.is_valid(raise_exception=True)
-        amount = data.validated_data['amount']
-        amount*= 100
+        amount = Money.from_naira(data.validated_data['amount'])
         email = request.user.email
         reference = f'ref_{uuid4().hex}'
 
 
 
-        Transaction.objects.create(
-            amount=(amount/100),
-            reference=reference,
-            sender =  request.user,
-            )
-
-        url = 'https://api.paystack.co/transaction/initialize'
-
-        secret = settings.PAYSTACK_SECRET_KEY
-        headers = {
-            "Authorization": f"Bearer {secret}",
-        }
+        with transaction.atomic():
+            journal = Transaction.objects.create(
+                amount=amount,
+                reference=reference,
+                sender =  request.user,
+                )
+            rollups.record([journal])
+            leaderboard.record([journal])
+            counters.record_transactions([journal])
 
         callback_url = os.getenv('PAYSTACK_CALLBACK_URL', 'https://eazipurse-ng.onrender.com/wallet/verify')
 
-
-        data = {
-            "amount": amount,
-            "reference": reference,
-            "email": email,
-            "callback_url": callback_url,
-        }
-
-        response_str = requests.post(url=url, json=data, headers=headers)
-        response = response_str.json()
+        response = gateway.get_client().initialize(email, amount, reference, callback_url)
         if response['status']:
             return Response(data=response['data'], status=status.HTTP_200_OK)
         return Response({"message": "Unable to complete transactions"}, status=status.HTTP_302_FOUND)
 
+    except GatewayUnavailable as e:
+        return gateway_unavailable(e)
+    except GatewayError as e:
+        return Response({"message": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
     except Exception as e:
         return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -98,49 +102,30 @@ curl https://api.paystack.co/transaction/initialize
 def verify_fund(request):
 
     reference = request.GET.get('reference')
-    secret = settings.PAYSTACK_SECRET_KEY
-
-    headers = {
-        "Authorization": f"Bearer {secret}",
-    }
-
-    url =f'https://api.paystack.co/transaction/verify/{reference}'
-    response_str = requests.get(url=url, headers=headers)
-    response = response_str.json()
+    try:
+        response = gateway.get_client().verify(reference)
+    except GatewayUnavailable as e:
+        return gateway_unavailable(e)
+    except GatewayError as e:
+        return Response({"message": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
     if response['status'] and response['data']['status'] == 'success': 
-        amount = response['data']['amount'] / 100
+        amount = Money(response['data']['amount'])
         try:
-            transaction = Transaction.objects.get(reference=reference)
+            deposit = Transaction.objects.select_related('sender').get(reference=reference)
         except Transaction.DoesNotExist:
             return Response({"message": "Transaction does not exist"}, status=status.HTTP_404_NOT_FOUND)
 
-        if transaction.verified:
+        if deposit.verified:
             return Response({"message": "Transaction already verified"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Get the user from the transaction instead of request.user
-        user = transaction.sender
-        wallet = get_object_or_404(Wallet, user=user) #django's shortcut to get from model, instead of try and catch
-        deposit_amount = Decimal(str(amount))
-        wallet.deposit(deposit_amount)
-        transaction.verified = True
-        transaction.save()
-        subject="EaziPurse Transaction Alert"
-        message = f"""
-            Transaction History:
-            Your wallet has been funded with: ₦{amount}
-            Reference: {reference}
-            *** Thank you for using EaziPurse ***
-        """
-        from_email = settings.EMAIL_HOST_USER
-        recipient_email= user.email
         try:
-            send_mail(subject=subject,
-                      message=message,
-                      from_email=from_email,
-                      recipient_list=[recipient_email])
-        except Exception as mail_error:
-            # Log email sending failures but still complete the transaction.
-            print(f"Failed to send transaction email: {mail_error}")
+            # The alert is queued with the deposit and sent once it commits.
+            settled = credit_deposit(deposit, amount)
+        except WalletNotFound:
+            return Response({"message": "Wallet does not exist"}, status=status.HTTP_404_NOT_FOUND)
+        if not settled:
+            return Response({"message": "Transaction already verified"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({"message": "Transaction successfully verified"}, status=status.HTTP_200_OK)
     return Response({"message": "Unable to verify transaction"}, status=status.HTTP_400_BAD_REQUEST)
@@ -219,8 +204,32 @@ curl https://api.paystack.co/transferrecipient
 
 
 
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def paystack_webhook(request):
+    """
+    Receive Paystack's signed webhooks. Successful charges are stored and
+    credited later by ``manage.py apply_gateway_events``; Paystack only needs
+    a quick 200, and retries anything else.
+    """
+    raw_body = request.body
+    if not webhooks.valid_signature(raw_body, request.headers.get(webhooks.SIGNATURE_HEADER)):
+        return Response({"message": "Invalid signature"}, status=status.HTTP_401_UNAUTHORIZED)
+
+    payload = webhooks.parse(raw_body)
+    if payload is None:
+        return Response({"message": "Invalid payload"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        webhooks.record_event(payload, raw_body)
+    except (KeyError, TypeError, ValueError):
+        return Response({"message": "Invalid payload"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"message": "Received"}, status=status.HTTP_200_OK)
+
+
 @permission_classes([IsAuthenticated])
 @api_view(['POST'])
+@idempotent
 def transfer(request):
     # Check if user can operate
     if not request.user.can_operate:
@@ -234,72 +243,79 @@ def transfer(request):
     amount = data.validated_data['amount']
     recipient_account_number = data.validated_data['account_number']
 
-    # sender=Wallet.objects.get(user=request.user)
-    sender_wallet = get_object_or_404(Wallet, user=request.user)
-    receiver_wallet = get_object_or_404(Wallet, account_number=recipient_account_number)
-
     sender = request.user
-    receiver = receiver_wallet.user
+    subject="EaziPurse Transaction Alert"
+    from_email = settings.EMAIL_HOST_USER
+    try:
+        # Alerts are queued in the transfer's transaction and sent after it
+        # commits, so SMTP never holds wallet rows locked or undoes a transfer.
+        with transaction.atomic():
+            result = transfer_funds(sender, recipient_account_number, amount)
+            receiver = result.receiver_wallet.user
+            reference = result.reference
+            context = {'reference': reference, 'amount': amount, 'sender': sender, 'receiver': receiver}
+            outbox.enqueue_many([
+                (subject, mailer.render('email/alerts/transfer_sent.txt', context), from_email, [sender.email]),
+                (subject, mailer.render('email/alerts/transfer_received.txt', context), from_email, [receiver.email]),
+            ])
+    except WalletNotFound as e:
+        return Response({"message": str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except LedgerError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    with transaction.atomic():
-        reference = f'ref_{uuid4().hex}'
-        try:
-            if sender_wallet == receiver_wallet:
-                return Response({"message": "You cannot make transfer to yourself"}, status=status.HTTP_400_BAD_REQUEST)
-            sender_wallet.withdraw(amount)
-        except Wallet.DoesNotExist:
-            return Response({"message": "Wallet does not exist"}, status=status.HTTP_404_NOT_FOUND)
-        except ValueError:
-            return Response({"message": "Insufficient funds"}, status=status.HTTP_400_BAD_REQUEST)
-
-        sender_wallet.save()
-
-        Transaction.objects.create(
-            amount=amount,
-            sender=sender,
-            receiver=receiver,
-            reference=reference,
-            transaction_type='T',
-            verified=True,
-        )
+    return Response({"message": f"Transfer to {recipient_account_number} was successful", "reference": f"{reference}"
+                                , "new balance": f'{result.sender_balance}' }, status=status.HTTP_200_OK)
 
-        subject="EaziPurse Transaction Alert"
-        message=f"""
-        Transaction History:
-        Reference id: {reference}
-        You transferred ₦{amount} to {receiver.first_name or 'Unknown'} {receiver.last_name or ''}
-        ***Thank you for using EaziPurse***
-        """
-        from_email = settings.EMAIL_HOST_USER
-        sender_email = sender.email
-        send_mail(subject=subject,message=message,from_email=from_email,recipient_list=[sender_email])
-
-
-        receiver_wallet.deposit(amount)
-        receiver_wallet.save()
-        reference=f"ref_{uuid4().hex}"
-        Transaction.objects.create(
-            amount=amount,
-            receiver=receiver,
-            reference=reference,
-            transaction_type='D',
-            verified=True,
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def bulk_transfer(request):
+    """Pay many wallets from the current user's wallet in one request."""
+    if not request.user.can_operate:
+        return Response(
+            {"message": "Your account is not active. Please contact support."},
+            status=status.HTTP_403_FORBIDDEN
         )
 
-        subject = "EaziPurse Transaction Alert"
-        message = f"""
-        Transaction History:
-        Reference id: {reference}
-        You have received ₦{amount} from {sender.first_name or 'Unknown'} {sender.last_name or ''}
-        *** EaziPurse ***
-        """
-        from_email = settings.EMAIL_HOST_USER
-        receiver_email = receiver.email
+    data = BulkTransferSerializer(data=request.data)
+    data.is_valid(raise_exception=True)
+    payments = [(line['account_number'], line['amount']) for line in data.validated_data['transfers']]
 
-        send_mail(subject, message, from_email, recipient_list=[receiver_email])
+    sender = request.user
+    try:
+        with transaction.atomic():
+            result = bulk_transfer_funds(sender, payments)
+            succeeded = result.succeeded
+            if succeeded:
+                # Queued with the transfers; the dispatcher sends them after commit.
+                from_email = settings.EMAIL_HOST_USER
+                subject = "EaziPurse Transaction Alert"
+                messages = [(subject, mailer.render('email/alerts/transfer_received.txt', {
+                    'reference': line.reference, 'amount': line.amount, 'sender': sender,
+                }), from_email, [line.recipient_email]) for line in succeeded]
+                messages.append((subject, mailer.render('email/alerts/bulk_transfer_sent.txt', {
+                    'total': result.total, 'count': len(succeeded),
+                }), from_email, [sender.email]))
+                outbox.enqueue_many(messages)
+    except WalletNotFound as e:
+        return Response({"message": str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except LedgerError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    return Response({"message": f"Transfer to {recipient_account_number} was successful", "reference": f"{reference}"
-                                , "new balance": f'{sender_wallet.balance}' }, status=status.HTTP_200_OK)
+    return Response({
+        "message": f"{len(succeeded)} of {len(result.lines)} transfers were successful",
+        "total": f'{result.total}',
+        "new balance": f'{result.sender_balance}',
+        "transfers": [
+            {"line": line.line, "account_number": line.account_number, "amount": f'{line.amount}', "reference": line.reference}
+            for line in succeeded
+        ],
+        "failed": [
+            {"line": line.line, "account_number": line.account_number, "message": line.error}
+            for line in result.failed
+        ],
+    }, status=status.HTTP_200_OK if succeeded else status.HTTP_400_BAD_REQUEST)
 
 
 @permission_classes([IsAuthenticated])
@@ -370,29 +386,3 @@ def admin_transaction_history(request):
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-
-@permission_classes([IsAuthenticated])
-@api_view(['GET'])
-def generate_report(request):
-    """Generate and download platform report as PDF"""
-    # Check if user is admin
-    if not request.user.is_staff:
-        return Response(
-            {"message": "Admin access required"}, 
-            status=status.HTTP_403_FORBIDDEN
-        )
-    
-    try:
-        # Generate the PDF report
-        pdf_buffer = generate_platform_report()
-        
-        # Create HTTP response with PDF
-        response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="eazipurse_report_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-        
-        return response
-    except Exception as e:
-        return Response({"message": f"Failed to generate report: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-
@@ -0,0 +1,160 @@
+"""
+Paystack webhook ingestion.
+
+Paystack signs each webhook with an HMAC-SHA512 of the raw body keyed by our
+secret key (``X-Paystack-Signature``). The endpoint checks the signature,
+stores ``charge.success`` events as ``GatewayEvent`` rows (deduplicated on
+the payment reference) and answers 200 without touching any wallet.
+``apply_pending`` (run by ``manage.py apply_gateway_events``) then credits
+the deposits in batches through ``credit_deposit``, which is safe alongside
+the browser's ``fund/verify`` call for the same reference: whichever comes
+first credits the wallet and the other is a no-op.
+
+An unexpected error while crediting (a dropped connection, a deadlock) is
+taken to be transient: the event stays pending and is retried with
+exponential backoff, up to ``GATEWAY_EVENT_MAX_ATTEMPTS`` times. Failed
+events can be put back in the queue with ``apply_gateway_events --requeue``.
+"""
+import hashlib
+import hmac
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .deposits import credit_deposit
+from .ledger import WalletNotFound
+from .models import GatewayEvent, Transaction
+from .money import Money
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Paystack-Signature'
+CHARGE_SUCCESS = 'charge.success'
+
+
+def sign(body, secret_key=None):
+    secret_key = secret_key or settings.PAYSTACK_SECRET_KEY or ''
+    return hmac.new(secret_key.encode(), body, hashlib.sha512).hexdigest()
+
+
+def valid_signature(body, signature):
+    if not settings.PAYSTACK_SECRET_KEY or not signature:
+        return False
+    return hmac.compare_digest(sign(body), signature)
+
+
+def record_event(payload, raw_body):
+    """
+    Store a verified webhook payload. Returns the new ``GatewayEvent``, or
+    ``None`` for events we don't act on and for references already stored.
+    """
+    data = payload.get('data') or {}
+    if payload.get('event') != CHARGE_SUCCESS or data.get('status') != 'success':
+        return None
+    try:
+        with transaction.atomic():
+            return GatewayEvent.objects.create(
+                reference=data['reference'],
+                event=payload['event'],
+                amount=Money(int(data['amount'])),
+                payload=raw_body.decode(),
+            )
+    except IntegrityError:
+        return None
+
+
+def _max_attempts():
+    return getattr(settings, 'GATEWAY_EVENT_MAX_ATTEMPTS', 5)
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=getattr(settings, 'GATEWAY_EVENT_RETRY_SECONDS', 30) * 2 ** (attempts - 1))
+
+
+def _finish(event, status, error=''):
+    GatewayEvent.objects.filter(pk=event.pk).update(status=status, error=error, processed_at=timezone.now())
+
+
+def _retry_later(event, error):
+    """Back off after an unexpected error; returns the event's new status."""
+    attempts = event.attempts + 1
+    if attempts >= _max_attempts():
+        GatewayEvent.objects.filter(pk=event.pk).update(
+            status=GatewayEvent.FAILED, error=error, attempts=attempts, processed_at=timezone.now(),
+        )
+        return GatewayEvent.FAILED
+    GatewayEvent.objects.filter(pk=event.pk).update(
+        error=error, attempts=attempts, next_attempt_at=timezone.now() + _retry_delay(attempts),
+    )
+    return GatewayEvent.PENDING
+
+
+def apply_event(event, deposit):
+    """Credit one stored event's deposit; returns the status it was given."""
+    if deposit is None or deposit.transaction_type != 'D':
+        _finish(event, GatewayEvent.IGNORED, 'No deposit with this reference')
+        return GatewayEvent.IGNORED
+    try:
+        settled = credit_deposit(deposit, event.amount)
+    except WalletNotFound as e:
+        _finish(event, GatewayEvent.FAILED, str(e))
+        return GatewayEvent.FAILED
+    _finish(event, GatewayEvent.APPLIED, '' if settled else 'Already verified')
+    return GatewayEvent.APPLIED
+
+
+def apply_pending(batch_size=200):
+    """
+    Apply one batch of pending events. Returns ``{status: count}``.
+
+    Each event is settled in its own transaction so one bad event can't hold
+    back the rest of the batch; events that hit an unexpected error are
+    counted as pending and retried once their backoff has passed. Running
+    several workers is safe: a deposit is only ever credited once.
+    """
+    due = Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now())
+    events = list(GatewayEvent.objects.filter(due, status=GatewayEvent.PENDING).order_by('pk')[:batch_size])
+    deposits = Transaction.objects.select_related('sender').in_bulk(
+        [event.reference for event in events], field_name='reference'
+    )
+    counts = {}
+    for event in events:
+        try:
+            outcome = apply_event(event, deposits.get(event.reference))
+        except Exception as e:
+            logger.exception(f"Could not apply gateway event {event.reference}")
+            outcome = _retry_later(event, str(e) or e.__class__.__name__)
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
+
+
+def requeue():
+    """Put failed events back in the queue with a fresh set of attempts. Returns how many."""
+    return GatewayEvent.objects.filter(status=GatewayEvent.FAILED).update(
+        status=GatewayEvent.PENDING, attempts=0, next_attempt_at=None, processed_at=None,
+    )
+
+
+def drain(batch_size=200):
+    """Apply batches until nothing is pending. Returns ``{status: count}`` totals."""
+    totals = {}
+    while True:
+        counts = apply_pending(batch_size)
+        if not counts:
+            return totals
+        for outcome, count in counts.items():
+            totals[outcome] = totals.get(outcome, 0) + count
+
+
+def parse(raw_body):
+    """Decode a webhook body; returns ``None`` if it isn't a JSON object."""
+    try:
+        payload = json.loads(raw_body)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
@@ -13,6 +13,7 @@ import {
 } from '@heroicons/react/24/outline';
 import { useGetAdminDashboardQuery } from '../../store/apiSlice';
 import toast from 'react-hot-toast';
+import { downloadReport } from '../../utils/reportJobs';
 
 const AdminDashboard = () => {
   const navigate = useNavigate();
@@ -374,47 +375,20 @@ const AdminDashboard = () => {
             whileHover={{ scale: 1.02 }}
             whileTap={{ scale: 0.98 }}
             onClick={async () => {
+              const progress = toast.loading('Queuing report...');
               try {
                 setIsGeneratingReport(true);
-                
-                // Get the auth token
-                const token = localStorage.getItem('access_token');
-                if (!token) {
-                  throw new Error('No authentication token found');
-                }
-                
-                const response = await fetch(`${import.meta.env.VITE_API_BASE_URL}/wallet/admin/report/`, {
-                  method: 'GET',
-                  headers: {
-                    'Authorization': `Bearer ${token}`,
+                await downloadReport({
+                  onStatus: (status) => {
+                    if (status === 'running') {
+                      toast.loading('Generating report...', { id: progress });
+                    }
                   },
                 });
-
-                if (!response.ok) {
-                  const errorData = await response.json().catch(() => ({}));
-                  throw new Error(errorData.message || 'Failed to generate report');
-                }
-
-                const blob = await response.blob();
-                
-                // Create download link
-                const url = window.URL.createObjectURL(blob);
-                const link = document.createElement('a');
-                link.href = url;
-                link.download = `eazipurse_report_${new Date().toISOString().slice(0, 10)}.pdf`;
-                
-                // Trigger download
-                document.body.appendChild(link);
-                link.click();
-                document.body.removeChild(link);
-                
-                // Clean up
-                window.URL.revokeObjectURL(url);
-                
-                toast.success('Report generated successfully!');
+                toast.success('Report generated successfully!', { id: progress });
               } catch (error) {
                 console.error('Failed to generate report:', error);
-                toast.error(error.message || 'Failed to generate report. Please try again.');
+                toast.error(error.message || 'Failed to generate report. Please try again.', { id: progress });
               } finally {
                 setIsGeneratingReport(false);
               }
@@ -10,6 +10,7 @@ import {
 } from '@heroicons/react/24/outline';
 import { useGetAdminAnalyticsQuery } from '../../store/apiSlice';
 import toast from 'react-hot-toast';
+import { downloadReport } from '../../utils/reportJobs';
 
 const Reports = () => {
   const { data: analyticsData, isLoading, error } = useGetAdminAnalyticsQuery();
@@ -48,53 +49,22 @@ const Reports = () => {
   };
 
   const generateReport = async (reportType) => {
+    const progress = toast.loading(`Queuing ${reportType}...`);
     try {
       setIsDownloading(true);
-      
-      // Get the auth token
-      const token = localStorage.getItem('access_token');
-      if (!token) {
-        throw new Error('No authentication token found');
-      }
-      
-      // Make the request directly without going through Redux
-      const response = await fetch(`${import.meta.env.VITE_API_BASE_URL}/user/admin/reports/download/`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`,
+      await downloadReport({
+        reportType,
+        dateRange,
+        onStatus: (status) => {
+          if (status === 'running') {
+            toast.loading(`Generating ${reportType}...`, { id: progress });
+          }
         },
-        body: JSON.stringify({
-          report_type: reportType,
-          date_range: dateRange,
-        }),
       });
-
-      if (!response.ok) {
-        const errorData = await response.json().catch(() => ({}));
-        throw new Error(errorData.message || 'Failed to generate report');
-      }
-
-      const blob = await response.blob();
-      
-      // Create download link
-      const url = window.URL.createObjectURL(blob);
-      const link = document.createElement('a');
-      link.href = url;
-      link.download = `${reportType.replace(/ /g, '_')}_${dateRange}_${new Date().toISOString().slice(0, 10)}.pdf`;
-      
-      // Trigger download
-      document.body.appendChild(link);
-      link.click();
-      document.body.removeChild(link);
-      
-      // Clean up
-      window.URL.revokeObjectURL(url);
-      
-      toast.success(`${reportType} downloaded successfully!`);
+      toast.success(`${reportType} downloaded successfully!`, { id: progress });
     } catch (error) {
       console.error('Failed to download report:', error);
-      toast.error(error.message || 'Failed to download report. Please try again.');
+      toast.error(error.message || 'Failed to download report. Please try again.', { id: progress });
     } finally {
       setIsDownloading(false);
     }
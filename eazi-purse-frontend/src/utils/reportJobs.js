@@ -0,0 +1,85 @@
+// Admin PDF reports are rendered by a background worker: we queue a job,
+// poll it until the worker is done, then download the stored file.
+
+const POLL_INTERVAL_MS = 2000;
+const POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
+const authHeaders = () => {
+  const token = localStorage.getItem('access_token');
+  if (!token) {
+    throw new Error('No authentication token found');
+  }
+  return { 'Authorization': `Bearer ${token}` };
+};
+
+const readError = async (response, fallback) => {
+  const errorData = await response.json().catch(() => ({}));
+  const fieldError = Object.values(errorData).find(Array.isArray);
+  return new Error(errorData.message || errorData.detail || fieldError?.[0] || fallback);
+};
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Queue a report and resolve once it has been downloaded.
+// `onStatus` is called with the job's status as it changes.
+export const downloadReport = async ({ reportType, dateRange = 'month', onStatus } = {}) => {
+  const base = `${import.meta.env.VITE_API_BASE_URL}/user/admin/reports/`;
+
+  const created = await fetch(base, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', ...authHeaders() },
+    body: JSON.stringify({
+      ...(reportType ? { report_type: reportType } : {}),
+      date_range: dateRange,
+    }),
+  });
+  if (!created.ok) {
+    throw await readError(created, 'Failed to request report');
+  }
+  let job = await created.json();
+  onStatus?.(job.status);
+
+  const deadline = Date.now() + POLL_TIMEOUT_MS;
+  while (job.status === 'queued' || job.status === 'running') {
+    if (Date.now() > deadline) {
+      throw new Error('The report is taking too long. Please try again later.');
+    }
+    await sleep(POLL_INTERVAL_MS);
+    const polled = await fetch(`${base}${job.id}/`, { headers: authHeaders() });
+    if (!polled.ok) {
+      throw await readError(polled, 'Failed to check report status');
+    }
+    const previous = job.status;
+    job = await polled.json();
+    if (job.status !== previous) {
+      onStatus?.(job.status);
+    }
+  }
+
+  if (job.status !== 'done') {
+    throw new Error(job.error || 'Failed to generate report');
+  }
+
+  // Built from the API base rather than job.download_url, which the backend
+  // may not know the public prefix of.
+  const response = await fetch(`${base}${job.id}/download/`, { headers: authHeaders() });
+  if (!response.ok) {
+    throw await readError(response, 'Failed to download report');
+  }
+  const blob = await response.blob();
+
+  // Create download link
+  const url = window.URL.createObjectURL(blob);
+  const link = document.createElement('a');
+  link.href = url;
+  link.download = job.filename;
+
+  // Trigger download
+  document.body.appendChild(link);
+  link.click();
+  document.body.removeChild(link);
+
+  // Clean up
+  window.URL.revokeObjectURL(url);
+  return job;
+};